@@ -3,6 +3,7 @@ from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.schemas import Agent, CreateAgentRequest, AgentConfig
 from app.services.agent import agent_service
+from app.services.node_cache import node_output_cache
 from app.database import get_db
 
 router = APIRouter()
@@ -54,7 +55,11 @@ async def update_agent(agent_id: str, config: AgentConfig, db: AsyncSession = De
         agent = await agent_service.update_agent(db, agent_id, config)
         if not agent:
             raise HTTPException(status_code=404, detail="Agent not found")
+        # Закешированные выводы узлов конвейеров получены старой конфигурацией
+        node_output_cache.invalidate_agent(agent_id)
         return agent
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -71,4 +76,5 @@ async def delete_agent(agent_id: str, db: AsyncSession = Depends(get_db)):
     if not success:
         raise HTTPException(status_code=404, detail="Agent not found or is predefined")
     
+    node_output_cache.invalidate_agent(agent_id)
     return {"message": "Agent deleted successfully"}
\ No newline at end of file
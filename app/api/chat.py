@@ -1,90 +1,275 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, List, Optional
+import asyncio
+import contextlib
+import json
+import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.schemas import (
-    ChatRequest, 
-    ChatResponse, 
-    MessageRole, 
-    ChatMessage
+    BatchChatRequest,
+    BatchChatResponse,
+    ChatRequest,
+    ChatResponse,
+    ChatMessage,
+    ChatSweepRequest,
+    ChatSweepResponse,
+    MessageRole,
 )
-from app.services.openrouter import openrouter_service
-from app.services.agent import agent_service
-from app.services.response_format import response_format_service
+from app.services.chat import chat_service, AgentNotFoundError
+from app.services.resilience import UpstreamError
+from app.api.errors import upstream_http_exception
+from app.api.disconnect import cancel_on_disconnect, record_cancelled
 from app.database import get_db
+from app.config import settings
 
 router = APIRouter()
 
 
+def _sse_event(event: str, data: Any) -> str:
+    """Форматирует событие Server-Sent Events"""
+    payload = json.dumps(jsonable_encoder(data), ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def _batch_concurrency(size: int, requested: Optional[int]) -> int:
+    """Проверяет размер пакета и возвращает допустимый параллелизм"""
+    if not size:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if size > settings.BATCH.MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch size exceeds {settings.BATCH.MAX_ITEMS} requests")
+    return max(1, min(requested or settings.BATCH.MAX_CONCURRENCY, settings.BATCH.MAX_CONCURRENCY))
+
+
+def _ndjson_response(items: AsyncIterator[Any], endpoint: str) -> StreamingResponse:
+    """Стримит элементы по мере готовности, по JSON объекту на строку"""
+    async def ndjson_stream() -> AsyncIterator[str]:
+        try:
+            async with contextlib.aclosing(items):
+                async for item in items:
+                    yield json.dumps(jsonable_encoder(item), ensure_ascii=False) + "\n"
+        except asyncio.CancelledError:
+            record_cancelled(endpoint)
+            raise
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def chat(request: ChatRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
     """
     Отправляет сообщение AI агенту
+
+    Если клиент отключится до ответа, запрос к модели отменяется (статус 499)
     """
     print("Received chat request:", request)
     try:
-        # Получаем агента
-        agent_id = request.agent_id or "default"
-        agent = await agent_service.get_agent(db, agent_id)
-        
-        if not agent:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        # Проверяем, является ли агент оркестратором субагентов
-        if agent_service.is_orchestrator_agent(agent):
-            # Используем оркестрацию субагентов
-            result = await agent_service.orchestrate_subagents(
-                db=db,
-                user_message=request.message,
-                conversation_history=request.conversation_history
-            )
-            
-            return ChatResponse(
-                message=result["message"],
-                model=result["model"],
-                agent_id=agent_id,
-                usage=result.get("usage"),
-                parsed_data=None,  # Оркестратор возвращает уже обработанные данные
-                format_valid=True,
-                response_format=None,
-                orchestration_steps=result.get("orchestration_steps")
-            )
-        else:
-            # Стандартная обработка для обычных агентов
-            # Подготавливаем сообщения
-            messages = agent_service.prepare_messages_for_agent(
-                agent=agent,
-                user_message=request.message,
-                conversation_history=request.conversation_history
-            )
-            
-            # Параметры для модели
-            model = request.model or agent.model
-            temperature = request.temperature if request.temperature is not None else agent.temperature
-            max_tokens = request.max_tokens or agent.max_tokens
-            
-            # Отправляем запрос к OpenRouter
-            result = await openrouter_service.chat_completion(
-                messages=messages,
-                model=model,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            
-            # Парсим ответ согласно формату агента
-            parsed_data, format_valid = response_format_service.parse_response(
-                result["message"], 
-                agent.response_format
-            )
-            
-            return ChatResponse(
-                message=result["message"],
-                model=result["model"],
-                agent_id=agent_id,
-                usage=result.get("usage"),
-                parsed_data=parsed_data if agent.response_format else None,
-                format_valid=format_valid if agent.response_format else None,
-                response_format=agent.response_format
-            )
-        
+        return await cancel_on_disconnect(http_request, chat_service.complete(db, request), "chat")
+    except HTTPException:
+        raise
+    except AgentNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UpstreamError as e:
+        raise upstream_http_exception(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Отправляет сообщение AI агенту и стримит ответ через Server-Sent Events
+
+    События:
+    - token: {"content": "..."} - очередной фрагмент ответа
+    - step_started: {"step": N, "node": ..., "agent": ...} - узел оркестрации запущен
+    - step_token: {"step": N, "node": ..., "content": "..."} - фрагмент ответа узла
+    - orchestration_step: {"step": {...}} - узел завершен: вывод, usage, модель, время
+    - done: ChatResponse с usage, finish_reason и результатом parse_response
+    - error: {"detail": "..."} - ошибка во время генерации
+    """
+    print("Received chat stream request:", request)
+    # Агента проверяем до начала стрима, чтобы вернуть обычный 404
+    try:
+        await chat_service.get_agent(db, request.agent_id)
+    except AgentNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            async with contextlib.aclosing(chat_service.stream(db, request)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        yield _sse_event("done", event["response"])
+                    else:
+                        data = {k: v for k, v in event.items() if k != "type"}
+                        yield _sse_event(event["type"], data)
+        except asyncio.CancelledError:
+            # Клиент отключился: генерация и запрос к модели прерваны вместе со стримом
+            record_cancelled("chat_stream")
+            raise
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Отключаем буферизацию в nginx
+        }
+    )
+
+
+@router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(batch: BatchChatRequest, http_request: Request):
+    """
+    Обрабатывает пакет запросов к чату с ограничением параллелизма
+
+    Каждый запрос проходит обычный конвейер агента и формата ответа; ошибка
+    отдельного запроса возвращается в его элементе (error, status_code).
+    - stream=false: {"results": [...]} в порядке запросов
+    - stream=true: NDJSON, по строке на запрос по мере готовности (с полем index)
+    """
+    concurrency = _batch_concurrency(len(batch.requests), batch.concurrency)
+    print(f"Received chat batch: {len(batch.requests)} requests, concurrency {concurrency}")
+
+    if batch.stream:
+        return _ndjson_response(chat_service.complete_batch(batch.requests, concurrency), "chat_batch")
+
+    async def collect() -> BatchChatResponse:
+        results = [None] * len(batch.requests)
+        async with contextlib.aclosing(chat_service.complete_batch(batch.requests, concurrency)) as items:
+            async for item in items:
+                results[item.index] = item
+        return BatchChatResponse(results=results)
+
+    return await cancel_on_disconnect(http_request, collect(), "chat_batch")
+
+
+@router.post("/chat/sweep", response_model=ChatSweepResponse)
+async def chat_sweep(sweep: ChatSweepRequest, http_request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Выполняет одно сообщение параллельно с разными параметрами (model, temperature, max_tokens)
+
+    Сравнение занимает время самого медленного варианта, а не сумму.
+    - stream=true (по умолчанию): NDJSON, по строке на вариант по мере готовности
+      (index - номер варианта, variant, response или error)
+    - stream=false: {"results": [...]} в порядке вариантов
+    """
+    concurrency = _batch_concurrency(len(sweep.variants), sweep.concurrency)
+    print(f"Received chat sweep: {len(sweep.variants)} variants, concurrency {concurrency}")
+    try:
+        await chat_service.get_agent(db, sweep.agent_id)
+    except AgentNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if sweep.stream:
+        return _ndjson_response(chat_service.complete_sweep(db, sweep, concurrency), "chat_sweep")
+
+    async def collect() -> ChatSweepResponse:
+        results = [None] * len(sweep.variants)
+        async with contextlib.aclosing(chat_service.complete_sweep(db, sweep, concurrency)) as items:
+            async for item in items:
+                results[item.index] = item
+        return ChatSweepResponse(results=results)
+
+    return await cancel_on_disconnect(http_request, collect(), "chat_sweep")
+
+
+@router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket, db: AsyncSession = Depends(get_db)):
+    """
+    WebSocket канал для многоходового диалога в рамках одного соединения
+
+    История диалога хранится на стороне сервера, поэтому клиент отправляет
+    только новое сообщение.
+
+    Сообщения клиента:
+    - {"type": "message", "message": "...", "agent_id": ..., "model": ...,
+       "temperature": ..., "max_tokens": ...} - новый ход диалога
+    - {"type": "cancel"} - отменить текущую генерацию
+    - {"type": "reset"} - очистить историю диалога
+
+    События сервера:
+    - session: {"session_id": "..."} - сразу после подключения
+    - token / step_started / step_token / orchestration_step - см. /chat/stream
+    - done: {"response": ChatResponse}
+    - cancelled, error: {"detail": "..."}
+    """
+    await websocket.accept()
+    session_id = str(uuid.uuid4())
+    history: List[ChatMessage] = []
+    generation: Optional[asyncio.Task] = None
+
+    async def send_event(event_type: str, **data):
+        await websocket.send_json(jsonable_encoder({"type": event_type, **data}))
+
+    async def run_turn(request: ChatRequest):
+        try:
+            # aclosing: при отмене генератор (и поток OpenRouter) закрывается сразу
+            async with contextlib.aclosing(chat_service.stream(db, request)) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        response = event["response"]
+                        # Сохраняем ход в истории сессии только после успешной генерации
+                        history.append(ChatMessage(role=MessageRole.USER, content=request.message))
+                        history.append(ChatMessage(role=MessageRole.ASSISTANT, content=response.message))
+                        await send_event("done", response=response)
+                    else:
+                        await send_event(event["type"], **{k: v for k, v in event.items() if k != "type"})
+        except asyncio.CancelledError:
+            # При разрыве соединения сообщить об отмене уже некому
+            with contextlib.suppress(Exception):
+                await send_event("cancelled")
+            raise
+        except Exception as e:
+            await send_event("error", detail=str(e))
+
+    await send_event("session", session_id=session_id)
+    try:
+        while True:
+            data = await websocket.receive_json()
+            message_type = data.get("type", "message")
+
+            if message_type == "cancel":
+                if generation and not generation.done():
+                    generation.cancel()
+                continue
+
+            if message_type == "reset":
+                history.clear()
+                continue
+
+            if message_type != "message":
+                await send_event("error", detail=f"Unknown message type: {message_type}")
+                continue
+
+            if generation and not generation.done():
+                await send_event("error", detail="Generation is already in progress")
+                continue
+
+            try:
+                request = ChatRequest(**{k: v for k, v in data.items() if k != "type"})
+            except Exception as e:
+                await send_event("error", detail=str(e))
+                continue
+
+            # Клиент может один раз передать историю для продолжения существующего диалога
+            if request.conversation_history and not history:
+                history.extend(request.conversation_history)
+            request.conversation_history = list(history)
+
+            generation = asyncio.create_task(run_turn(request))
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if generation and not generation.done():
+            generation.cancel()
+            record_cancelled("chat_ws")
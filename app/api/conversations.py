@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.schemas import Conversation, UpdateMessageRequest
+from app.database import get_db, ConversationRepository
+
+router = APIRouter()
+
+
+@router.get("/conversations/{conversation_id}", response_model=Conversation)
+async def get_conversation(conversation_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Возвращает диалог, хранящийся на сервере, со всеми сообщениями
+    """
+    conversation = await ConversationRepository(db).get_conversation(conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+
+@router.put("/conversations/{conversation_id}/messages/{position}")
+async def update_message(
+    conversation_id: str,
+    position: int,
+    request: UpdateMessageRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Изменяет сообщение диалога (сводка, включающая его, сбрасывается)
+    """
+    success = await ConversationRepository(db).update_message(conversation_id, position, request.content)
+    if not success:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    return {"message": "Message updated successfully"}
+
+
+@router.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Удаляет диалог вместе с сообщениями
+    """
+    success = await ConversationRepository(db).delete_conversation(conversation_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    return {"message": "Conversation deleted successfully"}
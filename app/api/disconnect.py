@@ -0,0 +1,43 @@
+from typing import Awaitable, TypeVar
+import asyncio
+import contextlib
+from fastapi import HTTPException, Request
+from app.config import settings
+from app.services.metrics import metrics
+
+T = TypeVar("T")
+
+# Статус "client closed request" (nginx): ответ все равно никто не получит
+CLIENT_CLOSED_REQUEST = 499
+
+
+def record_cancelled(endpoint: str):
+    """Учитывает запрос, отмененный из-за отключения клиента"""
+    metrics.increment("cancelled_requests")
+    metrics.increment(f"cancelled_requests.{endpoint}")
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], endpoint: str) -> T:
+    """
+    Выполняет обработку запроса, пока клиент подключен
+
+    Если клиент отключился раньше, чем готов ответ, обработка отменяется
+    (вместе с запросом к модели и оставшимися шагами оркестрации)
+    и выбрасывается HTTPException 499.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.CHAT.DISCONNECT_CHECK_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await task
+                record_cancelled(endpoint)
+                print(f"Клиент отключился, запрос {endpoint} отменен")
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
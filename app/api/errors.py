@@ -0,0 +1,11 @@
+import math
+from fastapi import HTTPException
+from app.services.resilience import UpstreamError
+
+
+def upstream_http_exception(error: UpstreamError) -> HTTPException:
+    """Преобразует ошибку OpenRouter в HTTP ответ (429/502/503 с Retry-After)"""
+    headers = None
+    if error.retry_after is not None:
+        headers = {"Retry-After": str(math.ceil(error.retry_after))}
+    return HTTPException(status_code=error.http_status, detail=str(error), headers=headers)
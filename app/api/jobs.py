@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.config import settings
+from app.models.schemas import ChatJob, ChatRequest
+from app.services.jobs import job_manager, JobQueueFullError
+
+router = APIRouter()
+
+
+@router.post("/chat/jobs", response_model=ChatJob, status_code=202)
+async def create_chat_job(request: ChatRequest):
+    """
+    Ставит запрос к чату в очередь фоновых задач и сразу возвращает id задачи
+
+    Результат доступен через GET /chat/jobs/{job_id} (с wait - long-poll).
+    """
+    print("Received chat job request:", request)
+    try:
+        job = job_manager.submit(request)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return job.to_schema()
+
+
+@router.get("/chat/jobs/{job_id}", response_model=ChatJob)
+async def get_chat_job(job_id: str, wait: float = Query(0, ge=0, description="Ждать завершения до N секунд")):
+    """
+    Возвращает состояние задачи и, после завершения, ChatResponse или ошибку
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    await job_manager.wait(job, min(wait, settings.JOBS.MAX_WAIT))
+    return job.to_schema()
+
+
+@router.delete("/chat/jobs/{job_id}", response_model=ChatJob)
+async def cancel_chat_job(job_id: str):
+    """
+    Отменяет задачу, если она еще не завершилась
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job_manager.cancel(job)
+    return job.to_schema()
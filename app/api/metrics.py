@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from app.services.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Возвращает счетчики и состояние внутренних сервисов (кеши, лимиты и т.д.)
+    """
+    return metrics.snapshot()
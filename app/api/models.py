@@ -1,18 +1,63 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import List, Optional
+import hashlib
 from app.models.schemas import ModelInfo
-from app.services.openrouter import openrouter_service
+from app.services.model_catalog import model_catalog
+from app.services.resilience import UpstreamError
+from app.api.errors import upstream_http_exception
 
 router = APIRouter()
 
 
+def _filter_models(
+    models: List[ModelInfo],
+    provider: Optional[str],
+    search: Optional[str],
+    min_context_length: Optional[int]
+) -> List[ModelInfo]:
+    """Фильтрует каталог по провайдеру, подстроке и размеру контекста"""
+    if provider:
+        prefix = f"{provider.lower()}/"
+        models = [m for m in models if m.id.lower().startswith(prefix)]
+    if search:
+        needle = search.lower()
+        models = [m for m in models if needle in m.id.lower() or needle in (m.name or "").lower()]
+    if min_context_length:
+        models = [m for m in models if (m.context_length or 0) >= min_context_length]
+    return models
+
+
 @router.get("/models", response_model=List[ModelInfo])
-async def get_models():
+async def get_models(
+    request: Request,
+    response: Response,
+    provider: Optional[str] = Query(None, description="Провайдер (префикс id модели), например openai"),
+    search: Optional[str] = Query(None, description="Подстрока в id или названии модели"),
+    min_context_length: Optional[int] = Query(None, ge=0, description="Минимальный размер контекста"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
     """
     Получает список доступных моделей из OpenRouter
+
+    Каталог кешируется на сервере; поддерживаются ETag/If-None-Match,
+    общее число моделей после фильтрации возвращается в X-Total-Count.
     """
     try:
-        models = await openrouter_service.get_models()
-        return models
+        models, catalog_etag = await model_catalog.get_models()
+    except UpstreamError as e:
+        raise upstream_http_exception(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # ETag зависит и от версии каталога, и от параметров запроса
+    query = str(sorted(request.query_params.multi_items()))
+    etag = '"' + hashlib.sha256(f"{catalog_etag}:{query}".encode("utf-8")).hexdigest()[:32] + '"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    models = _filter_models(models, provider, search, min_context_length)
+    response.headers["ETag"] = etag
+    response.headers["X-Total-Count"] = str(len(models))
+    end = offset + limit if limit else None
+    return models[offset:end]
@@ -36,8 +36,72 @@ validators = [
     Validator("SITE_URL", default=""),
     Validator("SITE_NAME", default=""),
     Validator("OPENROUTER.BASE_URL", default="https://openrouter.ai/api/v1"),
+    Validator("OPENROUTER.MAX_CONNECTIONS", default=100, is_type_of=int),
+    Validator("OPENROUTER.MAX_KEEPALIVE_CONNECTIONS", default=20, is_type_of=int),
+    Validator("OPENROUTER.KEEPALIVE_EXPIRY", default=30.0),
+    Validator("OPENROUTER.CONNECT_TIMEOUT", default=10.0),
+    Validator("OPENROUTER.READ_TIMEOUT", default=120.0),
+    Validator("OPENROUTER.WRITE_TIMEOUT", default=30.0),
+    Validator("OPENROUTER.POOL_TIMEOUT", default=30.0),
+    Validator("OPENROUTER.COALESCE_REQUESTS", default=True, is_type_of=bool),
+    Validator("OPENROUTER.RETRY.MAX_ATTEMPTS", default=3, is_type_of=int),
+    Validator("OPENROUTER.RETRY.BASE_DELAY", default=0.5),
+    Validator("OPENROUTER.RETRY.MAX_DELAY", default=8.0),
+    Validator("OPENROUTER.RETRY.MAX_RETRY_AFTER", default=30.0),
+    Validator("OPENROUTER.RETRY.BUDGET_RATIO", default=0.2),
+    Validator("OPENROUTER.RETRY.BUDGET_MAX_TOKENS", default=20),
+    Validator("OPENROUTER.CIRCUIT_BREAKER.FAILURE_THRESHOLD", default=5, is_type_of=int),
+    Validator("OPENROUTER.CIRCUIT_BREAKER.RESET_TIMEOUT", default=30.0),
+    Validator("OPENROUTER.PROMPT_CACHE.ENABLED", default=True, is_type_of=bool),
+    Validator("OPENROUTER.PROMPT_CACHE.CACHE_CONTROL_MODELS", default=[], is_type_of=list),
+    Validator("OPENROUTER.PROMPT_CACHE.MIN_TOKENS", default=1024, is_type_of=int),
+    Validator("RATE_LIMITS.ENABLED", default=True, is_type_of=bool),
+    Validator("RATE_LIMITS.MAX_QUEUE", default=50, is_type_of=int),
+    Validator("RATE_LIMITS.MAX_WAIT", default=30.0),
+    Validator("RATE_LIMITS.DEFAULT_REQUESTS_PER_MINUTE", default=0),
+    Validator("RATE_LIMITS.DEFAULT_TOKENS_PER_MINUTE", default=0),
+    Validator("RATE_LIMITS.MODELS", default=[], is_type_of=list),
+    Validator("MODEL_CATALOG.TTL_SECONDS", default=600),
+    Validator("MODEL_CATALOG.BACKGROUND_REFRESH", default=True, is_type_of=bool),
+    Validator("EVENT_LOOP_MONITOR.ENABLED", default=True, is_type_of=bool),
+    Validator("EVENT_LOOP_MONITOR.INTERVAL", default=0.1),
+    Validator("EVENT_LOOP_MONITOR.WINDOW", default=600, is_type_of=int),
+    Validator("CHAT.DISCONNECT_CHECK_INTERVAL", default=0.5),
+    Validator("PIPELINES.NODE_TIMEOUT", default=120.0),
+    Validator("PIPELINES.CACHE_ENABLED", default=True, is_type_of=bool),
+    Validator("PIPELINES.CACHE_MAX_BYTES", default=8 * 1024 * 1024, is_type_of=int),
+    Validator("PIPELINES.CACHE_TTL_SECONDS", default=3600),
+    Validator("BATCH.MAX_ITEMS", default=100, is_type_of=int),
+    Validator("BATCH.MAX_CONCURRENCY", default=8, is_type_of=int),
+    Validator("JOBS.WORKERS", default=4, is_type_of=int),
+    Validator("JOBS.MAX_QUEUE", default=1000, is_type_of=int),
+    Validator("JOBS.TTL_SECONDS", default=3600),
+    Validator("JOBS.CLEANUP_INTERVAL", default=60),
+    Validator("JOBS.MAX_WAIT", default=60),
+    Validator("RESPONSE_CACHE.ENABLED", default=True, is_type_of=bool),
+    Validator("RESPONSE_CACHE.MAX_BYTES", default=32 * 1024 * 1024, is_type_of=int),
+    Validator("RESPONSE_CACHE.TTL_SECONDS", default=3600),
     Validator("ASSISTANT.ALLOWED_MODELS", is_type_of=list, must_exist=True),
     Validator("ASSISTANT.DEFAULT_MODEL", is_type_of=str, must_exist=True),
+    Validator("ASSISTANT.FALLBACK_MODELS", default=[], is_type_of=list),
+    Validator("ASSISTANT.CONTEXT.ENABLED", default=True, is_type_of=bool),
+    Validator("ASSISTANT.CONTEXT.DEFAULT_CONTEXT_LENGTH", default=8192, is_type_of=int),
+    Validator("ASSISTANT.CONTEXT.SAFETY_MARGIN", default=0.05),
+    Validator("ASSISTANT.SUMMARY.ENABLED", default=True, is_type_of=bool),
+    Validator("ASSISTANT.SUMMARY.TRIGGER_TOKENS", default=3000, is_type_of=int),
+    Validator("ASSISTANT.SUMMARY.KEEP_RECENT_MESSAGES", default=6, is_type_of=int),
+    Validator("ASSISTANT.SUMMARY.MODEL", default="", is_type_of=str),
+    Validator("ASSISTANT.SUMMARY.MAX_TOKENS", default=600, is_type_of=int),
+    Validator("ASSISTANT.ENSEMBLE.MAX_SAMPLES", default=10, is_type_of=int),
+    Validator("ASSISTANT.ROUTING.ENABLED", default=False, is_type_of=bool),
+    Validator("ASSISTANT.ROUTING.POLICY", default="fastest", is_in=["fastest", "cheapest", "sticky"]),
+    Validator("ASSISTANT.ROUTING.EWMA_ALPHA", default=0.2),
+    Validator("ASSISTANT.ROUTING.STICKY_MAX_CONVERSATIONS", default=10000, is_type_of=int),
+    Validator("ASSISTANT.HEDGING.ENABLED", default=True, is_type_of=bool),
+    Validator("ASSISTANT.HEDGING.PERCENTILE", default=0.95),
+    Validator("ASSISTANT.HEDGING.MIN_SAMPLES", default=20, is_type_of=int),
+    Validator("ASSISTANT.HEDGING.DEFAULT_DELAY", default=15.0),
+    Validator("ASSISTANT.HEDGING.MIN_DELAY", default=1.0),
 ]
 
 if environment not in [Environments.TESTING, Environments.TESTING_INTEGRATION]:
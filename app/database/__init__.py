@@ -1,12 +1,16 @@
-from .database import init_db, close_db, get_db
-from .models import AgentDB, Base
-from .repository import AgentRepository
+from .database import init_db, close_db, get_db, AsyncSessionLocal
+from .models import AgentDB, ConversationDB, MessageDB, Base
+from .repository import AgentRepository, ConversationRepository
 
 __all__ = [
     "init_db",
     "close_db", 
     "get_db",
+    "AsyncSessionLocal",
     "AgentDB",
+    "ConversationDB",
+    "MessageDB",
     "Base",
-    "AgentRepository"
+    "AgentRepository",
+    "ConversationRepository"
 ]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, Text, DateTime, Boolean
+from sqlalchemy import Column, String, Float, Integer, Text, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -18,6 +18,10 @@ class AgentDB(Base):
     model = Column(String, nullable=False, default=settings.ASSISTANT.DEFAULT_MODEL)
     temperature = Column(Float, nullable=False, default=0.7)
     max_tokens = Column(Integer, nullable=False, default=1000)
+    cache_responses = Column(Boolean, nullable=True, default=False)
+    fallback_models = Column(Text, nullable=True)  # JSON список моделей
+    pipeline = Column(Text, nullable=True)  # JSON конвейера оркестрации
+    ensemble = Column(Text, nullable=True)  # JSON настроек self-consistency
     
     # Response format fields
     response_format_type = Column(String, nullable=True)  # plain_text, json, markdown, code_block
@@ -31,4 +35,39 @@ class AgentDB(Base):
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     def __repr__(self):
-        return f"<Agent(id='{self.id}', name='{self.name}')>"
\ No newline at end of file
+        return f"<Agent(id='{self.id}', name='{self.name}')>"
+
+
+class ConversationDB(Base):
+    """Диалог, история которого хранится на сервере"""
+    __tablename__ = "conversations"
+    
+    id = Column(String, primary_key=True, index=True)
+    agent_id = Column(String, nullable=True, index=True)
+    # Сжатое содержание первых summary_upto сообщений и хеш этих сообщений
+    summary = Column(Text, nullable=True)
+    summary_upto = Column(Integer, nullable=True)
+    summary_hash = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<Conversation(id='{self.id}', agent_id='{self.agent_id}')>"
+
+
+class MessageDB(Base):
+    """Сообщение диалога; position - порядковый номер внутри диалога"""
+    __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_position", "conversation_id", "position", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    
+    def __repr__(self):
+        return f"<Message(conversation_id='{self.conversation_id}', position={self.position})>"
@@ -1,12 +1,12 @@
 from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, func
 from sqlalchemy.exc import IntegrityError
 import json
 from datetime import datetime
 
-from app.database.models import AgentDB
-from app.models.schemas import Agent, AgentConfig, ResponseFormat, ResponseFormatType
+from app.database.models import AgentDB, ConversationDB, MessageDB
+from app.models.schemas import Agent, AgentConfig, ChatMessage, Conversation, EnsembleConfig, MessageRole, Pipeline, ResponseFormat, ResponseFormatType
 
 
 class AgentRepository:
@@ -58,6 +58,10 @@ class AgentRepository:
         agent_db.model = agent.model
         agent_db.temperature = agent.temperature
         agent_db.max_tokens = agent.max_tokens
+        agent_db.cache_responses = agent.cache_responses
+        agent_db.fallback_models = json.dumps(agent.fallback_models) if agent.fallback_models is not None else None
+        agent_db.pipeline = agent.pipeline.model_dump_json() if agent.pipeline else None
+        agent_db.ensemble = agent.ensemble.model_dump_json() if agent.ensemble else None
         
         # Обновляем response format
         if agent.response_format:
@@ -133,6 +137,10 @@ class AgentRepository:
             temperature=agent_db.temperature,
             max_tokens=agent_db.max_tokens,
             response_format=response_format,
+            cache_responses=bool(agent_db.cache_responses),
+            fallback_models=json.loads(agent_db.fallback_models) if agent_db.fallback_models else None,
+            pipeline=Pipeline.model_validate_json(agent_db.pipeline) if agent_db.pipeline else None,
+            ensemble=EnsembleConfig.model_validate_json(agent_db.ensemble) if agent_db.ensemble else None,
             created_at=agent_db.created_at.isoformat() if agent_db.created_at else datetime.utcnow().isoformat()
         )
     
@@ -145,7 +153,11 @@ class AgentRepository:
             system_prompt=agent.system_prompt,
             model=agent.model,
             temperature=agent.temperature,
-            max_tokens=agent.max_tokens
+            max_tokens=agent.max_tokens,
+            cache_responses=agent.cache_responses,
+            fallback_models=json.dumps(agent.fallback_models) if agent.fallback_models is not None else None,
+            pipeline=agent.pipeline.model_dump_json() if agent.pipeline else None,
+            ensemble=agent.ensemble.model_dump_json() if agent.ensemble else None
         )
         
         if agent.response_format:
@@ -154,4 +166,135 @@ class AgentRepository:
             agent_db.response_format_examples = json.dumps(agent.response_format.examples) if agent.response_format.examples else None
             agent_db.response_format_description = agent.response_format.description
         
-        return agent_db
\ No newline at end of file
+        return agent_db
+
+
+class ConversationRepository:
+    """Репозиторий для работы с диалогами и их сообщениями"""
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
+        """Получить диалог со всеми сообщениями"""
+        conversation_db = await self.db.get(ConversationDB, conversation_id)
+        if not conversation_db:
+            return None
+        messages = await self.get_messages(conversation_id)
+        return self._db_to_schema(conversation_db, messages)
+    
+    async def get_or_create_conversation(self, conversation_id: str, agent_id: Optional[str]) -> ConversationDB:
+        """Получить диалог или создать пустой с этим id"""
+        conversation_db = await self.db.get(ConversationDB, conversation_id)
+        if conversation_db:
+            return conversation_db
+        conversation_db = ConversationDB(id=conversation_id, agent_id=agent_id)
+        self.db.add(conversation_db)
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            # Диалог одновременно создал параллельный запрос
+            await self.db.rollback()
+            conversation_db = await self.db.get(ConversationDB, conversation_id)
+        return conversation_db
+    
+    async def get_messages(self, conversation_id: str) -> List[ChatMessage]:
+        """Сообщения диалога по порядку"""
+        result = await self.db.execute(
+            select(MessageDB.role, MessageDB.content)
+            .where(MessageDB.conversation_id == conversation_id)
+            .order_by(MessageDB.position)
+        )
+        return [ChatMessage(role=MessageRole(role), content=content) for role, content in result.all()]
+    
+    async def append_messages(self, conversation_id: str, messages: List[ChatMessage], attempts: int = 3):
+        """Дописать сообщения в конец диалога"""
+        for attempt in range(attempts):
+            result = await self.db.execute(
+                select(func.max(MessageDB.position)).where(MessageDB.conversation_id == conversation_id)
+            )
+            last_position = result.scalar()
+            start = 0 if last_position is None else last_position + 1
+            self.db.add_all([
+                MessageDB(
+                    conversation_id=conversation_id,
+                    position=start + offset,
+                    role=message.role.value,
+                    content=message.content
+                )
+                for offset, message in enumerate(messages)
+            ])
+            conversation_db = await self.db.get(ConversationDB, conversation_id)
+            if conversation_db:
+                conversation_db.updated_at = datetime.utcnow()
+            try:
+                await self.db.commit()
+                return
+            except IntegrityError:
+                # Параллельный запрос занял те же позиции - пересчитываем
+                await self.db.rollback()
+                if attempt == attempts - 1:
+                    raise
+    
+    async def update_message(self, conversation_id: str, position: int, content: str) -> bool:
+        """Изменить сообщение; сводка, включающая его, становится недействительной"""
+        result = await self.db.execute(
+            select(MessageDB).where(
+                MessageDB.conversation_id == conversation_id,
+                MessageDB.position == position
+            )
+        )
+        message_db = result.scalar_one_or_none()
+        if not message_db:
+            return False
+        
+        message_db.content = content
+        conversation_db = await self.db.get(ConversationDB, conversation_id)
+        if conversation_db and conversation_db.summary_upto is not None and position < conversation_db.summary_upto:
+            self._clear_summary(conversation_db)
+        await self.db.commit()
+        return True
+    
+    async def set_summary(self, conversation_id: str, summary: str, upto: int, summary_hash: str, based_on_hash: Optional[str]) -> bool:
+        """
+        Сохранить сводку первых upto сообщений
+
+        based_on_hash - хеш сводки, от которой строилась новая: если за время
+        сжатия сводку сбросили или заменили, новая не сохраняется.
+        """
+        conversation_db = await self.db.get(ConversationDB, conversation_id)
+        if not conversation_db or conversation_db.summary_hash != based_on_hash:
+            return False
+        conversation_db.summary = summary
+        conversation_db.summary_upto = upto
+        conversation_db.summary_hash = summary_hash
+        await self.db.commit()
+        return True
+    
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        """Удалить диалог вместе с сообщениями"""
+        conversation_db = await self.db.get(ConversationDB, conversation_id)
+        if not conversation_db:
+            return False
+        await self.db.execute(delete(MessageDB).where(MessageDB.conversation_id == conversation_id))
+        await self.db.delete(conversation_db)
+        await self.db.commit()
+        return True
+    
+    def _clear_summary(self, conversation_db: ConversationDB):
+        conversation_db.summary = None
+        conversation_db.summary_upto = None
+        conversation_db.summary_hash = None
+    
+    def _db_to_schema(self, conversation_db: ConversationDB, messages: List[ChatMessage]) -> Conversation:
+        """Конвертировать модель БД в Pydantic схему"""
+        return Conversation(
+            id=conversation_db.id,
+            agent_id=conversation_db.agent_id,
+            messages=messages,
+            summary=conversation_db.summary,
+            summary_upto=conversation_db.summary_upto,
+            summary_hash=conversation_db.summary_hash,
+            created_at=conversation_db.created_at.isoformat() if conversation_db.created_at else datetime.utcnow().isoformat(),
+            updated_at=conversation_db.updated_at.isoformat() if conversation_db.updated_at else datetime.utcnow().isoformat()
+        )
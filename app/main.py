@@ -2,9 +2,14 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.config import settings
-from app.api import chat, agents, models
+from app.api import chat, agents, models, metrics, conversations, jobs
 from app.database import init_db, close_db, get_db
 from app.services.agent import agent_service
+from app.services.openrouter import openrouter_service
+from app.services.model_catalog import model_catalog
+from app.services.loop_monitor import loop_monitor
+from app.services.conversation_summary import conversation_summarizer
+from app.services.jobs import job_manager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -17,10 +22,19 @@ async def lifespan(app: FastAPI):
         await agent_service.load_predefined_agents(db)
         break
     
+    await model_catalog.start()
+    await loop_monitor.start()
+    await job_manager.start()
+    
     yield
     
     # Shutdown
     print("Завершение приложения...")
+    await job_manager.stop()
+    await loop_monitor.stop()
+    await conversation_summarizer.stop()
+    await model_catalog.stop()
+    await openrouter_service.close()
     await close_db()
 
 
@@ -44,8 +58,11 @@ app.add_middleware(
 
 # Подключаем роутеры с версионированием API
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["jobs"])
 app.include_router(agents.router, prefix="/api/v1", tags=["agents"])
 app.include_router(models.router, prefix="/api/v1", tags=["models"])
+app.include_router(metrics.router, prefix="/api/v1", tags=["metrics"])
+app.include_router(conversations.router, prefix="/api/v1", tags=["conversations"])
 
 
 @app.get("/")
@@ -61,12 +78,15 @@ async def health_check():
 @app.get("/health")
 async def detailed_health():
     """Подробная информация о состоянии сервиса"""
+    circuit_breakers = openrouter_service.breakers.stats()
+    degraded = any(breaker["state"] != "closed" for breaker in circuit_breakers.values())
     return {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "service": "AI Agent Backend", 
         "version": "1.0.0",
         "openrouter_configured": bool(settings.OPEN_ROUTER_API_KEY),
-        "default_model": settings.ASSISTANT.DEFAULT_MODEL
+        "default_model": settings.ASSISTANT.DEFAULT_MODEL,
+        "circuit_breakers": circuit_breakers
     }
 
 
@@ -1,6 +1,10 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, model_validator
 from enum import Enum
+import re
+
+# Ссылка во входе узла конвейера: {{message}}, {{<node>}} или {{<node>.<field>}}
+PIPELINE_REFERENCE = re.compile(r"\{\{\s*([\w-]+)(?:\.([\w-]+))?\s*\}\}")
 
 
 class MessageRole(str, Enum):
@@ -41,6 +45,12 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
     conversation_history: Optional[List[ChatMessage]] = None
+    # Диалог, хранящийся на сервере: история загружается из БД, новый ход дописывается.
+    # Неизвестный id создает новый диалог; conversation_history при этом не нужен
+    conversation_id: Optional[str] = None
+    # Сводка ранней части серверного диалога: заполняется при загрузке диалога,
+    # клиент ее не передает
+    _summary: Optional[ChatMessage] = PrivateAttr(default=None)
 
 
 class ChatResponse(BaseModel):
@@ -49,10 +59,156 @@ class ChatResponse(BaseModel):
     model: str
     agent_id: Optional[str] = None
     usage: Optional[Dict[str, Any]] = None
+    cached_tokens: Optional[int] = None  # Токены промпта из кеша провайдера
+    finish_reason: Optional[str] = None
     parsed_data: Optional[Any] = None
     format_valid: Optional[bool] = None
     response_format: Optional[ResponseFormat] = None
     orchestration_steps: Optional[List[Dict[str, Any]]] = None
+    ensemble: Optional[Dict[str, Any]] = None  # Self-consistency: выборки, голоса и доля согласия
+    conversation_id: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    """Пакет запросов к чату"""
+    requests: List[ChatRequest]
+    concurrency: Optional[int] = None  # Не больше BATCH.MAX_CONCURRENCY
+    stream: bool = False  # NDJSON по мере готовности вместо ответа в исходном порядке
+
+
+class BatchChatItem(BaseModel):
+    """Результат одного запроса пакета: ответ или ошибка"""
+    index: int
+    response: Optional[ChatResponse] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+
+class BatchChatResponse(BaseModel):
+    """Результаты пакета в порядке запросов"""
+    results: List[BatchChatItem]
+
+
+class ChatSweepVariant(BaseModel):
+    """Параметры одного варианта сравнения; не заданные берутся из запроса"""
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+
+
+class ChatSweepRequest(ChatRequest):
+    """Одно сообщение, выполняемое параллельно с несколькими наборами параметров"""
+    variants: List[ChatSweepVariant]
+    concurrency: Optional[int] = None  # Не больше BATCH.MAX_CONCURRENCY
+    stream: bool = True  # NDJSON по мере готовности вместо ответа в порядке вариантов
+
+
+class ChatSweepItem(BatchChatItem):
+    """Результат одного варианта сравнения (index - номер в variants)"""
+    variant: ChatSweepVariant
+
+
+class ChatSweepResponse(BaseModel):
+    """Результаты сравнения в порядке вариантов"""
+    results: List[ChatSweepItem]
+
+
+class JobStatus(str, Enum):
+    """Состояние фоновой задачи чата"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class ChatJob(BaseModel):
+    """Фоновая задача чата"""
+    id: str
+    status: JobStatus
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[ChatResponse] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+
+
+class PipelineNode(BaseModel):
+    """Узел конвейера оркестрации: вызов одного агента"""
+    id: str
+    agent_id: str
+    depends_on: List[str] = []
+    # Сообщение агенту: {{message}} - сообщение пользователя, {{<node>}} - вывод узла,
+    # {{<node>.<field>}} - поле JSON вывода. По умолчанию - сообщение пользователя
+    # (и выводы зависимостей, если они есть)
+    input: Optional[str] = None
+    include_history: bool = False  # Передавать агенту историю диалога
+    timeout: Optional[float] = None  # Секунды; по умолчанию PIPELINES.NODE_TIMEOUT
+
+
+class Pipeline(BaseModel):
+    """Конвейер оркестрации: DAG агентов, независимые узлы выполняются параллельно"""
+    nodes: List[PipelineNode]
+    output: Optional[str] = None  # Узел с итоговым ответом; по умолчанию - единственный узел без зависимых
+    # Узел, которому нужны только поля JSON зависимостей ({{<node>.<field>}}), запускается,
+    # как только эти поля сгенерированы, не дожидаясь конца ответа зависимости
+    pipelined: bool = False
+
+    @model_validator(mode="after")
+    def check_graph(self) -> "Pipeline":
+        ids = [node.id for node in self.nodes]
+        if not ids:
+            raise ValueError("Pipeline has no nodes")
+        if len(set(ids)) != len(ids):
+            raise ValueError("Pipeline node ids must be unique")
+        if "message" in ids:
+            raise ValueError("Pipeline node id 'message' is reserved")
+        for node in self.nodes:
+            unknown = [dep for dep in node.depends_on if dep not in ids]
+            if unknown:
+                raise ValueError(f"Node '{node.id}' depends on unknown nodes: {', '.join(unknown)}")
+            for name, _ in PIPELINE_REFERENCE.findall(node.input or ""):
+                if name != "message" and name not in node.depends_on:
+                    raise ValueError(f"Node '{node.id}' input references '{name}' which is not in depends_on")
+        self.levels()
+        self.output_node()
+        return self
+
+    def levels(self) -> List[List[PipelineNode]]:
+        """Узлы по уровням: каждый узел зависит только от узлов предыдущих уровней"""
+        levels: List[List[PipelineNode]] = []
+        placed: set = set()
+        remaining = list(self.nodes)
+        while remaining:
+            level = [node for node in remaining if all(dep in placed for dep in node.depends_on)]
+            if not level:
+                raise ValueError(f"Pipeline has a cycle: {', '.join(node.id for node in remaining)}")
+            levels.append(level)
+            placed.update(node.id for node in level)
+            remaining = [node for node in remaining if node.id not in placed]
+        return levels
+
+    def output_node(self) -> PipelineNode:
+        """Узел, вывод которого становится ответом конвейера"""
+        if self.output:
+            node = next((node for node in self.nodes if node.id == self.output), None)
+            if not node:
+                raise ValueError(f"Pipeline output node '{self.output}' not found")
+            return node
+        used = {dep for node in self.nodes for dep in node.depends_on}
+        sinks = [node for node in self.nodes if node.id not in used]
+        if len(sinks) != 1:
+            raise ValueError("Pipeline has several final nodes, set 'output'")
+        return sinks[0]
+
+
+class EnsembleConfig(BaseModel):
+    """Self-consistency: несколько параллельных ответов и голосование по полям"""
+    samples: int = 5
+    vote_fields: List[str] = ["final_answer"]  # Поля JSON ответа; для текстовых агентов голосуют по всему ответу
+    majority: float = 0.5  # Голосование завершается, когда согласны больше этой доли выборок
+    temperature: Optional[float] = None  # Температура выборок; по умолчанию - как у обычного запроса
 
 
 class AgentConfig(BaseModel):
@@ -64,6 +220,10 @@ class AgentConfig(BaseModel):
     temperature: float = 0.7
     max_tokens: int = 1000
     response_format: Optional[ResponseFormat] = None
+    cache_responses: bool = False  # Кешировать ответы и при temperature > 0
+    fallback_models: Optional[List[str]] = None  # Запасные модели из ALLOWED_MODELS
+    pipeline: Optional[Pipeline] = None  # Агент-оркестратор: вместо вызова модели выполняет конвейер
+    ensemble: Optional[EnsembleConfig] = None  # Отвечать голосованием нескольких выборок
 
 
 class Agent(BaseModel):
@@ -76,6 +236,10 @@ class Agent(BaseModel):
     temperature: float = 0.7
     max_tokens: int = 1000
     response_format: Optional[ResponseFormat] = None
+    cache_responses: bool = False  # Кешировать ответы и при temperature > 0
+    fallback_models: Optional[List[str]] = None  # Запасные модели из ALLOWED_MODELS
+    pipeline: Optional[Pipeline] = None  # Агент-оркестратор: вместо вызова модели выполняет конвейер
+    ensemble: Optional[EnsembleConfig] = None  # Отвечать голосованием нескольких выборок
     created_at: str
 
 
@@ -90,4 +254,21 @@ class ModelInfo(BaseModel):
     name: str
     description: Optional[str] = None
     context_length: Optional[int] = None
-    pricing: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    pricing: Optional[Dict[str, Any]] = None
+
+
+class Conversation(BaseModel):
+    """Диалог, хранящийся на сервере"""
+    id: str
+    agent_id: Optional[str] = None
+    messages: List[ChatMessage] = []
+    summary: Optional[str] = None  # Сжатое содержание первых summary_upto сообщений
+    summary_upto: Optional[int] = None
+    summary_hash: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+class UpdateMessageRequest(BaseModel):
+    """Запрос на изменение сообщения диалога"""
+    content: str
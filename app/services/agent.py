@@ -1,13 +1,14 @@
-from typing import Dict, List, Optional
+from typing import List, Optional
 from datetime import datetime
 import uuid
 import json
-from app.models.schemas import Agent, AgentConfig, ChatMessage, MessageRole, ResponseFormat, ResponseFormatType
+from app.models.schemas import Agent, AgentConfig, ChatMessage, EnsembleConfig, MessageRole, ResponseFormat, ResponseFormatType
 from app.services.agent_loader import agent_loader
 from app.database import get_db, AgentRepository
 from app.config import settings
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.services.openrouter import openrouter_service
+from app.services.model_router import AUTO_MODEL, default_agent_model, model_router
+from app.services.context_window import context_window
 
 
 class AgentService:
@@ -62,10 +63,14 @@ class AgentService:
             name=config.name,
             description=config.description,
             system_prompt=config.system_prompt,
-            model=config.model or settings.ASSISTANT.DEFAULT_MODEL,
+            model=config.model or default_agent_model(),
             temperature=config.temperature,
             max_tokens=config.max_tokens,
             response_format=config.response_format,
+            cache_responses=config.cache_responses,
+            fallback_models=self._validate_fallback_models(config.fallback_models),
+            pipeline=config.pipeline,
+            ensemble=self._validate_ensemble(config.ensemble),
             created_at=datetime.now().isoformat()
         )
         
@@ -96,10 +101,14 @@ class AgentService:
             name=config.name,
             description=config.description,
             system_prompt=config.system_prompt,
-            model=config.model or settings.ASSISTANT.DEFAULT_MODEL,
+            model=config.model or default_agent_model(),
             temperature=config.temperature,
             max_tokens=config.max_tokens,
             response_format=config.response_format,
+            cache_responses=config.cache_responses,
+            fallback_models=self._validate_fallback_models(config.fallback_models),
+            pipeline=config.pipeline,
+            ensemble=self._validate_ensemble(config.ensemble),
             created_at=datetime.now().isoformat()
         )
         
@@ -110,142 +119,79 @@ class AgentService:
         repository = AgentRepository(db)
         return await repository.delete_agent(agent_id)
     
-    def is_orchestrator_agent(self, agent: Agent) -> bool:
-        """Проверяет, является ли агент оркестратором субагентов"""
-        return agent.id == "subagent_orchestrator"
+    def _validate_fallback_models(self, fallback_models: Optional[List[str]]) -> Optional[List[str]]:
+        """Проверяет, что запасные модели входят в ALLOWED_MODELS"""
+        if not fallback_models:
+            return fallback_models
+        not_allowed = [model for model in fallback_models if model not in settings.ASSISTANT.ALLOWED_MODELS]
+        if not_allowed:
+            raise ValueError(f"Fallback models are not allowed: {', '.join(not_allowed)}")
+        return fallback_models
     
-    async def orchestrate_subagents(self, db: AsyncSession, user_message: str, conversation_history: List[ChatMessage] = None) -> Dict:
-        """Оркестрирует взаимодействие между субагентами"""
-        try:
-            # Получаем субагентов
-            task_solver = await self.get_agent(db, "task_solver")
-            result_processor = await self.get_agent(db, "result_processor")
-            
-            if not task_solver or not result_processor:
-                raise Exception("Subagents not found")
-            
-            # Шаг 1: Отправляем задачу первому субагенту (task_solver)
-            task_messages = self.prepare_messages_for_agent(
-                agent=task_solver,
-                user_message=user_message,
-                conversation_history=conversation_history
-            )
-            
-            task_result = await openrouter_service.chat_completion(
-                messages=task_messages,
-                model=task_solver.model,
-                temperature=task_solver.temperature,
-                max_tokens=task_solver.max_tokens
-            )
-            
-            # Парсим JSON ответ от task_solver
-            try:
-                task_output = json.loads(task_result["message"])
-            except json.JSONDecodeError:
-                raise Exception("Task solver returned invalid JSON")
-            
-            # Шаг 2: Отправляем результат второму субагенту (result_processor)
-            # Создаем сообщение для result_processor с JSON данными от task_solver
-            processor_input = f"Process this task result:\n{json.dumps(task_output, indent=2)}"
-            
-            processor_messages = self.prepare_messages_for_agent(
-                agent=result_processor,
-                user_message=processor_input,
-                conversation_history=None  # Не передаем историю для процессора
-            )
-            
-            processor_result = await openrouter_service.chat_completion(
-                messages=processor_messages,
-                model=result_processor.model,
-                temperature=result_processor.temperature,
-                max_tokens=result_processor.max_tokens
-            )
-            
-            # Парсим JSON ответ от result_processor
-            try:
-                final_output = json.loads(processor_result["message"])
-            except json.JSONDecodeError:
-                raise Exception("Result processor returned invalid JSON")
-            
-            # Возвращаем комбинированный результат
-            return {
-                "message": json.dumps(final_output, indent=2),
-                "model": f"{task_solver.model} + {result_processor.model}",
-                "usage": {
-                    "task_solver": task_result.get("usage"),
-                    "result_processor": processor_result.get("usage")
-                },
-                "orchestration_steps": [
-                    {
-                        "step": 1,
-                        "agent": "task_solver",
-                        "output": task_output
-                    },
-                    {
-                        "step": 2,
-                        "agent": "result_processor", 
-                        "output": final_output
-                    }
-                ]
-            }
-            
-        except Exception as e:
-            raise Exception(f"Orchestration failed: {str(e)}")
+    def _validate_ensemble(self, ensemble: Optional[EnsembleConfig]) -> Optional[EnsembleConfig]:
+        """Проверяет настройки self-consistency"""
+        if not ensemble:
+            return ensemble
+        max_samples = settings.ASSISTANT.ENSEMBLE.MAX_SAMPLES
+        if not 2 <= ensemble.samples <= max_samples:
+            raise ValueError(f"Ensemble samples must be between 2 and {max_samples}")
+        if not 0 <= ensemble.majority < 1:
+            raise ValueError("Ensemble majority must be in [0, 1)")
+        return ensemble
+    
+    def get_fallback_models(self, agent: Agent) -> List[str]:
+        """Запасные модели агента, а если они не заданы - глобальные из настроек"""
+        fallback_models = agent.fallback_models
+        if fallback_models is None:
+            fallback_models = settings.ASSISTANT.FALLBACK_MODELS
+        return [model for model in fallback_models if model in settings.ASSISTANT.ALLOWED_MODELS]
+    
+    def resolve_model(
+        self,
+        model: str,
+        messages: List[ChatMessage],
+        max_tokens: Optional[int],
+        conversation_key: Optional[str] = None
+    ) -> str:
+        """Подставляет модель, выбранную роутером, вместо "auto" """
+        if model != AUTO_MODEL:
+            return model
+        if not settings.ASSISTANT.ROUTING.ENABLED:
+            return settings.ASSISTANT.DEFAULT_MODEL
+        return model_router.select(messages, max_tokens, conversation_key)
+    
+    def is_orchestrator_agent(self, agent: Agent) -> bool:
+        """Проверяет, является ли агент оркестратором (выполняет конвейер субагентов)"""
+        return agent.pipeline is not None
     
     def prepare_messages_for_agent(
         self, 
         agent: Agent, 
         user_message: str,
-        conversation_history: List[ChatMessage] = None
+        conversation_history: List[ChatMessage] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        summary: Optional[ChatMessage] = None
     ) -> List[ChatMessage]:
-        """Подготавливает сообщения для отправки агенту"""
-        messages = []
-        
-        # Готовим системный промпт с учетом формата ответа
-        system_prompt = self._build_system_prompt(agent)
-        
-        # Добавляем системное сообщение
-        if system_prompt:
-            messages.append(ChatMessage(
-                role=MessageRole.SYSTEM,
-                content=system_prompt
-            ))
-        
-        # Добавляем историю разговора (если есть)
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        # Добавляем текущее сообщение пользователя
-        messages.append(ChatMessage(
-            role=MessageRole.USER,
-            content=user_message
-        ))
-        
-        return messages
-        """Подготавливает сообщения для отправки агенту"""
-        messages = []
-        
+        """
+        Подготавливает сообщения для отправки агенту
+
+        История обрезается под контекст модели (model/max_tokens запроса,
+        по умолчанию - агента): системный промпт, сводка диалога (summary)
+        и текущее сообщение сохраняются всегда.
+        """
         # Готовим системный промпт с учетом формата ответа
         system_prompt = self._build_system_prompt(agent)
-        
-        # Добавляем системное сообщение
-        if system_prompt:
-            messages.append(ChatMessage(
-                role=MessageRole.SYSTEM,
-                content=system_prompt
-            ))
-        
-        # Добавляем историю разговора (если есть)
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        # Добавляем текущее сообщение пользователя
-        messages.append(ChatMessage(
-            role=MessageRole.USER,
-            content=user_message
-        ))
-        
-        return messages
+        system_message = ChatMessage(role=MessageRole.SYSTEM, content=system_prompt) if system_prompt else None
+        
+        return context_window.fit(
+            system=system_message,
+            history=conversation_history or [],
+            latest=ChatMessage(role=MessageRole.USER, content=user_message),
+            model=model or agent.model,
+            max_tokens=max_tokens or agent.max_tokens,
+            summary=summary
+        )
     
     def _build_system_prompt(self, agent: Agent) -> str:
         """Строит системный промпт с учетом формата ответа"""
@@ -263,12 +209,15 @@ class AgentService:
             instruction = "ВАЖНО: Отвечай ТОЛЬКО в формате JSON. Не добавляй никаких дополнительных объяснений вне JSON структуры."
             
             if response_format.json_schema:
-                instruction += f"\n\nТребуемая JSON схема:\n```json\n{response_format.json_schema}\n```"
+                # JSON вместо repr словаря: одинаковые байты при каждом запросе (префикс кешируется провайдером),
+                # порядок полей схемы сохраняется
+                schema = json.dumps(response_format.json_schema, ensure_ascii=False, indent=2)
+                instruction += f"\n\nТребуемая JSON схема:\n```json\n{schema}\n```"
             
             if response_format.examples:
                 instruction += "\n\nПримеры ответов:"
                 for i, example in enumerate(response_format.examples, 1):
-                    instruction += f"\n\nПример {i}:\n```json\n{example}\n```"
+                    instruction += f"\n\nПример {i}:\n```json\n{example.strip()}\n```"
             
             if response_format.description:
                 instruction += f"\n\nОписание формата: {response_format.description}"
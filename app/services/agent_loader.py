@@ -2,8 +2,8 @@ from typing import Dict, List
 import yaml
 import os
 from pathlib import Path
-from app.models.schemas import Agent, ResponseFormat, ResponseFormatType
-from app.config import settings
+from app.models.schemas import Agent, EnsembleConfig, Pipeline, ResponseFormat, ResponseFormatType
+from app.services.model_router import default_agent_model
 from datetime import datetime
 
 
@@ -56,10 +56,14 @@ class AgentLoader:
                 name=config['name'],
                 description=config['description'],
                 system_prompt=config['system_prompt'],
-                model=config.get('model') or settings.ASSISTANT.DEFAULT_MODEL,
+                model=config.get('model') or default_agent_model(),
                 temperature=config.get('temperature', 0.7),
                 max_tokens=config.get('max_tokens', 1000),
                 response_format=response_format,
+                cache_responses=config.get('cache_responses', False),
+                fallback_models=config.get('fallback_models'),
+                pipeline=Pipeline(**config['pipeline']) if config.get('pipeline') else None,
+                ensemble=EnsembleConfig(**config['ensemble']) if config.get('ensemble') else None,
                 created_at=datetime.now().isoformat()
             )
             
@@ -101,7 +105,11 @@ class AgentLoader:
                     'system_prompt': agent.system_prompt,
                     'model': agent.model,
                     'temperature': agent.temperature,
-                    'max_tokens': agent.max_tokens
+                    'max_tokens': agent.max_tokens,
+                    'cache_responses': agent.cache_responses,
+                    'fallback_models': agent.fallback_models,
+                    'pipeline': agent.pipeline.model_dump(exclude_none=True) if agent.pipeline else None,
+                    'ensemble': agent.ensemble.model_dump(exclude_none=True) if agent.ensemble else None
                 }
                 
                 if agent.response_format:
@@ -0,0 +1,293 @@
+from typing import AsyncIterator, Dict, Any, List, Optional
+import asyncio
+import contextlib
+import hashlib
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal, ConversationRepository
+from app.models.schemas import (
+    Agent,
+    BatchChatItem,
+    ChatMessage,
+    ChatRequest,
+    ChatResponse,
+    ChatSweepItem,
+    ChatSweepRequest,
+    MessageRole,
+)
+from app.services.agent import agent_service
+from app.services.conversation_summary import conversation_summarizer
+from app.services.ensemble import ensemble_runner
+from app.services.openrouter import openrouter_service
+from app.services.pipeline import pipeline_executor
+from app.services.resilience import UpstreamError
+from app.services.response_format import response_format_service
+from app.services.tokens import cached_prompt_tokens
+
+
+class AgentNotFoundError(LookupError):
+    """Агент, указанный в запросе, не найден"""
+
+
+class ChatService:
+    """Общий конвейер обработки сообщения агентом (HTTP, SSE, WebSocket)"""
+
+    async def get_agent(self, db: AsyncSession, agent_id: Optional[str]) -> Agent:
+        """Получает агента запроса или выбрасывает AgentNotFoundError"""
+        agent = await agent_service.get_agent(db, agent_id or "default")
+        if not agent:
+            raise AgentNotFoundError("Agent not found")
+        return agent
+
+    async def load_conversation(self, db: AsyncSession, request: ChatRequest) -> ChatRequest:
+        """Подставляет в запрос историю диалога, хранящегося на сервере"""
+        if not request.conversation_id:
+            return request
+        conversation = await ConversationRepository(db).get_conversation(request.conversation_id)
+        # Старая часть длинного диалога заменяется сводкой
+        summary, history = conversation_summarizer.build_history(conversation) if conversation else (None, [])
+        request = request.model_copy(update={"conversation_history": history})
+        request._summary = summary
+        return request
+
+    async def save_turn(self, db: AsyncSession, agent: Agent, request: ChatRequest, response: ChatResponse):
+        """Дописывает ход (сообщение пользователя и ответ) в диалог на сервере"""
+        if not request.conversation_id:
+            return
+        repository = ConversationRepository(db)
+        await repository.get_or_create_conversation(request.conversation_id, agent.id)
+        await repository.append_messages(request.conversation_id, [
+            ChatMessage(role=MessageRole.USER, content=request.message),
+            ChatMessage(role=MessageRole.ASSISTANT, content=response.message),
+        ])
+        response.conversation_id = request.conversation_id
+        conversation_summarizer.schedule(request.conversation_id)
+
+    def get_conversation_key(self, agent: Agent, request: ChatRequest) -> str:
+        """Ключ диалога: агент и id диалога на сервере или первое сообщение диалога"""
+        if request.conversation_id:
+            return hashlib.sha256(f"{agent.id}:id:{request.conversation_id}".encode("utf-8")).hexdigest()
+        first_message = request.conversation_history[0].content if request.conversation_history else request.message
+        return hashlib.sha256(f"{agent.id}:{first_message}".encode("utf-8")).hexdigest()
+
+    def get_completion_params(
+        self,
+        agent: Agent,
+        request: ChatRequest,
+        messages: List[ChatMessage]
+    ) -> Dict[str, Any]:
+        """Параметры модели: значения из запроса имеют приоритет над настройками агента"""
+        max_tokens = request.max_tokens or agent.max_tokens
+        return {
+            "model": agent_service.resolve_model(
+                request.model or agent.model,
+                messages,
+                max_tokens,
+                conversation_key=self.get_conversation_key(agent, request)
+            ),
+            "temperature": request.temperature if request.temperature is not None else agent.temperature,
+            "max_tokens": max_tokens,
+            # Агент может включить кеш и для недетерминированных запросов
+            "cache": True if agent.cache_responses else None,
+            "fallback_models": agent_service.get_fallback_models(agent),
+        }
+
+    def build_response(self, agent: Agent, result: Dict[str, Any]) -> ChatResponse:
+        """Парсит ответ модели согласно формату агента и собирает ChatResponse"""
+        parsed_data, format_valid = response_format_service.parse_response(
+            result["message"],
+            agent.response_format
+        )
+
+        return ChatResponse(
+            message=result["message"],
+            model=result["model"],
+            agent_id=agent.id,
+            usage=result.get("usage"),
+            cached_tokens=cached_prompt_tokens(result.get("usage")),
+            finish_reason=result.get("finish_reason"),
+            parsed_data=parsed_data if agent.response_format else None,
+            format_valid=format_valid if agent.response_format else None,
+            response_format=agent.response_format,
+            ensemble=result.get("ensemble")
+        )
+
+    def build_orchestration_response(self, agent: Agent, result: Dict[str, Any]) -> ChatResponse:
+        """Собирает ChatResponse из результата оркестрации субагентов"""
+        return ChatResponse(
+            message=result["message"],
+            model=result["model"],
+            agent_id=agent.id,
+            usage=result.get("usage"),
+            cached_tokens=self._orchestration_cached_tokens(result.get("usage")),
+            parsed_data=None,  # Оркестратор возвращает уже обработанные данные
+            format_valid=True,
+            response_format=None,
+            orchestration_steps=result.get("orchestration_steps")
+        )
+
+    def _orchestration_cached_tokens(self, usage: Optional[Dict[str, Any]]) -> Optional[int]:
+        """Сумма закешированных токенов по шагам оркестрации (usage по агентам)"""
+        counts = [cached_prompt_tokens(step_usage) for step_usage in (usage or {}).values() if isinstance(step_usage, dict)]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+
+    def prepare_messages(self, agent: Agent, request: ChatRequest) -> List[ChatMessage]:
+        """Подготавливает сообщения для обычного (не оркестрирующего) агента"""
+        return agent_service.prepare_messages_for_agent(
+            agent=agent,
+            user_message=request.message,
+            conversation_history=request.conversation_history,
+            model=request.model,
+            max_tokens=request.max_tokens,
+            summary=request._summary
+        )
+
+    async def complete(self, db: AsyncSession, request: ChatRequest) -> ChatResponse:
+        """Обрабатывает сообщение и возвращает полный ответ агента"""
+        agent = await self.get_agent(db, request.agent_id)
+        request = await self.load_conversation(db, request)
+
+        # Проверяем, является ли агент оркестратором субагентов
+        if agent_service.is_orchestrator_agent(agent):
+            result = await pipeline_executor.run(
+                db=db,
+                pipeline=agent.pipeline,
+                user_message=request.message,
+                conversation_history=request.conversation_history,
+                conversation_summary=request._summary
+            )
+            response = self.build_orchestration_response(agent, result)
+        else:
+            messages = self.prepare_messages(agent, request)
+            params = self.get_completion_params(agent, request, messages)
+            if agent.ensemble:
+                result = await ensemble_runner.run(agent.ensemble, agent.response_format, messages, params)
+            else:
+                result = await openrouter_service.chat_completion(messages=messages, **params)
+            response = self.build_response(agent, result)
+
+        await self.save_turn(db, agent, request, response)
+        return response
+
+    async def stream(self, db: AsyncSession, request: ChatRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Обрабатывает сообщение в потоковом режиме.
+
+        Отдает события {"type": "token", "content": ...}
+        (для оркестраторов - события конвейера step_started, step_token
+        и orchestration_step, см. PipelineExecutor.run_stream)
+        и в конце {"type": "done", "response": ChatResponse}.
+        """
+        agent = await self.get_agent(db, request.agent_id)
+        request = await self.load_conversation(db, request)
+
+        if agent_service.is_orchestrator_agent(agent):
+            # Оркестрация стримит события узлов конвейера по мере выполнения
+            async with contextlib.aclosing(pipeline_executor.run_stream(
+                db=db,
+                pipeline=agent.pipeline,
+                user_message=request.message,
+                conversation_history=request.conversation_history,
+                conversation_summary=request._summary
+            )) as events:
+                async for event in events:
+                    if event["type"] == "done":
+                        response = self.build_orchestration_response(agent, event)
+                        await self.save_turn(db, agent, request, response)
+                        yield {"type": "done", "response": response}
+                    else:
+                        yield event
+            return
+
+        messages = self.prepare_messages(agent, request)
+        if agent.ensemble:
+            # Голосование возможно только по полным ответам: отдаем победителя одним фрагментом
+            result = await ensemble_runner.run(
+                agent.ensemble,
+                agent.response_format,
+                messages,
+                self.get_completion_params(agent, request, messages)
+            )
+            response = self.build_response(agent, result)
+            await self.save_turn(db, agent, request, response)
+            yield {"type": "token", "content": response.message}
+            yield {"type": "done", "response": response}
+            return
+
+        # aclosing: при досрочном закрытии стрима (отключился клиент) ответ модели закрывается сразу
+        async with contextlib.aclosing(openrouter_service.chat_completion_stream(
+            messages=messages,
+            **self.get_completion_params(agent, request, messages)
+        )) as events:
+            async for event in events:
+                if event["type"] == "done":
+                    response = self.build_response(agent, event)
+                    await self.save_turn(db, agent, request, response)
+                    yield {"type": "done", "response": response}
+                else:
+                    yield event
+
+    def error_status(self, error: Exception) -> int:
+        """HTTP статус, соответствующий ошибке обработки запроса"""
+        if isinstance(error, AgentNotFoundError):
+            return 404
+        if isinstance(error, UpstreamError):
+            return error.http_status
+        return 500
+
+    async def complete_batch(self, requests: List[ChatRequest], concurrency: int) -> AsyncIterator[BatchChatItem]:
+        """
+        Обрабатывает пакет запросов, не более concurrency одновременно.
+
+        Отдает результаты по мере готовности; ошибка запроса попадает в его
+        BatchChatItem и не прерывает пакет. У каждого запроса своя сессия БД.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index: int, request: ChatRequest) -> BatchChatItem:
+            async with semaphore:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        return BatchChatItem(index=index, response=await self.complete(db, request))
+                    except Exception as e:
+                        return BatchChatItem(index=index, error=str(e), status_code=self.error_status(e))
+
+        tasks = [asyncio.create_task(run(index, request)) for index, request in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Клиент отключился или генератор закрыли досрочно - отменяем оставшиеся запросы
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def complete_sweep(self, db: AsyncSession, sweep: ChatSweepRequest, concurrency: int) -> AsyncIterator[ChatSweepItem]:
+        """
+        Выполняет одно сообщение со всеми вариантами параметров параллельно.
+
+        История диалога на сервере загружается один раз и передается вариантам
+        как conversation_history; варианты в диалог не сохраняются, иначе
+        каждый из них дописал бы свой ход.
+        """
+        base = await self.load_conversation(db, sweep)
+        fields = base.model_dump(exclude={"variants", "concurrency", "stream", "conversation_id"})
+        requests = [
+            ChatRequest(**{**fields, **variant.model_dump(exclude_none=True)})
+            for variant in sweep.variants
+        ]
+        for request in requests:
+            request._summary = base._summary
+        async with contextlib.aclosing(self.complete_batch(requests, concurrency)) as items:
+            async for item in items:
+                yield ChatSweepItem(
+                    index=item.index,
+                    response=item.response,
+                    error=item.error,
+                    status_code=item.status_code,
+                    variant=sweep.variants[item.index]
+                )
+
+
+# Глобальный экземпляр сервиса
+chat_service = ChatService()
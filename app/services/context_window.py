@@ -0,0 +1,103 @@
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.models.schemas import ChatMessage, MessageRole
+from app.services.metrics import metrics
+from app.services.model_catalog import model_catalog
+from app.services.model_router import AUTO_MODEL
+from app.services.tokens import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+
+def message_tokens(message: ChatMessage) -> int:
+    """Оценка токенов одного сообщения вместе со служебными"""
+    return estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindowManager:
+    """
+    Укладывает историю диалога в контекст модели
+
+    Бюджет промпта - context_length модели минус max_tokens ответа (и запас
+    на неточность оценки). Системный промпт, сводка ранней части диалога и
+    текущее сообщение пользователя сохраняются всегда, из истории оставляются
+    самые свежие сообщения, которые помещаются в оставшийся бюджет.
+    """
+
+    def __init__(self, enabled: bool, default_context_length: int, safety_margin: float):
+        self.enabled = enabled
+        self.default_context_length = default_context_length
+        self.safety_margin = safety_margin
+        self.trimmed_requests = 0
+        self.trimmed_messages = 0
+        self.overflow_requests = 0
+
+    def context_length(self, model: Optional[str]) -> int:
+        """Размер контекста модели по каталогу (для "auto" - наибольший среди разрешенных)"""
+        models = settings.ASSISTANT.ALLOWED_MODELS if model in (None, AUTO_MODEL) else [model]
+        lengths = [
+            info.context_length for info in map(model_catalog.get_model, models)
+            if info and info.context_length
+        ]
+        return max(lengths) if lengths else self.default_context_length
+
+    def prompt_budget(self, model: Optional[str], max_tokens: Optional[int]) -> int:
+        context_length = self.context_length(model)
+        return int(context_length * (1 - self.safety_margin)) - (max_tokens or 0)
+
+    def fit(
+        self,
+        system: Optional[ChatMessage],
+        history: List[ChatMessage],
+        latest: ChatMessage,
+        model: Optional[str],
+        max_tokens: Optional[int],
+        summary: Optional[ChatMessage] = None
+    ) -> List[ChatMessage]:
+        """Собирает сообщения запроса, отбрасывая самую старую историю, которая не помещается"""
+        head = [message for message in (system, summary) if message]
+        if not self.enabled or not history:
+            return head + history + [latest]
+
+        budget = self.prompt_budget(model, max_tokens)
+        budget -= sum(message_tokens(m) for m in head) + message_tokens(latest)
+        if budget < 0:
+            # Не помещается даже обязательная часть - отправляем без истории,
+            # ошибку (если будет) вернет провайдер
+            self.overflow_requests += 1
+            return self._record_trim(head + [latest], len(history))
+
+        kept: List[ChatMessage] = []
+        for message in reversed(history):
+            cost = message_tokens(message)
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append(message)
+        kept.reverse()
+
+        # Не начинаем историю с ответа ассистента, оставшегося без вопроса
+        while len(kept) < len(history) and kept and kept[0].role == MessageRole.ASSISTANT:
+            kept.pop(0)
+
+        return self._record_trim(head + kept + [latest], len(history) - len(kept))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "trimmed_requests": self.trimmed_requests,
+            "trimmed_messages": self.trimmed_messages,
+            "overflow_requests": self.overflow_requests,
+        }
+
+    def _record_trim(self, messages: List[ChatMessage], dropped: int) -> List[ChatMessage]:
+        if dropped:
+            self.trimmed_requests += 1
+            self.trimmed_messages += dropped
+        return messages
+
+
+# Глобальный менеджер контекстного окна
+context_window = ContextWindowManager(
+    enabled=settings.ASSISTANT.CONTEXT.ENABLED,
+    default_context_length=settings.ASSISTANT.CONTEXT.DEFAULT_CONTEXT_LENGTH,
+    safety_margin=settings.ASSISTANT.CONTEXT.SAFETY_MARGIN,
+)
+metrics.register_collector("context_window", context_window.stats)
@@ -0,0 +1,179 @@
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import contextlib
+import hashlib
+import json
+from app.config import settings
+from app.database import AsyncSessionLocal, ConversationRepository
+from app.models.schemas import ChatMessage, Conversation, MessageRole
+from app.services.metrics import metrics
+from app.services.openrouter import openrouter_service
+from app.services.tokens import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+SUMMARY_PROMPT = (
+    "You compress chat transcripts. Summarize the conversation below so that an assistant "
+    "can continue it without the original messages. Keep facts, numbers, decisions, "
+    "requirements, open questions and the user's preferences. Be concise, use the "
+    "conversation's language and do not add anything that was not said."
+)
+
+
+def messages_hash(messages: List[ChatMessage]) -> str:
+    """Хеш содержимого сообщений: по нему проверяется, что сводка соответствует истории"""
+    payload = json.dumps([[m.role.value, m.content] for m in messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _tokens(messages: List[ChatMessage]) -> int:
+    return sum(estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+class ConversationSummarizer:
+    """
+    Фоновое сжатие длинных диалогов
+
+    После каждого хода проверяется размер несжатой части истории. Если он
+    превышает trigger_tokens, в фоне (вне пути запроса) старые сообщения
+    вместе с предыдущей сводкой сжимаются моделью в новую сводку, а в запросы
+    уходят сводка и последние keep_recent_messages сообщений. Сводка хранит
+    хеш покрытых сообщений и игнорируется, если эти сообщения изменились.
+    """
+
+    def __init__(self, enabled: bool, trigger_tokens: int, keep_recent_messages: int, model: str, max_tokens: int):
+        self.enabled = enabled
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.model = model
+        self.max_tokens = max_tokens
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.compactions = 0
+        self.failures = 0
+        self.stale_summaries = 0
+
+    def summary_is_valid(self, conversation: Conversation) -> bool:
+        if not conversation.summary or not conversation.summary_upto:
+            return False
+        covered = conversation.messages[:conversation.summary_upto]
+        return len(covered) == conversation.summary_upto and messages_hash(covered) == conversation.summary_hash
+
+    def build_history(self, conversation: Conversation) -> Tuple[Optional[ChatMessage], List[ChatMessage]]:
+        """
+        История для запроса: сводка (если актуальна) и сообщения после нее
+
+        Сводка возвращается отдельно: она идет в неизменяемую часть промпта
+        рядом с системным, а при нехватке контекста обрезаются только сообщения.
+        """
+        if not self.summary_is_valid(conversation):
+            if conversation.summary:
+                self.stale_summaries += 1
+            return None, conversation.messages
+        summary_message = ChatMessage(
+            role=MessageRole.SYSTEM,
+            content=f"Summary of the earlier part of this conversation:\n{conversation.summary}"
+        )
+        return summary_message, conversation.messages[conversation.summary_upto:]
+
+    def schedule(self, conversation_id: str):
+        """Запускает проверку и сжатие диалога в фоне (не более одной задачи на диалог)"""
+        if not self.enabled:
+            return
+        task = self._tasks.get(conversation_id)
+        if task and not task.done():
+            return
+        task = asyncio.create_task(self._compact(conversation_id))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda finished: self._forget(conversation_id, finished))
+
+    def _forget(self, conversation_id: str, finished: asyncio.Task):
+        # Колбэк выполняется позже завершения задачи: к этому моменту для диалога
+        # уже могла быть запущена новая задача, ее не трогаем
+        if self._tasks.get(conversation_id) is finished:
+            del self._tasks[conversation_id]
+
+    async def stop(self):
+        """Отменяет незавершенные задачи сжатия"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_progress": len(self._tasks),
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "stale_summaries": self.stale_summaries,
+        }
+
+    def _compaction_point(self, conversation: Conversation, start: int) -> Optional[int]:
+        """Сколько первых сообщений сжать или None, если сжимать рано"""
+        messages = conversation.messages
+        if _tokens(messages[start:]) <= self.trigger_tokens:
+            return None
+        upto = len(messages) - self.keep_recent_messages
+        # Последние сообщения начинаются с реплики пользователя, а не с ответа
+        while start < upto < len(messages) and messages[upto].role == MessageRole.ASSISTANT:
+            upto -= 1
+        return upto if upto > start else None
+
+    async def _compact(self, conversation_id: str):
+        try:
+            async with AsyncSessionLocal() as db:
+                repository = ConversationRepository(db)
+                conversation = await repository.get_conversation(conversation_id)
+                if not conversation:
+                    return
+
+                valid = self.summary_is_valid(conversation)
+                start = conversation.summary_upto if valid else 0
+                upto = self._compaction_point(conversation, start)
+                if upto is None:
+                    return
+
+                summary = await self._summarize(
+                    conversation.summary if valid else None,
+                    conversation.messages[start:upto]
+                )
+                saved = await repository.set_summary(
+                    conversation_id,
+                    summary=summary,
+                    upto=upto,
+                    summary_hash=messages_hash(conversation.messages[:upto]),
+                    based_on_hash=conversation.summary_hash
+                )
+                if saved:
+                    self.compactions += 1
+                    metrics.increment("conversation_compactions")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            print(f"Ошибка сжатия диалога {conversation_id}: {e}")
+
+    async def _summarize(self, previous_summary: Optional[str], messages: List[ChatMessage]) -> str:
+        transcript = "\n\n".join(f"{m.role.value}: {m.content}" for m in messages)
+        if previous_summary:
+            transcript = f"Summary of the conversation so far:\n{previous_summary}\n\nNew messages:\n{transcript}"
+        result = await openrouter_service.chat_completion(
+            messages=[
+                ChatMessage(role=MessageRole.SYSTEM, content=SUMMARY_PROMPT),
+                ChatMessage(role=MessageRole.USER, content=transcript),
+            ],
+            model=self.model or settings.ASSISTANT.DEFAULT_MODEL,
+            temperature=0,
+            max_tokens=self.max_tokens
+        )
+        return result["message"].strip()
+
+
+# Глобальный сервис сжатия диалогов
+conversation_summarizer = ConversationSummarizer(
+    enabled=settings.ASSISTANT.SUMMARY.ENABLED,
+    trigger_tokens=settings.ASSISTANT.SUMMARY.TRIGGER_TOKENS,
+    keep_recent_messages=settings.ASSISTANT.SUMMARY.KEEP_RECENT_MESSAGES,
+    model=settings.ASSISTANT.SUMMARY.MODEL,
+    max_tokens=settings.ASSISTANT.SUMMARY.MAX_TOKENS,
+)
+metrics.register_collector("conversation_summary", conversation_summarizer.stats)
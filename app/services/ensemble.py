@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import math
+from app.config import settings
+from app.models.schemas import ChatMessage, EnsembleConfig, ResponseFormat, ResponseFormatType
+from app.services.metrics import metrics
+from app.services.openrouter import openrouter_service
+from app.services.resilience import UpstreamError
+from app.services.response_format import response_format_service
+
+
+def _normalize(value: Any) -> Any:
+    """Приводит ответ к виду для сравнения: регистр, пробелы, числа в строках"""
+    if isinstance(value, str):
+        value = " ".join(value.lower().split())
+        try:
+            return round(float(value), 6)
+        except ValueError:
+            return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return round(float(value), 6)
+    return value
+
+
+def _sum_usage(usages: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """Суммарный usage выборок (вложенные счетчики, например prompt_tokens_details, тоже)"""
+    total: Dict[str, Any] = {}
+    for usage in filter(None, usages):
+        for key, value in usage.items():
+            if isinstance(value, dict):
+                total[key] = _sum_usage([total.get(key), value])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total or None
+
+
+class EnsembleRunner:
+    """
+    Self-consistency: агент отвечает голосованием нескольких выборок
+
+    Выборки запрашиваются параллельно (без кеша и объединения одинаковых
+    запросов, иначе все они вернут один ответ). Как только один ответ набирает
+    больше majority выборок, оставшиеся запросы отменяются, поэтому ожидание
+    не растет до самой медленной выборки. Иначе побеждает самый частый ответ.
+    """
+
+    def __init__(self, max_samples: int):
+        self.max_samples = max_samples
+        self.runs = 0
+        self.early_stops = 0
+        self.samples_cancelled = 0
+        self.samples_failed = 0
+
+    async def run(
+        self,
+        config: EnsembleConfig,
+        response_format: Optional[ResponseFormat],
+        messages: List[ChatMessage],
+        params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Возвращает ответ-победитель в формате chat_completion с полем ensemble"""
+        samples = min(config.samples, self.max_samples)
+        needed = math.floor(samples * config.majority) + 1
+        sample_params = {**params, "cache": False, "coalesce": False}
+        if config.temperature is not None:
+            sample_params["temperature"] = config.temperature
+
+        tasks = [
+            asyncio.create_task(openrouter_service.chat_completion(messages=messages, **sample_params))
+            for _ in range(samples)
+        ]
+        completed: List[Dict[str, Any]] = []
+        votes: Dict[str, List[Dict[str, Any]]] = {}
+        errors: List[UpstreamError] = []
+        early_stop = False
+        self.runs += 1
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result = await next_done
+                except UpstreamError as e:
+                    errors.append(e)
+                    continue
+                completed.append(result)
+                key = self._vote_key(config, response_format, result["message"])
+                if key is None:
+                    continue
+                votes.setdefault(key, []).append(result)
+                if len(votes[key]) >= needed:
+                    early_stop = len(completed) < samples
+                    break
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.samples_cancelled += len(pending)
+        self.samples_failed += len(errors)
+        if early_stop:
+            self.early_stops += 1
+            metrics.increment("ensemble_early_stops")
+        if not completed:
+            raise errors[0]
+
+        winner_votes = max(votes.values(), key=len) if votes else [completed[0]]
+        return {
+            **winner_votes[0],
+            "usage": _sum_usage([result.get("usage") for result in completed]),
+            "ensemble": {
+                "samples": samples,
+                "completed": len(completed),
+                "cancelled": len(pending),
+                "failed": len(errors),
+                "votes": len(winner_votes) if votes else 0,
+                "agreement": round(len(winner_votes) / len(completed), 3) if votes else 0.0,
+                "distribution": sorted((len(group) for group in votes.values()), reverse=True),
+                "early_stop": early_stop,
+            },
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "runs": self.runs,
+            "early_stops": self.early_stops,
+            "samples_cancelled": self.samples_cancelled,
+            "samples_failed": self.samples_failed,
+        }
+
+    def _vote_key(self, config: EnsembleConfig, response_format: Optional[ResponseFormat], message: str) -> Optional[str]:
+        """Ключ голоса: нормализованные vote_fields ответа или None, если голосовать нечем"""
+        if not (response_format and response_format.type == ResponseFormatType.JSON):
+            # Текстовый агент: голосуем по всему ответу
+            return json.dumps(_normalize(message), ensure_ascii=False) if message.strip() else None
+        parsed, _ = response_format_service.parse_response(message, response_format)
+        if not isinstance(parsed, dict) or any(field not in parsed for field in config.vote_fields):
+            return None
+        values = [parsed[field] for field in config.vote_fields] if config.vote_fields else [parsed]
+        return json.dumps([_normalize(value) for value in values], ensure_ascii=False, sort_keys=True)
+
+
+# Глобальный сервис self-consistency
+ensemble_runner = EnsembleRunner(max_samples=settings.ASSISTANT.ENSEMBLE.MAX_SAMPLES)
+metrics.register_collector("ensemble", ensemble_runner.stats)
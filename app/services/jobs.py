@@ -0,0 +1,185 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import asyncio
+import contextlib
+import time
+import uuid
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.schemas import ChatJob, ChatRequest, ChatResponse, JobStatus
+from app.services.chat import chat_service
+from app.services.metrics import metrics
+
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class JobQueueFullError(Exception):
+    """Очередь фоновых задач переполнена"""
+
+
+class Job:
+    """Фоновая задача чата и ее результат"""
+
+    def __init__(self, request: ChatRequest):
+        self.id = str(uuid.uuid4())
+        self.request = request
+        self.status = JobStatus.QUEUED
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.finished_monotonic: Optional[float] = None
+        self.result: Optional[ChatResponse] = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.done = asyncio.Event()
+
+    def finish(self, status: JobStatus):
+        self.status = status
+        self.finished_at = datetime.utcnow()
+        self.finished_monotonic = time.monotonic()
+        self.done.set()
+
+    def to_schema(self) -> ChatJob:
+        return ChatJob(
+            id=self.id,
+            status=self.status,
+            created_at=self.created_at.isoformat(),
+            started_at=self.started_at.isoformat() if self.started_at else None,
+            finished_at=self.finished_at.isoformat() if self.finished_at else None,
+            result=self.result,
+            error=self.error,
+            status_code=self.status_code,
+        )
+
+
+class JobManager:
+    """
+    Фоновые задачи чата
+
+    Задачи ставятся в ограниченную очередь и выполняются фиксированным числом
+    воркеров, поэтому долгие запросы (оркестрация) не держат HTTP соединение.
+    Результаты хранятся ttl_seconds после завершения и затем удаляются.
+    """
+
+    def __init__(self, workers: int, max_queue: int, ttl_seconds: float, cleanup_interval: float):
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self._jobs: Dict[str, Job] = {}
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+        self.expired = 0
+
+    async def start(self):
+        """Запускает воркеры и периодическую очистку"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+
+    async def stop(self):
+        """Останавливает воркеры; выполняющиеся задачи отменяются"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+    def submit(self, request: ChatRequest) -> Job:
+        """Ставит запрос в очередь или выбрасывает JobQueueFullError"""
+        job = Job(request)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.increment("jobs.rejected")
+            raise JobQueueFullError("Job queue is full")
+        self._jobs[job.id] = job
+        metrics.increment("jobs.submitted")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Long-poll: ждет завершения задачи не дольше timeout секунд"""
+        if timeout > 0 and not job.done.is_set():
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(job.done.wait(), timeout)
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """Отменяет задачу, если она еще не завершилась"""
+        if job.status in FINISHED_STATUSES:
+            return False
+        if job.task:
+            job.task.cancel()
+        else:
+            # Еще в очереди: воркер пропустит отмененную задачу
+            job.finish(JobStatus.CANCELLED)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {status.value: 0 for status in JobStatus}
+        for job in self._jobs.values():
+            counts[job.status.value] += 1
+        return {"queue_size": self._queue.qsize(), "jobs": counts, "expired": self.expired}
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == JobStatus.QUEUED:
+                    job.task = asyncio.create_task(self._run(job))
+                    try:
+                        await asyncio.wait({job.task})
+                    except asyncio.CancelledError:
+                        # Останавливается сам воркер
+                        job.task.cancel()
+                        raise
+                    if job.status not in FINISHED_STATUSES:
+                        # Задачу отменили через cancel()
+                        job.finish(JobStatus.CANCELLED)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.utcnow()
+        try:
+            async with AsyncSessionLocal() as db:
+                job.result = await chat_service.complete(db, job.request)
+            job.status_code = 200
+            job.finish(JobStatus.SUCCEEDED)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.error = str(e)
+            job.status_code = chat_service.error_status(e)
+            job.finish(JobStatus.FAILED)
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            self._remove_expired()
+
+    def _remove_expired(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_monotonic is not None and now - job.finished_monotonic > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.expired += len(expired)
+
+
+# Глобальный менеджер фоновых задач
+job_manager = JobManager(
+    workers=settings.JOBS.WORKERS,
+    max_queue=settings.JOBS.MAX_QUEUE,
+    ttl_seconds=settings.JOBS.TTL_SECONDS,
+    cleanup_interval=settings.JOBS.CLEANUP_INTERVAL,
+)
+metrics.register_collector("jobs", job_manager.stats)
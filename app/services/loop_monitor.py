@@ -0,0 +1,67 @@
+from typing import Any, Deque, Dict, Optional
+from collections import deque
+import asyncio
+import contextlib
+import time
+from app.config import settings
+from app.services.metrics import metrics
+
+
+class EventLoopMonitor:
+    """
+    Задержка цикла событий
+
+    Фоновая задача засыпает на interval секунд и измеряет, насколько позже
+    она проснулась. Рост задержки означает, что цикл занят синхронной работой
+    и все запросы процесса ждут своей очереди.
+    """
+
+    def __init__(self, interval: float, window: int):
+        self.interval = interval
+        self._lags: Deque[float] = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.EVENT_LOOP_MONITOR.ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        self._task = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._lags:
+            return None
+        ordered = sorted(self._lags)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "samples": len(self._lags),
+            "lag_p50_ms": ms(self.percentile(0.5)),
+            "lag_p99_ms": ms(self.percentile(0.99)),
+            "lag_max_ms": ms(self.max_lag),
+        }
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+
+# Глобальный монитор цикла событий
+loop_monitor = EventLoopMonitor(
+    interval=settings.EVENT_LOOP_MONITOR.INTERVAL,
+    window=settings.EVENT_LOOP_MONITOR.WINDOW,
+)
+metrics.register_collector("event_loop", loop_monitor.stats)
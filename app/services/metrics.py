@@ -0,0 +1,29 @@
+from typing import Any, Callable, Dict
+from collections import defaultdict
+
+
+class MetricsRegistry:
+    """Простой реестр метрик процесса: счетчики и снимки состояния сервисов"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._collectors: Dict[str, Callable[[], Any]] = {}
+
+    def increment(self, name: str, value: int = 1):
+        """Увеличивает счетчик"""
+        self.counters[name] += value
+
+    def register_collector(self, name: str, collector: Callable[[], Any]):
+        """Регистрирует функцию, возвращающую текущее состояние сервиса"""
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Возвращает текущие значения всех метрик"""
+        data = {"counters": dict(self.counters)}
+        for name, collector in self._collectors.items():
+            data[name] = collector()
+        return data
+
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
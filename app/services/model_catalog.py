@@ -0,0 +1,120 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextlib
+import hashlib
+import json
+import time
+from app.config import settings
+from app.models.schemas import ModelInfo
+from app.services.metrics import metrics
+from app.services.openrouter import openrouter_service
+
+
+class ModelCatalog:
+    """
+    Кеш каталога моделей OpenRouter
+
+    Каталог обновляется в фоне раз в ttl_seconds. Если данные устарели,
+    запрос получает старую версию, а обновление запускается в фоне
+    (stale-while-revalidate). Ждать приходится только самому первому запросу.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[List[ModelInfo]]], ttl_seconds: float):
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self._models: Optional[List[ModelInfo]] = None
+        self._models_by_id: Dict[str, ModelInfo] = {}
+        self._etag: Optional[str] = None
+        self._fetched_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.stale_served = 0
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._fetched_at > self.ttl_seconds
+
+    async def get_models(self) -> Tuple[List[ModelInfo], str]:
+        """Возвращает каталог и его ETag"""
+        if self._models is None:
+            await self._refresh()
+        elif self.is_stale:
+            self.stale_served += 1
+            self._schedule_refresh()
+        return self._models, self._etag
+
+    def get_model(self, model_id: str) -> Optional[ModelInfo]:
+        """Информация о модели из уже загруженного каталога (без запроса к OpenRouter)"""
+        return self._models_by_id.get(model_id)
+
+    async def start(self):
+        """Запускает периодическое фоновое обновление каталога"""
+        if settings.MODEL_CATALOG.BACKGROUND_REFRESH and self._background_task is None:
+            self._background_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Останавливает фоновое обновление"""
+        for task in (self._background_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._background_task = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "models": len(self._models or []),
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1) if self._models is not None else None,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "stale_served": self.stale_served,
+        }
+
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_quietly())
+
+    async def _refresh(self):
+        """Загружает каталог; параллельные вызовы ждут одну и ту же загрузку"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._load())
+        await asyncio.shield(self._refresh_task)
+
+    async def _refresh_quietly(self):
+        try:
+            await self._load()
+        except Exception as e:
+            # Продолжаем отдавать устаревший каталог
+            print(f"Ошибка обновления каталога моделей: {e}")
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self._refresh()
+            except Exception as e:
+                print(f"Ошибка обновления каталога моделей: {e}")
+            await asyncio.sleep(self.ttl_seconds)
+
+    async def _load(self):
+        try:
+            models = await self._fetch()
+        except Exception:
+            self.refresh_errors += 1
+            raise
+
+        payload = json.dumps([model.model_dump() for model in models], sort_keys=True, default=str)
+        self._models = models
+        self._models_by_id = {model.id: model for model in models}
+        self._etag = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+        self._fetched_at = time.monotonic()
+        self.refreshes += 1
+
+
+# Глобальный каталог моделей
+model_catalog = ModelCatalog(
+    fetch=openrouter_service.get_models,
+    ttl_seconds=settings.MODEL_CATALOG.TTL_SECONDS,
+)
+metrics.register_collector("model_catalog", model_catalog.stats)
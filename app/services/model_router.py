@@ -0,0 +1,169 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict, defaultdict, deque
+import time
+from app.config import settings
+from app.models.schemas import ChatMessage
+from app.services.metrics import metrics
+from app.services.model_catalog import model_catalog
+from app.services.model_stats import model_stats
+from app.services.openrouter import openrouter_service
+from app.services.tokens import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+# Модель агента, которую выбирает роутер (агенты с model: null при включенной маршрутизации)
+AUTO_MODEL = "auto"
+
+ROUTING_POLICIES = ("fastest", "cheapest", "sticky")
+
+
+def default_agent_model() -> str:
+    """Модель для агента без явно заданной модели"""
+    if settings.ASSISTANT.ROUTING.ENABLED:
+        return AUTO_MODEL
+    return settings.ASSISTANT.DEFAULT_MODEL
+
+
+def _price(model_id: str, key: str) -> Optional[float]:
+    model = model_catalog.get_model(model_id)
+    if not model or not model.pricing or model.pricing.get(key) is None:
+        return None
+    try:
+        return float(model.pricing[key])
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelRouter:
+    """
+    Выбор модели для агентов с model "auto"
+
+    Кандидаты - ALLOWED_MODELS, в контекст которых помещается запрос и чей
+    circuit breaker не разомкнут. Среди них выбирается лучшая по политике:
+    - fastest: минимальное ожидаемое время до успешного ответа
+      (EWMA задержки с поправкой на EWMA долю ошибок). Задержка модели
+      приводится к общей ожидаемой длине ответа по ее EWMA скорости
+      генерации (токены/сек), поэтому модель, которая обычно отвечает
+      длинно, не проигрывает из-за длины своих ответов;
+    - cheapest: минимальная стоимость запроса по ценам каталога
+      (с той же поправкой на ошибки), при равенстве - быстрейшая;
+    - sticky: модель закрепляется за диалогом, пока она доступна и подходит.
+    """
+
+    def __init__(self, policy: str, sticky_max_conversations: int):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown routing policy '{policy}', expected one of {ROUTING_POLICIES}")
+        self.policy = policy
+        self.sticky_max_conversations = sticky_max_conversations
+        self._sticky: "OrderedDict[str, str]" = OrderedDict()
+        self.decisions: Dict[str, int] = defaultdict(int)
+        self.no_candidates = 0
+        self._recent = deque(maxlen=20)
+
+    def select(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: Optional[int],
+        conversation_key: Optional[str] = None,
+        policy: Optional[str] = None
+    ) -> str:
+        """Выбирает модель для запроса"""
+        policy = policy or self.policy
+        prompt_tokens = sum(estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+        required_context = prompt_tokens + (max_tokens or 0)
+
+        candidates = [
+            model for model in settings.ASSISTANT.ALLOWED_MODELS
+            if self._fits(model, required_context) and openrouter_service.breakers.is_available(model)
+        ]
+        if not candidates:
+            # Ни одна модель не подходит - пусть ошибку вернет дефолтная модель
+            self.no_candidates += 1
+            return self._record(settings.ASSISTANT.DEFAULT_MODEL, policy, "no_candidates")
+
+        if policy == "sticky" and conversation_key:
+            pinned = self._sticky.get(conversation_key)
+            if pinned in candidates:
+                self._sticky.move_to_end(conversation_key)
+                return self._record(pinned, policy, "pinned")
+
+        completion_tokens = self._expected_completion_tokens(candidates, max_tokens)
+        if policy == "cheapest":
+            model = min(candidates, key=lambda m: (
+                self._expected_cost(m, prompt_tokens, max_tokens),
+                self._expected_latency(m, completion_tokens),
+            ))
+        else:
+            model = min(candidates, key=lambda m: self._expected_latency(m, completion_tokens))
+
+        if policy == "sticky" and conversation_key:
+            self._pin(conversation_key, model)
+        return self._record(model, policy, "selected")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "decisions": dict(self.decisions),
+            "no_candidates": self.no_candidates,
+            "sticky_conversations": len(self._sticky),
+            "recent": list(self._recent),
+        }
+
+    def _fits(self, model: str, required_context: int) -> bool:
+        info = model_catalog.get_model(model)
+        if not info or not info.context_length:
+            # Размер контекста неизвестен (каталог еще не загружен) - не исключаем модель
+            return True
+        return info.context_length >= required_context
+
+    def _success_rate(self, model: str) -> float:
+        health = model_stats.health(model)
+        return max(0.05, 1.0 - health.error_rate) if health else 1.0
+
+    def _expected_completion_tokens(self, candidates: List[str], max_tokens: Optional[int]) -> Optional[float]:
+        """Общая для кандидатов ожидаемая длина ответа: среднее EWMA длин ответов моделей"""
+        lengths = [
+            health.completion_tokens for health in map(model_stats.health, candidates)
+            if health and health.completion_tokens is not None
+        ]
+        if not lengths:
+            return None
+        expected = sum(lengths) / len(lengths)
+        return min(expected, max_tokens) if max_tokens else expected
+
+    def _expected_latency(self, model: str, completion_tokens: Optional[float] = None) -> float:
+        health = model_stats.health(model)
+        if not health or health.latency is None:
+            # Модель без замеров пробуем первой, чтобы получить статистику
+            return 0.0
+        latency = health.latency
+        if completion_tokens is not None and health.tokens_per_second and health.completion_tokens is not None:
+            # Задержка при ответе ожидаемой длины вместо обычной длины ответов этой модели
+            latency = max(0.0, latency + (completion_tokens - health.completion_tokens) / health.tokens_per_second)
+        return latency / self._success_rate(model)
+
+    def _expected_cost(self, model: str, prompt_tokens: int, max_tokens: Optional[int]) -> float:
+        prompt_price = _price(model, "prompt")
+        completion_price = _price(model, "completion")
+        if prompt_price is None or completion_price is None:
+            return float("inf")
+        cost = prompt_price * prompt_tokens + completion_price * (max_tokens or 0)
+        return cost / self._success_rate(model)
+
+    def _pin(self, conversation_key: str, model: str):
+        self._sticky[conversation_key] = model
+        self._sticky.move_to_end(conversation_key)
+        while len(self._sticky) > self.sticky_max_conversations:
+            self._sticky.popitem(last=False)
+
+    def _record(self, model: str, policy: str, reason: str) -> str:
+        self.decisions[model] += 1
+        metrics.increment(f"routing.{policy}.{model}")
+        self._recent.append({"model": model, "policy": policy, "reason": reason, "at": round(time.time(), 3)})
+        return model
+
+
+# Глобальный роутер моделей
+model_router = ModelRouter(
+    policy=settings.ASSISTANT.ROUTING.POLICY,
+    sticky_max_conversations=settings.ASSISTANT.ROUTING.STICKY_MAX_CONVERSATIONS,
+)
+metrics.register_collector("model_router", model_router.stats)
@@ -0,0 +1,101 @@
+from typing import Any, Deque, Dict, Optional
+from collections import defaultdict, deque
+from app.config import settings
+
+
+class ModelHealth:
+    """Экспоненциально сглаженные (EWMA) задержка, скорость генерации и доля ошибок модели"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        self.completion_tokens: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def _smooth(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.alpha * (value - current)
+
+    def record_success(self, latency: float, completion_tokens: Optional[int]):
+        self.requests += 1
+        self.latency = self._smooth(self.latency, latency)
+        if completion_tokens and latency > 0:
+            self.tokens_per_second = self._smooth(self.tokens_per_second, completion_tokens / latency)
+            self.completion_tokens = self._smooth(self.completion_tokens, completion_tokens)
+        self.error_rate = self._smooth(self.error_rate, 0.0)
+
+    def record_error(self):
+        self.requests += 1
+        self.errors += 1
+        self.error_rate = self._smooth(self.error_rate, 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "latency_ewma": round(self.latency, 3) if self.latency is not None else None,
+            "tokens_per_second_ewma": round(self.tokens_per_second, 1) if self.tokens_per_second is not None else None,
+            "completion_tokens_ewma": round(self.completion_tokens, 1) if self.completion_tokens is not None else None,
+            "error_rate_ewma": round(self.error_rate, 3),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class ModelStats:
+    """Скользящие окна задержек и EWMA показатели ответов по моделям"""
+
+    def __init__(self, window: int = 200, ewma_alpha: float = 0.2):
+        self.window = window
+        self.ewma_alpha = ewma_alpha
+        # Полное время ответа (обычные запросы) и время до первого токена (стриминг)
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._ttfb: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._health: Dict[str, ModelHealth] = {}
+
+    def health(self, model: str) -> Optional[ModelHealth]:
+        """EWMA показатели модели или None, если запросов к ней еще не было"""
+        return self._health.get(model)
+
+    def record_latency(self, model: str, seconds: float, completion_tokens: Optional[int] = None):
+        """Учитывает успешный ответ модели"""
+        self._latencies[model].append(seconds)
+        self._get_health(model).record_success(seconds, completion_tokens)
+
+    def record_ttfb(self, model: str, seconds: float):
+        self._ttfb[model].append(seconds)
+
+    def record_error(self, model: str):
+        """Учитывает неудачный запрос к модели"""
+        self._get_health(model).record_error()
+
+    def percentile(self, model: str, q: float, first_byte: bool = False, min_samples: int = 1) -> Optional[float]:
+        """Перцентиль q (0..1) задержки модели или None, если замеров меньше min_samples"""
+        samples = (self._ttfb if first_byte else self._latencies).get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        models = set(self._latencies) | set(self._ttfb) | set(self._health)
+        return {
+            model: {
+                "samples": len(self._latencies.get(model, ())),
+                "latency_p50": self.percentile(model, 0.5),
+                "latency_p95": self.percentile(model, 0.95),
+                "ttfb_p95": self.percentile(model, 0.95, first_byte=True),
+                **(self._health[model].stats() if model in self._health else {}),
+            }
+            for model in models
+        }
+
+    def _get_health(self, model: str) -> ModelHealth:
+        if model not in self._health:
+            self._health[model] = ModelHealth(self.ewma_alpha)
+        return self._health[model]
+
+
+# Глобальная статистика моделей
+model_stats = ModelStats(ewma_alpha=settings.ASSISTANT.ROUTING.EWMA_ALPHA)
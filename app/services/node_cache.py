@@ -0,0 +1,81 @@
+from typing import Any, Dict, List, Optional, Set
+import hashlib
+from app.config import settings
+from app.models.schemas import Agent, ChatMessage
+from app.services.metrics import metrics
+from app.services.response_cache import ResponseCache
+
+
+def agent_version(agent: Agent) -> str:
+    """Версия агента: хеш конфигурации (без даты создания)"""
+    raw = agent.model_dump_json(exclude={"created_at"})
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class NodeOutputCache:
+    """
+    Кеш выводов узлов конвейера оркестрации по содержимому входа
+
+    Ключ - id и версия агента, модель, параметры генерации и входные сообщения,
+    поэтому повторный запуск конвейера (или повтор после ошибки одного из узлов)
+    берет готовые выводы неизменившихся узлов и заново выполняет только узлы,
+    вход которых изменился. Записи вытесняются по LRU/TTL, при изменении
+    агента его записи удаляются (invalidate_agent).
+    """
+
+    def __init__(self, enabled: bool, max_bytes: int, ttl_seconds: float):
+        self.enabled = enabled
+        self.cache = ResponseCache(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        # Ключи записей по агентам - для инвалидации при обновлении агента
+        self._agent_keys: Dict[str, Set[str]] = {}
+        self.invalidations = 0
+
+    def make_key(self, agent: Agent, model: str, messages: List[ChatMessage]) -> str:
+        return ResponseCache.make_key({
+            "agent": agent.id,
+            "version": agent_version(agent),
+            "model": model,
+            "temperature": agent.temperature,
+            "max_tokens": agent.max_tokens,
+            "messages": [message.model_dump(mode="json") for message in messages],
+        })
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        metrics.increment("pipeline_node_cache_hits")
+        return dict(cached)
+
+    def set(self, agent_id: str, key: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        self.cache.set(key, value)
+        keys = self._agent_keys.setdefault(agent_id, set())
+        keys.add(key)
+        # Вытесненные кешем ключи убираем из индекса, чтобы он не рос
+        if len(keys) > len(self.cache):
+            self._agent_keys[agent_id] = {k for k in keys if k in self.cache}
+
+    def invalidate_agent(self, agent_id: str):
+        """Удаляет выводы агента (конфигурация агента изменилась или агент удален)"""
+        keys = self._agent_keys.pop(agent_id, set())
+        for key in keys:
+            self.cache.invalidate(key)
+        if keys:
+            self.invalidations += 1
+            print(f"🧹 Pipeline node cache: dropped {len(keys)} outputs of agent {agent_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), "enabled": self.enabled, "invalidations": self.invalidations}
+
+
+# Глобальный кеш выводов узлов конвейеров
+node_output_cache = NodeOutputCache(
+    enabled=settings.PIPELINES.CACHE_ENABLED,
+    max_bytes=settings.PIPELINES.CACHE_MAX_BYTES,
+    ttl_seconds=settings.PIPELINES.CACHE_TTL_SECONDS,
+)
+metrics.register_collector("pipeline_node_cache", node_output_cache.stats)
@@ -1,35 +1,113 @@
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Any, Optional, Tuple
+import asyncio
+import time
+import httpx
+import openai
+from openai import AsyncOpenAI
 from app.config import settings
 from app.models.schemas import ChatMessage, ModelInfo
+from app.services.metrics import metrics
+from app.services.response_cache import ResponseCache
+from app.services.single_flight import SingleFlight
+from app.services.rate_limiter import RateLimiter
+from app.services.tokens import cached_prompt_tokens, estimate_messages_tokens, estimate_tokens
+from app.services.model_stats import model_stats
+from app.services.resilience import (
+    CircuitBreakerRegistry,
+    RetryBudget,
+    RetryPolicy,
+    UpstreamError,
+    classify_error,
+)
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """Создает общий пул HTTP соединений к OpenRouter"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.OPENROUTER.MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENROUTER.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENROUTER.KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.OPENROUTER.CONNECT_TIMEOUT,
+            read=settings.OPENROUTER.READ_TIMEOUT,
+            write=settings.OPENROUTER.WRITE_TIMEOUT,
+            pool=settings.OPENROUTER.POOL_TIMEOUT,
+        ),
+    )
 
 
 class OpenRouterService:
     """Сервис для работы с OpenRouter API"""
-    
+
     def __init__(self):
-        self.client = OpenAI(
+        # Асинхронный клиент не блокирует event loop во время запроса к LLM,
+        # все запросы воркера идут через один пул соединений с keep-alive
+        self.http_client = _build_http_client()
+        self.client = AsyncOpenAI(
             base_url=settings.OPENROUTER.BASE_URL,
             api_key=settings.OPEN_ROUTER_API_KEY,
+            http_client=self.http_client,
+            # Повторы выполняем сами, с учетом бюджета и circuit breaker'ов
+            max_retries=0,
         )
-    
-    async def chat_completion(
-        self, 
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.OPENROUTER.RETRY.MAX_ATTEMPTS,
+            base_delay=settings.OPENROUTER.RETRY.BASE_DELAY,
+            max_delay=settings.OPENROUTER.RETRY.MAX_DELAY,
+            max_retry_after=settings.OPENROUTER.RETRY.MAX_RETRY_AFTER,
+        )
+        self.retry_budget = RetryBudget(
+            ratio=settings.OPENROUTER.RETRY.BUDGET_RATIO,
+            max_tokens=settings.OPENROUTER.RETRY.BUDGET_MAX_TOKENS,
+        )
+        self.breakers = CircuitBreakerRegistry(
+            failure_threshold=settings.OPENROUTER.CIRCUIT_BREAKER.FAILURE_THRESHOLD,
+            reset_timeout=settings.OPENROUTER.CIRCUIT_BREAKER.RESET_TIMEOUT,
+        )
+        self.rate_limiter = RateLimiter(
+            enabled=settings.RATE_LIMITS.ENABLED,
+            default_limits={
+                "requests_per_minute": settings.RATE_LIMITS.DEFAULT_REQUESTS_PER_MINUTE,
+                "tokens_per_minute": settings.RATE_LIMITS.DEFAULT_TOKENS_PER_MINUTE,
+            },
+            model_limits={limits["model"]: limits for limits in settings.RATE_LIMITS.MODELS},
+            max_queue=settings.RATE_LIMITS.MAX_QUEUE,
+            max_wait=settings.RATE_LIMITS.MAX_WAIT,
+        )
+        metrics.register_collector("retry_budget", self.retry_budget.stats)
+        metrics.register_collector("rate_limits", self.rate_limiter.stats)
+        metrics.register_collector("model_latency", model_stats.stats)
+        metrics.register_collector("circuit_breakers", self.breakers.stats)
+        self.response_cache = ResponseCache(
+            max_bytes=settings.RESPONSE_CACHE.MAX_BYTES,
+            ttl_seconds=settings.RESPONSE_CACHE.TTL_SECONDS,
+        )
+        metrics.register_collector("response_cache", self.response_cache.stats)
+        # Одинаковые параллельные запросы отправляются в OpenRouter один раз
+        self.single_flight = SingleFlight()
+        metrics.register_collector("single_flight", self.single_flight.stats)
+
+    async def close(self):
+        """Закрывает пул соединений (вызывается при остановке приложения)"""
+        await self.http_client.aclose()
+
+    def _build_params(
+        self,
         messages: List[ChatMessage],
         model: str = None,
         temperature: float = None,
         max_tokens: int = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """
-        Отправляет запрос на генерацию текста
-        """
+        """Собирает параметры запроса к OpenAI-совместимому API"""
         # Подготовка сообщений для OpenAI API
         openai_messages = [
-            {"role": msg.role.value, "content": msg.content} 
+            {"role": msg.role.value, "content": msg.content}
             for msg in messages
         ]
-        
+
         # Параметры запроса
         params = {
             "model": model or settings.ASSISTANT.DEFAULT_MODEL,
@@ -40,36 +118,452 @@ class OpenRouterService:
             },
             "extra_body": {},
         }
-        
+
         # Добавляем опциональные параметры
         if temperature is not None:
             params["temperature"] = temperature
         if max_tokens is not None:
             params["max_tokens"] = max_tokens
-            
+
         # Добавляем дополнительные параметры
         params.update(kwargs)
-        
+        return params
+
+    def _with_cache_control(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Добавляет cache_control к начальным системным сообщениям для моделей,
+        которым нужна явная разметка кешируемого префикса (Anthropic, Gemini)
+        """
+        prompt_cache = settings.OPENROUTER.PROMPT_CACHE
+        model = params["model"]
+        if not prompt_cache.ENABLED or not any(model.startswith(prefix) for prefix in prompt_cache.CACHE_CONTROL_MODELS):
+            return params
+
+        messages = list(params["messages"])
+        prefix_tokens = 0
+        for index, message in enumerate(messages):
+            if message["role"] != "system" or not isinstance(message["content"], str):
+                break
+            prefix_tokens += estimate_tokens(message["content"])
+            if prefix_tokens < prompt_cache.MIN_TOKENS:
+                continue
+            messages[index] = {
+                "role": "system",
+                "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}],
+            }
+        return {**params, "messages": messages}
+
+    def _record_usage(self, usage: Optional[Dict[str, Any]]):
+        """Учитывает токены промпта и долю, прочитанную из кеша провайдера"""
+        if not usage:
+            return
+        metrics.increment("prompt_tokens", usage.get("prompt_tokens") or 0)
+        metrics.increment("cached_prompt_tokens", cached_prompt_tokens(usage) or 0)
+
+    def _request_key(self, params: Dict[str, Any]) -> str:
+        """Ключ запроса: модель, нормализованные сообщения и параметры генерации"""
+        payload = {k: v for k, v in params.items() if k not in ("messages", "extra_headers")}
+        payload["messages"] = [
+            {"role": msg["role"], "content": msg["content"].strip()}
+            for msg in params["messages"]
+        ]
+        return ResponseCache.make_key(payload)
+
+    def _should_cache(self, params: Dict[str, Any], cache: Optional[bool]) -> bool:
+        """По умолчанию кешируются только детерминированные запросы (temperature 0)"""
+        if not settings.RESPONSE_CACHE.ENABLED:
+            return False
+        if cache is not None:
+            return cache
+        return params.get("temperature") == 0
+
+    def _model_chain(self, model: Optional[str], fallback_models: Optional[List[str]]) -> List[str]:
+        """Основная модель и следующие за ней запасные (без повторов)"""
+        chain = [model or settings.ASSISTANT.DEFAULT_MODEL]
+        for fallback in fallback_models or []:
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def _hedge_delay(self, model: str, first_byte: bool) -> float:
+        """Сколько ждать ответа модели, прежде чем отправить hedge запрос следующей"""
+        hedging = settings.ASSISTANT.HEDGING
+        observed = model_stats.percentile(
+            model, hedging.PERCENTILE, first_byte=first_byte, min_samples=hedging.MIN_SAMPLES
+        )
+        return max(hedging.MIN_DELAY, observed if observed is not None else hedging.DEFAULT_DELAY)
+
+    async def _run_hedged(
+        self,
+        models: List[str],
+        make_call: Callable[[str], Awaitable[Any]],
+        first_byte: bool = False
+    ) -> Tuple[str, Any]:
+        """
+        Выполняет запрос по цепочке моделей
+
+        Если модель не ответила за p95 своей задержки, параллельно отправляется
+        hedge запрос следующей модели; при ошибке следующая модель запрашивается сразу.
+        Побеждает первый успешный ответ, остальные запросы отменяются.
+
+        Returns:
+            Tuple[model, result]: модель из цепочки, которая ответила, и ее результат
+        """
+        tasks: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            nonlocal next_index
+            model = models[next_index]
+            next_index += 1
+            tasks[asyncio.ensure_future(make_call(model))] = model
+
+        launch()
+        try:
+            while tasks:
+                timeout = None
+                if next_index < len(models) and settings.ASSISTANT.HEDGING.ENABLED:
+                    timeout = self._hedge_delay(models[next_index - 1], first_byte)
+
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.increment("hedged_requests")
+                    launch()
+                    continue
+
+                for task in done:
+                    model = tasks.pop(task)
+                    if task.exception() is None:
+                        if model != models[0]:
+                            metrics.increment("fallback_wins")
+                        return model, task.result()
+                    last_error = task.exception()
+
+                if not tasks and next_index < len(models):
+                    metrics.increment("fallback_requests")
+                    launch()
+
+            raise last_error
+        finally:
+            # Проигравшие запросы больше не нужны
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def chat_completion(
+        self,
+        messages: List[ChatMessage],
+        model: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        cache: Optional[bool] = None,
+        coalesce: bool = True,
+        fallback_models: Optional[List[str]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Отправляет запрос на генерацию текста
+
+        cache: True/False - принудительно включить/выключить кеш ответов,
+        None - кешировать только при temperature 0
+        coalesce: объединять одинаковые параллельные запросы в один вызов OpenRouter
+        fallback_models: запасные модели для hedge запросов и ошибок основной модели;
+        поле model результата - модель, которая фактически ответила
+        """
+        chain = self._model_chain(model, fallback_models)
+        if len(chain) == 1:
+            return await self._single_completion(messages, chain[0], temperature, max_tokens, cache, coalesce, **kwargs)
+
+        _, result = await self._run_hedged(
+            chain,
+            lambda chain_model: self._single_completion(
+                messages, chain_model, temperature, max_tokens, cache, coalesce, **kwargs
+            ),
+        )
+        return result
+
+    async def _single_completion(
+        self,
+        messages: List[ChatMessage],
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        cache: Optional[bool],
+        coalesce: bool,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Запрос к одной модели через кеш ответов и объединение одинаковых запросов"""
+        params = self._build_params(messages, model, temperature, max_tokens, **kwargs)
+        request_key = self._request_key(params)
+
+        use_cache = self._should_cache(params, cache)
+        if use_cache:
+            cached = self.response_cache.get(request_key)
+            if cached is not None:
+                return dict(cached)
+
+        async def call() -> Dict[str, Any]:
+            result = await self._create_completion(params)
+            # Обрезанные и пустые ответы не кешируем
+            if use_cache and result["message"] and result["finish_reason"] != "length":
+                self.response_cache.set(request_key, result)
+            return result
+
+        if coalesce and settings.OPENROUTER.COALESCE_REQUESTS:
+            result = await self.single_flight.do(request_key, call)
+        else:
+            result = await call()
+        return dict(result)
+
+    def _estimate_request_tokens(self, params: Dict[str, Any]) -> int:
+        """Оценка токенов запроса для лимита TPM: промпт плюс максимум ответа"""
+        return estimate_messages_tokens(params["messages"]) + (params.get("max_tokens") or 0)
+
+    async def _call_with_retries(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        model: Optional[str] = None,
+        estimated_tokens: int = 0
+    ) -> Any:
+        """
+        Выполняет запрос к OpenRouter с повторами
+
+        Повторяются только 429, 5xx и сетевые ошибки: с экспоненциальной задержкой
+        и джиттером, с учетом Retry-After и в пределах общего бюджета повторов.
+        Если model указана, каждая попытка ждет клиентского лимита модели
+        и проходит через circuit breaker этой модели.
+        """
+        breaker = self.breakers.get(model) if model else None
+        limiter = self.rate_limiter.get(model, self.client.api_key) if model else None
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            # Breaker проверяется до очереди лимита: запрос к недоступной модели
+            # отклоняется сразу, не ожидая в очереди и не тратя токены лимита
+            if breaker:
+                breaker.before_call()
+            if limiter:
+                try:
+                    await limiter.acquire(estimated_tokens)
+                except BaseException:
+                    if breaker:
+                        breaker.release()
+                    raise
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                if breaker:
+                    breaker.release()
+                raise
+            except Exception as e:
+                error_info = classify_error(e)
+                if limiter and isinstance(e, openai.APIStatusError):
+                    limiter.update_from_headers(e.response.headers)
+                    if e.status_code == 429 and error_info["retry_after"]:
+                        limiter.block_for(error_info["retry_after"])
+                if breaker:
+                    if error_info["breaker_failure"]:
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+
+                delay = None
+                if error_info["retryable"] and attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.get_delay(attempt, error_info["retry_after"])
+                if delay is None or not self.retry_budget.try_spend():
+                    if model:
+                        model_stats.record_error(model)
+                    raise UpstreamError(
+                        f"OpenRouter API error: {str(e)}",
+                        status_code=error_info["status_code"],
+                        retry_after=error_info["retry_after"],
+                    ) from e
+
+                metrics.increment("upstream_retries")
+                await asyncio.sleep(delay)
+                continue
+
+            if breaker:
+                breaker.record_success()
+            if limiter:
+                limiter.update_from_headers(getattr(result, "headers", None))
+            return result
+
+    async def _create_completion(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняет запрос к OpenRouter"""
+        estimated_tokens = self._estimate_request_tokens(params)
+        started_at = time.monotonic()
+        # Сырой ответ нужен, чтобы прочитать заголовки лимитов провайдера
+        request_params = self._with_cache_control(params)
+        response = await self._call_with_retries(
+            lambda: self.client.chat.completions.with_raw_response.create(**request_params),
+            model=params["model"],
+            estimated_tokens=estimated_tokens,
+        )
+        completion = response.parse()
+        model_stats.record_latency(
+            params["model"],
+            time.monotonic() - started_at,
+            completion.usage.completion_tokens if completion.usage else None,
+        )
+
+        limiter = self.rate_limiter.get(params["model"], self.client.api_key)
+        if limiter and completion.usage:
+            limiter.reconcile(estimated_tokens, completion.usage.total_tokens)
+
+        usage = completion.usage.model_dump() if completion.usage else None
+        self._record_usage(usage)
         try:
-            completion = self.client.chat.completions.create(**params)
-            
             return {
                 "message": completion.choices[0].message.content,
                 "model": completion.model,
-                "usage": completion.usage.model_dump() if completion.usage else None,
+                "usage": usage,
                 "finish_reason": completion.choices[0].finish_reason
             }
+        except (AttributeError, IndexError) as e:
+            raise UpstreamError(f"OpenRouter API error: malformed response ({str(e)})") from e
+
+    async def chat_completion_stream(
+        self,
+        messages: List[ChatMessage],
+        model: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        cache: Optional[bool] = None,
+        fallback_models: Optional[List[str]] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковая генерация текста.
+
+        Отдает события {"type": "token", "content": ...} по мере поступления токенов
+        и в конце одно событие {"type": "done", ...} с тем же набором полей,
+        что возвращает chat_completion. Ответ из кеша отдается одним токеном.
+        С fallback_models hedge запрос отправляется, если основная модель
+        не прислала первый токен за p95 своего времени до первого токена.
+        """
+        chain = self._model_chain(model, fallback_models)
+        if len(chain) == 1:
+            async for event in self._single_stream(messages, chain[0], temperature, max_tokens, cache, **kwargs):
+                yield event
+            return
+
+        streams: Dict[str, AsyncIterator[Dict[str, Any]]] = {}
+
+        async def first_event(chain_model: str) -> Dict[str, Any]:
+            streams[chain_model] = self._single_stream(
+                messages, chain_model, temperature, max_tokens, cache, **kwargs
+            )
+            return await streams[chain_model].__anext__()
+
+        winner, event = await self._run_hedged(chain, first_event, first_byte=True)
+        for chain_model, stream in streams.items():
+            if chain_model != winner:
+                await stream.aclose()
+
+        try:
+            yield event
+            async for event in streams[winner]:
+                yield event
+        finally:
+            await streams[winner].aclose()
+
+    async def _single_stream(
+        self,
+        messages: List[ChatMessage],
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        cache: Optional[bool],
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Потоковый запрос к одной модели"""
+        params = self._build_params(messages, model, temperature, max_tokens, **kwargs)
+
+        cache_key = None
+        if self._should_cache(params, cache):
+            cache_key = self._request_key(params)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield {"type": "token", "content": cached["message"]}
+                yield {"type": "done", **cached}
+                return
+
+        params["stream"] = True
+        # Просим OpenRouter прислать usage в последнем чанке потока
+        params["extra_body"]["usage"] = {"include": True}
+
+        estimated_tokens = self._estimate_request_tokens(params)
+        started_at = time.monotonic()
+        request_params = self._with_cache_control(params)
+        response = await self._call_with_retries(
+            lambda: self.client.chat.completions.with_raw_response.create(**request_params),
+            model=params["model"],
+            estimated_tokens=estimated_tokens,
+        )
+        stream = response.parse()
+
+        content_parts = []
+        result_model = params["model"]
+        usage = None
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                result_model = chunk.model or result_model
+                chunk_usage = getattr(chunk, "usage", None)
+                if chunk_usage:
+                    usage = chunk_usage if isinstance(chunk_usage, dict) else chunk_usage.model_dump()
+                if not chunk.choices:
+                    continue
+
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    if not content_parts:
+                        model_stats.record_ttfb(params["model"], time.monotonic() - started_at)
+                    content_parts.append(delta)
+                    yield {"type": "token", "content": delta}
         except Exception as e:
-            raise Exception(f"OpenRouter API error: {str(e)}")
-    
+            # Обрыв посреди потока не повторяем: часть токенов уже отдана клиенту
+            model_stats.record_error(params["model"])
+            raise UpstreamError(f"OpenRouter API error: {str(e)}") from e
+        finally:
+            # Закрываем ответ, чтобы соединение вернулось в пул даже при отмене
+            await stream.response.aclose()
+
+        model_stats.record_latency(
+            params["model"],
+            time.monotonic() - started_at,
+            usage.get("completion_tokens") if usage else None,
+        )
+        limiter = self.rate_limiter.get(params["model"], self.client.api_key)
+        if limiter and usage:
+            limiter.reconcile(estimated_tokens, usage.get("total_tokens"))
+        self._record_usage(usage)
+
+        result = {
+            "message": "".join(content_parts),
+            "model": result_model,
+            "usage": usage,
+            "finish_reason": finish_reason
+        }
+        if cache_key and result["message"] and result["finish_reason"] != "length":
+            self.response_cache.set(cache_key, result)
+        yield {"type": "done", **result}
+
     async def get_models(self) -> List[ModelInfo]:
         """
         Получает список доступных моделей
         """
         try:
             # OpenRouter API endpoint для получения моделей
-            models = self.client.models.list()
-            
+            models = await self._call_with_retries(lambda: self.client.models.list())
+
             model_list = []
             for model in models.data:
                 model_info = ModelInfo(
@@ -77,13 +571,16 @@ class OpenRouterService:
                     name=getattr(model, 'name', model.id),
                     description=getattr(model, 'description', None),
                     context_length=getattr(model, 'context_length', None),
+                    pricing=getattr(model, 'pricing', None),
                 )
                 model_list.append(model_info)
-            
+
             return model_list
+        except UpstreamError:
+            raise
         except Exception as e:
             raise Exception(f"Failed to fetch models: {str(e)}")
 
 
 # Глобальный экземпляр сервиса
-openrouter_service = OpenRouterService()
\ No newline at end of file
+openrouter_service = OpenRouterService()
@@ -0,0 +1,82 @@
+from typing import Any, Dict, Optional
+import json
+
+_INVALID = object()
+
+
+class PartialJSONParser:
+    """
+    Инкрементальный разбор JSON объекта, который модель генерирует по частям
+
+    Текст подается фрагментами (feed), парсер отдает поля верхнего уровня,
+    значения которых уже полностью сгенерированы, не дожидаясь конца ответа.
+    Текст до первой "{" (пояснения, ```json) пропускается.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Добавляет фрагмент ответа и возвращает поля, завершенные этим фрагментом"""
+        self._buffer += chunk
+        completed: Dict[str, Any] = {}
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.complete:
+            char = buffer[self._pos]
+            if self._depth == 0:
+                # Текст до корневого объекта пропускаем
+                if char == "{":
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        # Закрылась строка ключа
+                        key = self._decode(buffer[self._string_start:self._pos + 1])
+                        self._key = key if isinstance(key, str) else None
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_value(buffer, completed)
+                    self.complete = True
+            elif self._depth == 1:
+                if char == ":" and self._key is not None:
+                    self._value_start = self._pos + 1
+                elif char == ",":
+                    self._complete_value(buffer, completed)
+            self._pos += 1
+        return completed
+
+    def _complete_value(self, buffer: str, completed: Dict[str, Any]):
+        if self._key is not None and self._value_start is not None:
+            value = self._decode(buffer[self._value_start:self._pos])
+            if value is not _INVALID:
+                self.fields[self._key] = value
+                completed[self._key] = value
+        self._key = None
+        self._value_start = None
+
+    @staticmethod
+    def _decode(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except ValueError:
+            return _INVALID
@@ -0,0 +1,347 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+import asyncio
+import contextlib
+import json
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.schemas import Agent, ChatMessage, Pipeline, PipelineNode, ResponseFormatType, PIPELINE_REFERENCE
+from app.services.agent import agent_service
+from app.services.metrics import metrics
+from app.services.node_cache import node_output_cache
+from app.services.openrouter import openrouter_service
+from app.services.partial_json import PartialJSONParser
+from app.services.resilience import UpstreamError
+from app.services.response_format import response_format_service
+
+
+class PipelineError(Exception):
+    """Ошибка выполнения конвейера оркестрации"""
+
+
+def format_output(value: Any) -> str:
+    """Вывод узла как текст для сообщения следующему агенту"""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def required_fields(node: PipelineNode) -> Dict[str, Optional[Set[str]]]:
+    """Какие поля вывода каждой зависимости нужны узлу (None - нужен весь вывод)"""
+    if node.input is None:
+        return {dep: None for dep in node.depends_on}
+    fields: Dict[str, Optional[Set[str]]] = {dep: set() for dep in node.depends_on}
+    for name, field in PIPELINE_REFERENCE.findall(node.input):
+        if name == "message":
+            continue
+        if field and fields[name] is not None:
+            fields[name].add(field)
+        else:
+            fields[name] = None
+    # Зависимость без ссылок во входе задает только порядок выполнения
+    return {dep: dep_fields or None for dep, dep_fields in fields.items()}
+
+
+class _NodeProgress:
+    """Поля JSON вывода узла по мере генерации"""
+
+    def __init__(self):
+        self.parser = PartialJSONParser()
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def feed(self, chunk: str):
+        if self.parser.feed(chunk):
+            self._notify()
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    async def wait_fields(self, fields: Set[str]) -> bool:
+        """Ждет полей; False - узел завершился раньше, чем они появились в потоке"""
+        while not self.closed:
+            if fields <= self.parser.fields.keys():
+                return True
+            await self._changed.wait()
+        return False
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class PipelineExecutor:
+    """
+    Выполняет конвейер агента-оркестратора
+
+    Каждый узел запускается, как только готовы все его зависимости, поэтому
+    независимые узлы идут параллельно и уровень DAG занимает время самого
+    медленного узла, а не сумму. У каждого узла свой таймаут; ошибка узла
+    отменяет остальные и завершает конвейер. В потоковом режиме (run_stream)
+    узлы стримят ответы моделей и отдают события по ходу выполнения.
+
+    В режиме pipelined ответ узла, от которого зависимым нужны только отдельные
+    поля, стримится через инкрементальный JSON парсер, и зависимый узел
+    запускается, как только эти поля готовы: вызовы моделей перекрываются.
+
+    Выводы узлов кешируются по содержимому входа (node_output_cache): при повторе
+    конвейера заново выполняются только узлы, вход которых изменился.
+    """
+
+    def __init__(self, node_timeout: float):
+        self.node_timeout = node_timeout
+
+    async def run(
+        self,
+        db: AsyncSession,
+        pipeline: Pipeline,
+        user_message: str,
+        conversation_history: Optional[List[ChatMessage]] = None,
+        conversation_summary: Optional[ChatMessage] = None
+    ) -> Dict[str, Any]:
+        """Выполняет конвейер и возвращает итоговый ответ, usage по узлам и orchestration_steps"""
+        return await self._execute(db, pipeline, user_message, conversation_history, conversation_summary)
+
+    async def run_stream(
+        self,
+        db: AsyncSession,
+        pipeline: Pipeline,
+        user_message: str,
+        conversation_history: Optional[List[ChatMessage]] = None,
+        conversation_summary: Optional[ChatMessage] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Выполняет конвейер, отдавая события по ходу выполнения:
+
+        - {"type": "step_started", "step": N, "node": ..., "agent": ..., "early_start": ...}
+        - {"type": "step_token", "step": N, "node": ..., "content": ...} - токены ответа узла
+        - {"type": "orchestration_step", "step": {...}} - узел завершен (вывод, usage, время)
+        - {"type": "done", ...} - в конце, с теми же полями, что возвращает run
+        """
+        events: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        task = asyncio.create_task(
+            self._execute(db, pipeline, user_message, conversation_history, conversation_summary, events)
+        )
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            yield {"type": "done", **task.result()}
+        finally:
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+    async def _execute(
+        self,
+        db: AsyncSession,
+        pipeline: Pipeline,
+        user_message: str,
+        conversation_history: Optional[List[ChatMessage]],
+        conversation_summary: Optional[ChatMessage],
+        events: Optional[asyncio.Queue] = None
+    ) -> Dict[str, Any]:
+        try:
+            agents = await self._load_agents(db, pipeline)
+            ordered = [node for level in pipeline.levels() for node in level]
+            steps = {node.id: index for index, node in enumerate(ordered, 1)}
+            results: Dict[str, Dict[str, Any]] = {}
+            tasks: Dict[str, asyncio.Task] = {}
+            required = {node.id: required_fields(node) for node in ordered}
+            progress: Dict[str, _NodeProgress] = {}
+            if pipeline.pipelined:
+                progress = {
+                    dep: _NodeProgress()
+                    for node in ordered for dep, fields in required[node.id].items() if fields
+                }
+
+            def emit(event: Dict[str, Any]):
+                if events is not None:
+                    events.put_nowait(event)
+
+            async def dependency_output(node: PipelineNode, dep: str):
+                """Вывод зависимости: только нужные поля, если они готовы раньше всего ответа"""
+                fields = required[node.id][dep]
+                if dep in progress and fields and await progress[dep].wait_fields(fields):
+                    return {field: progress[dep].parser.fields[field] for field in fields}, True
+                await tasks[dep]
+                return results[dep]["output"], False
+
+            async def run_node(node: PipelineNode) -> Dict[str, Any]:
+                try:
+                    dependencies = await asyncio.gather(*(dependency_output(node, dep) for dep in node.depends_on))
+                    outputs = {dep: output for dep, (output, _) in zip(node.depends_on, dependencies)}
+                    early_start = any(early for _, early in dependencies)
+                    if early_start:
+                        metrics.increment("pipeline_early_starts")
+
+                    step = {"step": steps[node.id], "node": node.id, "agent": node.agent_id}
+                    emit({"type": "step_started", **step, "early_start": early_start})
+
+                    def on_token(content: str):
+                        if events is not None:
+                            emit({"type": "step_token", **step, "content": content})
+                        if node.id in progress:
+                            progress[node.id].feed(content)
+
+                    results[node.id] = await self._run_node(
+                        node,
+                        agents[node.agent_id],
+                        self._render_input(node, user_message, outputs),
+                        conversation_history if node.include_history else None,
+                        conversation_summary if node.include_history else None,
+                        on_token if events is not None or node.id in progress else None
+                    )
+                    results[node.id]["early_start"] = early_start
+                finally:
+                    if node.id in progress:
+                        progress[node.id].close()
+                emit({"type": "orchestration_step", "step": self._step(node, steps[node.id], results[node.id])})
+                return results[node.id]
+
+            for node in ordered:
+                tasks[node.id] = asyncio.create_task(run_node(node))
+            try:
+                await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+                for node in ordered:
+                    if tasks[node.id].done() and tasks[node.id].exception():
+                        raise tasks[node.id].exception()
+            finally:
+                for task in tasks.values():
+                    task.cancel()
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+            return self._build_result(pipeline, ordered, results)
+
+        except UpstreamError:
+            raise
+        except Exception as e:
+            raise PipelineError(f"Orchestration failed: {str(e)}") from e
+
+    async def _load_agents(self, db: AsyncSession, pipeline: Pipeline) -> Dict[str, Agent]:
+        """Загружает агентов узлов заранее: сессия БД не используется узлами параллельно"""
+        agents: Dict[str, Agent] = {}
+        for node in pipeline.nodes:
+            if node.agent_id in agents:
+                continue
+            agent = await agent_service.get_agent(db, node.agent_id)
+            if not agent:
+                raise PipelineError(f"Subagent not found: {node.agent_id}")
+            if agent.pipeline is not None:
+                raise PipelineError(f"Nested pipelines are not supported: {node.agent_id}")
+            agents[node.agent_id] = agent
+        return agents
+
+    def _render_input(self, node: PipelineNode, user_message: str, outputs: Dict[str, Any]) -> str:
+        """Сообщение узлу: шаблон input с подставленными выводами зависимостей"""
+        template = node.input
+        if template is None:
+            template = "{{message}}"
+            if node.depends_on:
+                template = f"User request:\n{template}" + "".join(
+                    f"\n\nOutput of {dep}:\n{{{{{dep}}}}}" for dep in node.depends_on
+                )
+
+        def substitute(match) -> str:
+            name, field = match.group(1), match.group(2)
+            value = user_message if name == "message" else outputs[name]
+            if field:
+                if not isinstance(value, dict) or field not in value:
+                    raise PipelineError(f"Node '{node.id}' input: '{name}' has no field '{field}'")
+                value = value[field]
+            return format_output(value)
+
+        return PIPELINE_REFERENCE.sub(substitute, template)
+
+    async def _run_node(
+        self,
+        node: PipelineNode,
+        agent: Agent,
+        message: str,
+        history: Optional[List[ChatMessage]],
+        summary: Optional[ChatMessage] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """Вызывает агента узла (или берет вывод из кеша); с on_token ответ модели стримится"""
+        messages = agent_service.prepare_messages_for_agent(
+            agent=agent,
+            user_message=message,
+            conversation_history=history,
+            summary=summary
+        )
+        model = agent_service.resolve_model(agent.model, messages, agent.max_tokens)
+        cache_key = node_output_cache.make_key(agent, model, messages)
+        cached = node_output_cache.get(cache_key)
+        if cached is not None:
+            if on_token:
+                on_token(format_output(cached["output"]))
+            # Токены на закешированный узел не тратились
+            return {**cached, "usage": None, "duration": 0.0, "cached": True}
+
+        params = {
+            "messages": messages,
+            "model": model,
+            "temperature": agent.temperature,
+            "max_tokens": agent.max_tokens,
+            "cache": True if agent.cache_responses else None,
+            "fallback_models": agent_service.get_fallback_models(agent),
+        }
+
+        async def stream_completion() -> Dict[str, Any]:
+            async with contextlib.aclosing(openrouter_service.chat_completion_stream(**params)) as stream:
+                async for event in stream:
+                    if event["type"] == "done":
+                        return event
+                    on_token(event["content"])
+            raise PipelineError(f"Node '{node.id}' stream ended without a result")
+
+        timeout = node.timeout or self.node_timeout
+        started_at = time.monotonic()
+        try:
+            call = stream_completion() if on_token else openrouter_service.chat_completion(**params)
+            result = await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("pipeline_node_timeouts")
+            raise PipelineError(f"Node '{node.id}' timed out after {timeout:g}s")
+
+        output, format_valid = response_format_service.parse_response(result["message"], agent.response_format)
+        is_json = agent.response_format and agent.response_format.type == ResponseFormatType.JSON
+        if is_json and isinstance(output, str):
+            raise PipelineError(f"{agent.id} returned invalid JSON")
+
+        node_result = {
+            "output": output,
+            "format_valid": format_valid,
+            "model": result["model"],
+            "usage": result.get("usage"),
+            "duration": round(time.monotonic() - started_at, 3),
+            "cached": False,
+        }
+        if format_valid and result.get("finish_reason") != "length":
+            node_output_cache.set(agent.id, cache_key, node_result)
+        return node_result
+
+    def _step(self, node: PipelineNode, index: int, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Шаг оркестрации для orchestration_steps"""
+        return {"step": index, "node": node.id, "agent": node.agent_id, "depends_on": node.depends_on, **result}
+
+    def _build_result(
+        self,
+        pipeline: Pipeline,
+        ordered: List[PipelineNode],
+        results: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        steps = [self._step(node, index, results[node.id]) for index, node in enumerate(ordered, 1)]
+        final_output = results[pipeline.output_node().id]["output"]
+        return {
+            "message": format_output(final_output),
+            "model": " + ".join(results[node.id]["model"] for node in ordered),
+            "usage": {node.id: results[node.id]["usage"] for node in ordered},
+            "orchestration_steps": steps,
+        }
+
+
+# Глобальный исполнитель конвейеров
+pipeline_executor = PipelineExecutor(node_timeout=settings.PIPELINES.NODE_TIMEOUT)
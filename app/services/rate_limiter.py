@@ -0,0 +1,222 @@
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import re
+import time
+import httpx
+from app.services.resilience import UpstreamError
+
+
+class RateLimitQueueFullError(UpstreamError):
+    """Очередь ожидания лимита переполнена или ждать пришлось бы слишком долго"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=429, retry_after=retry_after)
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Время до сброса лимита в секундах
+
+    Поддерживает OpenAI формат ("1s", "6m0s", "250ms") и OpenRouter формат
+    (unix timestamp в миллисекундах).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+
+    if number is not None:
+        if number > 1e11:  # timestamp в миллисекундах
+            return max(0.0, number / 1000 - time.time())
+        if number > 1e8:  # timestamp в секундах
+            return max(0.0, number - time.time())
+        return max(0.0, number)
+
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        matched = True
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+def _header_float(headers: httpx.Headers, name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Token bucket: capacity единиц, пополняется равномерно за минуту"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.refill_per_second = per_minute / 60
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+        # Провайдер может попросить подождать дольше, чем следует из нашей оценки
+        self.blocked_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def time_until_available(self, amount: float) -> float:
+        """Через сколько секунд в ведре будет amount единиц (0 - уже есть)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        blocked = max(0.0, self.blocked_until - time.monotonic())
+        if self.tokens >= amount:
+            return blocked
+        return max(blocked, (amount - self.tokens) / self.refill_per_second)
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, delta: float):
+        """Корректирует остаток (например, после получения фактического usage)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+    def sync(self, remaining: Optional[float], reset_after: Optional[float]):
+        """Подстраивается под остаток и время сброса, которые сообщил провайдер"""
+        self._refill()
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+        if remaining is not None and remaining < 1 and reset_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + reset_after)
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class ModelRateLimiter:
+    """Лимиты запросов/мин и токенов/мин для одной пары (модель, API ключ)"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_queue: int, max_wait: float):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.waited = 0
+        self.rejected = 0
+        # Lock раздает лимит в порядке очереди
+        self._lock = asyncio.Lock()
+
+    def _time_until_available(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.time_until_available(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.time_until_available(estimated_tokens))
+        return wait
+
+    async def acquire(self, estimated_tokens: int):
+        """Ждет своей очереди в пределах лимита или выбрасывает RateLimitQueueFullError"""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitQueueFullError("Rate limit queue is full", retry_after=self._time_until_available(estimated_tokens))
+
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = self._time_until_available(estimated_tokens)
+                    if wait <= 0:
+                        break
+                    if wait > self.max_wait:
+                        self.rejected += 1
+                        raise RateLimitQueueFullError("Rate limit wait time exceeded", retry_after=wait)
+                    self.waited += 1
+                    await asyncio.sleep(wait)
+
+                if self.requests:
+                    self.requests.consume(1)
+                if self.tokens:
+                    self.tokens.consume(estimated_tokens)
+        finally:
+            self.waiting -= 1
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Возвращает/добирает токены после получения фактического usage"""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def update_from_headers(self, headers: Optional[httpx.Headers]):
+        """Учитывает заголовки лимитов провайдера (OpenAI и OpenRouter форматы)"""
+        if not headers:
+            return
+        if self.requests:
+            remaining = _header_float(headers, "x-ratelimit-remaining-requests")
+            reset = headers.get("x-ratelimit-reset-requests")
+            if remaining is None:
+                # OpenRouter отдает общие X-RateLimit-* для лимита запросов
+                remaining = _header_float(headers, "x-ratelimit-remaining")
+                reset = headers.get("x-ratelimit-reset")
+            self.requests.sync(remaining, _parse_reset(reset))
+        if self.tokens:
+            self.tokens.sync(
+                _header_float(headers, "x-ratelimit-remaining-tokens"),
+                _parse_reset(headers.get("x-ratelimit-reset-tokens")),
+            )
+
+    def block_for(self, seconds: float):
+        """Провайдер вернул 429 с Retry-After: не отправляем запросы до этого времени"""
+        if self.requests:
+            self.requests.block_for(seconds)
+        if self.tokens:
+            self.tokens.block_for(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        info = {"waiting": self.waiting, "waited": self.waited, "rejected": self.rejected}
+        if self.requests:
+            info["requests_available"] = round(self.requests.tokens, 1)
+        if self.tokens:
+            info["tokens_available"] = round(self.tokens.tokens)
+        return info
+
+
+class RateLimiter:
+    """Клиентские лимиты запросов к OpenRouter по моделям и API ключам"""
+
+    def __init__(self, enabled: bool, default_limits: Dict[str, Any], model_limits: Dict[str, Dict[str, Any]],
+                 max_queue: int, max_wait: float):
+        self.enabled = enabled
+        self.default_limits = default_limits
+        self.model_limits = model_limits
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._limiters: Dict[Tuple[str, str], Optional[ModelRateLimiter]] = {}
+
+    def get(self, model: str, api_key: str) -> Optional[ModelRateLimiter]:
+        """Лимитер для модели и ключа или None, если для модели лимиты не заданы"""
+        if not self.enabled:
+            return None
+        # Сам ключ не храним, только его хеш
+        key = (model, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8])
+        if key not in self._limiters:
+            limits = self.model_limits.get(model, self.default_limits)
+            rpm = limits.get("requests_per_minute") or 0
+            tpm = limits.get("tokens_per_minute") or 0
+            self._limiters[key] = (
+                ModelRateLimiter(rpm, tpm, self.max_queue, self.max_wait) if rpm or tpm else None
+            )
+        return self._limiters[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            f"{model}@{key_hash}": limiter.stats()
+            for (model, key_hash), limiter in self._limiters.items()
+            if limiter is not None
+        }
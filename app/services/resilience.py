@@ -0,0 +1,212 @@
+from typing import Any, Dict, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import random
+import time
+import httpx
+import openai
+
+
+class UpstreamError(Exception):
+    """Ошибка запроса к OpenRouter"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def http_status(self) -> int:
+        """HTTP статус, которым ошибка отдается клиенту нашего API"""
+        if self.status_code == 429:
+            return 429
+        return 502
+
+
+class CircuitOpenError(UpstreamError):
+    """Модель временно недоступна: circuit breaker разомкнут"""
+
+    @property
+    def http_status(self) -> int:
+        return 503
+
+
+def parse_retry_after(headers: Optional[httpx.Headers]) -> Optional[float]:
+    """Читает Retry-After (секунды или HTTP дата) из заголовков ответа"""
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc: Exception) -> Dict[str, Any]:
+    """
+    Классифицирует ошибку OpenRouter
+
+    Returns:
+        status_code, retry_after, retryable (можно повторить запрос),
+        breaker_failure (ошибка говорит о проблемах с моделью/провайдером)
+    """
+    if isinstance(exc, openai.APIStatusError):
+        status = exc.status_code
+        return {
+            "status_code": status,
+            "retry_after": parse_retry_after(exc.response.headers),
+            "retryable": status == 429 or status >= 500,
+            "breaker_failure": status >= 500,
+        }
+    # Таймауты, обрывы соединения и сброс соединения провайдером
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return {"status_code": None, "retry_after": None, "retryable": True, "breaker_failure": True}
+    return {"status_code": None, "retry_after": None, "retryable": False, "breaker_failure": False}
+
+
+class RetryPolicy:
+    """Экспоненциальная задержка с полным джиттером"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, max_retry_after: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Задержка перед повтором номер attempt (с 1) или None, если ждать слишком долго"""
+        if retry_after is not None:
+            # Провайдер сам сказал, когда повторять
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class RetryBudget:
+    """
+    Глобальный бюджет повторов
+
+    Каждый запрос пополняет бюджет на ratio, каждый повтор тратит единицу.
+    Во время массовых сбоев повторы быстро заканчиваются и не умножают нагрузку.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.exhausted = 0
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tokens": round(self.tokens, 2), "max_tokens": self.max_tokens, "exhausted": self.exhausted}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для одной модели
+
+    closed - запросы идут как обычно; после failure_threshold ошибок подряд
+    переходит в open и сразу отклоняет запросы reset_timeout секунд;
+    затем half_open - пропускает один пробный запрос, успех замыкает цепь.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.total_failures = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Проверяет, можно ли отправить запрос; иначе выбрасывает CircuitOpenError"""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError("Model is temporarily unavailable (circuit open)", retry_after=remaining)
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError("Model is temporarily unavailable (circuit half-open)", retry_after=1.0)
+            self.probe_in_flight = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Запрос завершился без вердикта о здоровье модели (например, ошибка 4xx или отмена)"""
+        self.probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        info = {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected,
+        }
+        if self.state == self.OPEN:
+            info["retry_in"] = round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 1)
+        return info
+
+
+class CircuitBreakerRegistry:
+    """Circuit breaker'ы по моделям"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self._breakers[model] = breaker
+        return breaker
+
+    def is_available(self, model: str) -> bool:
+        """Можно ли сейчас отправить запрос к модели (без изменения состояния)"""
+        breaker = self._breakers.get(model)
+        if breaker is None or breaker.state == CircuitBreaker.CLOSED:
+            return True
+        if breaker.state == CircuitBreaker.OPEN:
+            return breaker.opened_at + breaker.reset_timeout <= time.monotonic()
+        return not breaker.probe_in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        return {model: breaker.stats() for model, breaker in self._breakers.items()}
@@ -0,0 +1,100 @@
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import time
+
+
+class ResponseCache:
+    """
+    LRU кеш ответов с TTL и ограничением по памяти
+
+    Размер записи оценивается по длине JSON представления значения,
+    при превышении бюджета вытесняются давно не использованные записи.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """Строит ключ кеша из параметров запроса (порядок полей не важен)"""
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Возвращает значение или None, если записи нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        """Сохраняет значение, вытесняя старые записи при нехватке бюджета"""
+        size = len(key) + len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_bytes:
+            # Запись больше всего бюджета - не кешируем
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        while self._entries and self._size_bytes + size > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+        self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds)
+        self._size_bytes += size
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(self, key: str):
+        """Удаляет запись из кеша"""
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        """Очищает кеш"""
+        self._entries.clear()
+        self._size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики и текущий размер кеша"""
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._size_bytes -= size
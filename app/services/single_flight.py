@@ -0,0 +1,64 @@
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+
+
+class _Call:
+    """Выполняющийся запрос и число ожидающих его результат"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых параллельных вызовов
+
+    Пока вызов с ключом key выполняется, повторные вызовы с тем же ключом
+    не запускают новую работу, а ждут результат первого. Отмена одного
+    ожидающего не влияет на остальных; работа отменяется, только когда
+    результат больше никому не нужен.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет fn() или присоединяется к уже выполняющемуся вызову с тем же ключом"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # shield: отмена ожидающего не отменяет общий вызов
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Результат больше никому не нужен - отменяем работу и
+                # убираем вызов сразу, чтобы новые запросы не ждали отменяемую задачу
+                self._forget(key, call)
+                call.task.cancel()
+                self.abandoned += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики объединенных вызовов"""
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,42 @@
+from typing import Any, Dict, List, Optional
+import re
+
+# Служебные токены на каждое сообщение в формате chat (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценивает число токенов в тексте без загрузки токенизатора модели
+
+    BPE токенизаторы в среднем дают ~4 символа на токен для английского текста,
+    но длинные слова и кириллица режутся на большее число токенов, а знаки
+    препинания - отдельные токены. Берем максимум из двух оценок.
+    """
+    if not text:
+        return 0
+    by_chars = len(text) / 4
+    by_words = sum(
+        1 if len(piece) <= 4 else (len(piece) + 3) // 4 + (1 if not piece.isascii() else 0)
+        for piece in _WORD_PATTERN.findall(text)
+    )
+    return int(max(by_chars, by_words)) + 1
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Оценивает число токенов промпта для списка сообщений в формате OpenAI API"""
+    total = 0
+    for message in messages:
+        total += estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def cached_prompt_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Токены промпта, прочитанные из кеша провайдера (usage.prompt_tokens_details.cached_tokens)"""
+    if not usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens")
+    return int(cached) if cached is not None else None
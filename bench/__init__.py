@@ -0,0 +1 @@
+"""Инструменты для нагрузочного тестирования и бенчмарков без доступа к сети"""
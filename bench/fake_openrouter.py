@@ -0,0 +1,455 @@
+"""
+Поддельный OpenRouter для бенчмарков и нагрузочных тестов без сети
+
+Реализует OpenAI-совместимые эндпоинты, которыми пользуется OpenRouterService:
+POST /api/v1/chat/completions (обычный и потоковый ответ) и GET /api/v1/models.
+Задержка до первого токена, скорость генерации, доли ошибок и 429 задаются
+профилями моделей (см. bench/fake_openrouter.yaml). Агенты из
+app/data/predefined_agents.yaml распознаются по системному промпту и получают
+JSON из примеров (canned) или сгенерированный по json_schema (schema).
+
+Запуск:
+    python -m bench.fake_openrouter --port 8100 --config bench/fake_openrouter.yaml
+    OPENROUTER__BASE_URL=http://127.0.0.1:8100/api/v1 ./run_server.sh
+"""
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+import yaml
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+PREDEFINED_AGENTS_PATH = Path(__file__).parent.parent / "app" / "data" / "predefined_agents.yaml"
+
+JSON_MODES = ("canned", "schema")
+
+# Текст для ответов агентов без JSON формата
+LOREM = (
+    "This is a synthetic answer produced by the offline OpenRouter stand-in. "
+    "It has no meaning and only exists to exercise streaming, token accounting and latency. "
+    "Each sentence is roughly twenty tokens long so that responses scale with max_tokens. "
+)
+
+
+class FakeProfile(BaseModel):
+    """Поведение поддельной модели"""
+    ttft_median: float = 0.4
+    ttft_sigma: float = 0.5
+    stall_rate: float = 0.0
+    stall_seconds: float = 5.0
+    tokens_per_second: float = 80.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    requests_per_minute: int = 0
+    context_length: int = 32768
+    prompt_price: float = 0.0000005
+    completion_price: float = 0.0000015
+    # Скорость обработки промпта (токенов/сек, 0 - не учитывать) и кеш префикса:
+    # повторный системный префикс не обрабатывается заново и попадает в cached_tokens
+    prompt_tokens_per_second: float = 0.0
+    prefix_cache: bool = True
+    # Длина ответа без JSON формата (токены), ограничивается max_tokens запроса
+    min_completion_tokens: int = 40
+    max_completion_tokens: int = 200
+
+    def sample_ttft(self) -> float:
+        """Время до первого токена: логнормальное распределение с медианой ttft_median"""
+        delay = self.ttft_median
+        if self.ttft_sigma > 0 and delay > 0:
+            delay = random.lognormvariate(0, self.ttft_sigma) * delay
+        if self.stall_rate and random.random() < self.stall_rate:
+            delay += self.stall_seconds
+        return delay
+
+
+class FakeConfig(BaseModel):
+    """Профиль по умолчанию, переопределения по моделям и режим JSON ответов"""
+    default: FakeProfile = FakeProfile()
+    models: Dict[str, Dict[str, Any]] = {}
+    json_mode: str = "canned"
+
+    def profile(self, model: str) -> FakeProfile:
+        overrides = self.models.get(model)
+        if not overrides:
+            return self.default
+        return self.default.model_copy(update=overrides)
+
+
+def load_config(path: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None) -> FakeConfig:
+    """Загружает конфигурацию из YAML; overrides меняют профиль по умолчанию"""
+    data: Dict[str, Any] = {}
+    if path:
+        with open(path, "r", encoding="utf-8") as file:
+            data = yaml.safe_load(file) or {}
+
+    default = {**(data.get("default") or {}), **(overrides or {})}
+    json_mode = default.pop("json_mode", None) or data.get("json_mode") or "canned"
+    if json_mode not in JSON_MODES:
+        raise ValueError(f"Unknown json_mode '{json_mode}', expected one of {JSON_MODES}")
+    return FakeConfig(
+        default=FakeProfile(**default),
+        models=data.get("models") or {},
+        json_mode=json_mode,
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка: ~4 символа на токен"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Текст сообщения: строка или текстовые части (формат с cache_control)"""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def split_tokens(text: str) -> List[str]:
+    """Делит текст на куски по ~4 символа, имитируя токены"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def generate_from_schema(schema: Dict[str, Any], name: str = "value") -> Any:
+    """Строит значение, соответствующее JSON схеме (подмножество, используемое агентами)"""
+    if not isinstance(schema, dict):
+        return None
+    if "enum" in schema:
+        return random.choice(schema["enum"])
+
+    schema_type = schema.get("type", "string")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "string")
+
+    if schema_type == "object":
+        properties = schema.get("properties") or {}
+        return {key: generate_from_schema(value, key) for key, value in properties.items()}
+    if schema_type == "array":
+        min_items = schema.get("minItems", 1)
+        max_items = max(min_items, schema.get("maxItems", 3))
+        count = random.randint(min_items, max_items)
+        return [generate_from_schema(schema.get("items") or {}, name) for _ in range(count)]
+    if schema_type == "number":
+        return round(random.uniform(schema.get("minimum", 0.0), schema.get("maximum", 1.0)), 2)
+    if schema_type == "integer":
+        return random.randint(schema.get("minimum", 1), schema.get("maximum", 10))
+    if schema_type == "boolean":
+        return random.random() < 0.5
+    description = schema.get("description") or name.replace("_", " ")
+    return f"Synthetic {description.lower()}"
+
+
+class AgentResponder:
+    """Подбирает ответ по системному промпту предустановленного агента"""
+
+    def __init__(self, yaml_path: Path = PREDEFINED_AGENTS_PATH):
+        # (начало системного промпта, схема, примеры)
+        self.agents: List[Tuple[str, Optional[Dict[str, Any]], List[Any]]] = []
+        if not yaml_path.exists():
+            return
+        with open(yaml_path, "r", encoding="utf-8") as file:
+            data = yaml.safe_load(file) or {}
+
+        for agent in (data.get("agents") or {}).values():
+            response_format = agent.get("response_format") or {}
+            if response_format.get("type") != "json" or not agent.get("system_prompt"):
+                continue
+            examples = []
+            for example in response_format.get("examples") or []:
+                try:
+                    examples.append(json.loads(example) if isinstance(example, str) else example)
+                except json.JSONDecodeError:
+                    continue
+            self.agents.append((agent["system_prompt"].strip(), response_format.get("json_schema"), examples))
+
+    def respond(self, messages: List[Dict[str, Any]], json_mode: str) -> Optional[str]:
+        """JSON ответ агента или None, если системный промпт не узнан"""
+        system = next((message_text(m) for m in messages if m.get("role") == "system"), None)
+        if not system:
+            return None
+        for prompt, schema, examples in self.agents:
+            if not system.startswith(prompt):
+                continue
+            if json_mode == "canned" and examples:
+                value = random.choice(examples)
+            elif schema:
+                value = generate_from_schema(schema)
+            else:
+                value = random.choice(examples) if examples else {}
+            return json.dumps(value, ensure_ascii=False, indent=2)
+        return None
+
+
+class FakeOpenRouter:
+    """Состояние поддельного провайдера: лимиты и счетчики по моделям"""
+
+    def __init__(self, config: FakeConfig, responder: Optional[AgentResponder] = None):
+        self.config = config
+        self.responder = responder or AgentResponder()
+        self._windows: Dict[str, Deque[float]] = defaultdict(deque)
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.in_flight = 0
+        self._prefixes: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+
+    def cached_prefix_tokens(self, model: str, messages: List[Dict[str, Any]], profile: FakeProfile) -> int:
+        """Токены начальных системных сообщений, если такой префикс модель уже видела"""
+        prefix = "".join(message_text(m) for m in _leading_system(messages))
+        if not profile.prefix_cache or not prefix:
+            return 0
+        key = (model, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        if key in self._prefixes:
+            self._prefixes.move_to_end(key)
+            return estimate_tokens(prefix)
+        self._prefixes[key] = None
+        while len(self._prefixes) > 10000:
+            self._prefixes.popitem(last=False)
+        return 0
+
+    def check_rate_limit(self, model: str, profile: FakeProfile) -> Tuple[bool, Dict[str, str]]:
+        """Скользящее окно в минуту: (разрешено ли, заголовки X-RateLimit-*)"""
+        if not profile.requests_per_minute:
+            return True, {}
+        now = time.time()
+        window = self._windows[model]
+        while window and now - window[0] >= 60:
+            window.popleft()
+
+        allowed = len(window) < profile.requests_per_minute
+        if allowed:
+            window.append(now)
+        reset_at = (window[0] + 60) if window else now
+        headers = {
+            "X-RateLimit-Limit": str(profile.requests_per_minute),
+            "X-RateLimit-Remaining": str(max(0, profile.requests_per_minute - len(window))),
+            "X-RateLimit-Reset": str(int(reset_at * 1000)),
+        }
+        return allowed, headers
+
+    def completion_text(self, body: Dict[str, Any], profile: FakeProfile) -> str:
+        content = self.responder.respond(body.get("messages") or [], self.config.json_mode)
+        if content is not None:
+            return content
+        tokens = random.randint(profile.min_completion_tokens, profile.max_completion_tokens)
+        text = LOREM * (tokens * 4 // len(LOREM) + 1)
+        return text[:tokens * 4].rstrip()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "models": {model: dict(counts) for model, counts in self.counters.items()},
+        }
+
+
+def _error(status_code: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"message": message, "code": status_code}},
+        status_code=status_code,
+        headers=headers,
+    )
+
+
+def _leading_system(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    leading = []
+    for message in messages:
+        if message.get("role") != "system":
+            break
+        leading.append(message)
+    return leading
+
+
+def _usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    """Создает приложение поддельного OpenRouter"""
+    fake = FakeOpenRouter(config)
+    router = APIRouter()
+
+    @router.get("/models")
+    async def list_models():
+        model_ids = list(dict.fromkeys(list(config.models) or ["fake/model"]))
+        return {
+            "data": [
+                {
+                    "id": model_id,
+                    "name": model_id.split("/")[-1],
+                    "description": "Offline stand-in model",
+                    "context_length": config.profile(model_id).context_length,
+                    "pricing": {
+                        "prompt": str(config.profile(model_id).prompt_price),
+                        "completion": str(config.profile(model_id).completion_price),
+                    },
+                }
+                for model_id in model_ids
+            ]
+        }
+
+    @router.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model") or "fake/model"
+        profile = config.profile(model)
+        counters = fake.counters[model]
+        counters["requests"] += 1
+
+        allowed, rate_headers = fake.check_rate_limit(model, profile)
+        if not allowed or (profile.rate_limit_rate and random.random() < profile.rate_limit_rate):
+            counters["rate_limited"] += 1
+            return _error(429, "Rate limit exceeded", {**rate_headers, "Retry-After": f"{profile.retry_after:g}"})
+        if profile.error_rate and random.random() < profile.error_rate:
+            counters["errors"] += 1
+            return _error(500, "Injected upstream error", rate_headers)
+
+        messages = body.get("messages") or []
+        prompt_tokens = estimate_tokens("".join(message_text(m) for m in messages))
+        if prompt_tokens + (body.get("max_tokens") or 0) > profile.context_length:
+            counters["errors"] += 1
+            return _error(400, f"This endpoint's maximum context length is {profile.context_length} tokens")
+
+        tokens = split_tokens(fake.completion_text(body, profile))
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = "length"
+
+        completion_id = f"gen-fake-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        cached_tokens = fake.cached_prefix_tokens(model, messages, profile)
+        ttft = profile.sample_ttft()
+        if profile.prompt_tokens_per_second > 0:
+            ttft += (prompt_tokens - cached_tokens) / profile.prompt_tokens_per_second
+        tps = max(profile.tokens_per_second, 1.0)
+
+        if not body.get("stream"):
+            fake.in_flight += 1
+            try:
+                await asyncio.sleep(ttft + len(tokens) / tps)
+            finally:
+                fake.in_flight -= 1
+            counters["completed"] += 1
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": finish_reason,
+                    }],
+                    "usage": _usage(prompt_tokens, len(tokens), cached_tokens),
+                },
+                headers=rate_headers,
+            )
+
+        include_usage = bool(
+            (body.get("usage") or {}).get("include")
+            or (body.get("stream_options") or {}).get("include_usage")
+        )
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None, usage: Optional[Dict[str, int]] = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if usage:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            fake.in_flight += 1
+            try:
+                await asyncio.sleep(ttft)
+                yield chunk({"role": "assistant", "content": ""})
+                # Отдаем токены пачками, чтобы не будить цикл событий на каждый токен
+                tick = max(1 / tps, 0.02)
+                per_tick = max(1, round(tps * tick))
+                for i in range(0, len(tokens), per_tick):
+                    yield chunk({"content": "".join(tokens[i:i + per_tick])})
+                    await asyncio.sleep(tick)
+                usage = _usage(prompt_tokens, len(tokens), cached_tokens) if include_usage else None
+                yield chunk({}, finish_reason, usage)
+                yield "data: [DONE]\n\n"
+                counters["completed"] += 1
+            except asyncio.CancelledError:
+                counters["cancelled"] += 1
+                raise
+            finally:
+                fake.in_flight -= 1
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream", headers=rate_headers)
+
+    app = FastAPI(title="Fake OpenRouter", description="Offline OpenRouter stand-in for benchmarks")
+    app.include_router(router, prefix="/api/v1")
+
+    @app.get("/stats")
+    async def stats():
+        return fake.stats()
+
+    return app
+
+
+# Приложение для запуска через uvicorn bench.fake_openrouter:app (конфиг из FAKE_OPENROUTER_CONFIG)
+app = create_app(load_config(os.getenv("FAKE_OPENROUTER_CONFIG")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenRouter stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--config", default=os.getenv("FAKE_OPENROUTER_CONFIG"), help="YAML с профилями моделей")
+    parser.add_argument("--seed", type=int, help="Seed генератора случайных чисел для воспроизводимых прогонов")
+    parser.add_argument("--json-mode", choices=JSON_MODES, help="canned - примеры агентов, schema - генерация по схеме")
+    # Переопределения профиля по умолчанию (профили отдельных моделей из конфига важнее)
+    parser.add_argument("--ttft-median", type=float)
+    parser.add_argument("--ttft-sigma", type=float)
+    parser.add_argument("--stall-rate", type=float)
+    parser.add_argument("--stall-seconds", type=float)
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--prompt-tokens-per-second", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--rate-limit-rate", type=float)
+    parser.add_argument("--retry-after", type=float)
+    parser.add_argument("--requests-per-minute", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    overrides = {
+        key: value for key, value in vars(args).items()
+        if key not in ("host", "port", "config", "seed") and value is not None
+    }
+    config = load_config(args.config, overrides)
+
+    import uvicorn
+    print(f"Fake OpenRouter: http://{args.host}:{args.port}/api/v1 (json_mode={config.json_mode})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
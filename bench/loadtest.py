@@ -0,0 +1,356 @@
+"""
+Нагрузочный тест чат API
+
+N виртуальных пользователей параллельно ведут многоходовые диалоги с агентами
+через /api/v1/chat (история диалога растет с каждым ходом), обращаются к
+агенту-оркестратору и читают /api/v1/agents. В конце печатается сводка
+(пропускная способность, p50/p95/p99, доли ошибок, задержка цикла событий
+клиента и сервера), а результаты сохраняются в JSON вместе с коммитом,
+чтобы прогоны можно было сравнивать между коммитами.
+
+Запуск (upstream задается бэкенду через OPENROUTER__BASE_URL, см. bench/run_loadtest.sh):
+    python -m bench.loadtest --base-url http://127.0.0.1:8000 --users 50 --duration 60
+    python -m bench.loadtest ... --compare bench/results/<previous>.json
+"""
+from typing import Any, Dict, List, Optional
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import uuid
+import httpx
+
+REPO_ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+
+SCENARIOS = ("chat", "orchestrator", "agents")
+
+ORCHESTRATOR_AGENT_ID = "subagent_orchestrator"
+
+# Первые реплики и продолжения диалога: с каждым ходом история растет
+OPENING_MESSAGES = [
+    "Find the derivative of f(x) = x^3 + 2x^2 - 5x + 1",
+    "Write a Python function that checks whether a string is a palindrome",
+    "Monthly sales were 120, 135, 128, 160, 172. What trend do you see?",
+    "Explain the difference between a process and a thread",
+    "A train travels 300 km in 2.5 hours. What is its average speed?",
+]
+FOLLOW_UP_MESSAGES = [
+    "Can you explain the previous step in more detail?",
+    "Now solve the same problem for a slightly different input.",
+    "What are the edge cases I should be aware of?",
+    "Summarize your answer in two sentences.",
+    "How would you verify that this is correct?",
+    "Is there a faster way to do this?",
+]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def git_commit() -> Dict[str, Any]:
+    """Текущий коммит репозитория и наличие незакоммиченных изменений"""
+    def run(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+
+    try:
+        return {
+            "commit": run("rev-parse", "HEAD") or None,
+            "subject": run("log", "-1", "--format=%s") or None,
+            "dirty": bool(run("status", "--porcelain", "--untracked-files=no")),
+        }
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "subject": None, "dirty": None}
+
+
+class ScenarioStats:
+    """Задержки и ошибки одного сценария"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, latency: float, error: Optional[str] = None):
+        if error:
+            self.errors[error] += 1
+        else:
+            self.latencies.append(latency)
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        errors = sum(self.errors.values())
+        total = len(self.latencies) + errors
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "requests": total,
+            "successes": len(self.latencies),
+            "errors": dict(self.errors),
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(len(self.latencies) / duration, 3) if duration else 0.0,
+            "latency_ms": {
+                "p50": ms(percentile(self.latencies, 0.5)),
+                "p95": ms(percentile(self.latencies, 0.95)),
+                "p99": ms(percentile(self.latencies, 0.99)),
+                "max": ms(max(self.latencies) if self.latencies else None),
+            },
+        }
+
+
+class LoopLagProbe:
+    """Задержка цикла событий самого генератора нагрузки (если она растет, клиент - узкое место)"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.lags: List[float] = []
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.monotonic() - started - self.interval))
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "lag_p50_ms": ms(percentile(self.lags, 0.5)),
+            "lag_p99_ms": ms(percentile(self.lags, 0.99)),
+            "lag_max_ms": ms(max(self.lags) if self.lags else None),
+        }
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.api_url = args.base_url.rstrip("/") + "/api/v1"
+        self.stats = {scenario: ScenarioStats() for scenario in SCENARIOS}
+        self.mix = self._parse_mix(args.mix)
+        self.deadline = 0.0
+
+    @staticmethod
+    def _parse_mix(value: str) -> Dict[str, float]:
+        mix = {}
+        for part in value.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in SCENARIOS:
+                raise ValueError(f"Unknown scenario '{name}', expected one of {SCENARIOS}")
+            mix[name] = float(weight or 1)
+        return mix
+
+    async def _timed(self, scenario: str, request) -> Optional[httpx.Response]:
+        started = time.monotonic()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.stats[scenario].record(time.monotonic() - started, type(e).__name__)
+            return None
+        latency = time.monotonic() - started
+        self.stats[scenario].record(latency, None if response.status_code < 400 else str(response.status_code))
+        return response if response.status_code < 400 else None
+
+    async def _conversation(self, client: httpx.AsyncClient, user_random: random.Random):
+        """Многоходовой диалог с одним агентом"""
+        agent_id = user_random.choice(self.args.agents)
+        history: List[Dict[str, str]] = []
+        conversation_id = f"loadtest-{uuid.UUID(int=user_random.getrandbits(128))}"
+        message = user_random.choice(OPENING_MESSAGES)
+        for _ in range(self.args.turns):
+            if time.monotonic() >= self.deadline:
+                return
+            payload = {"message": message, "agent_id": agent_id}
+            if self.args.server_history:
+                # История хранится на сервере, клиент отправляет только новое сообщение
+                payload["conversation_id"] = conversation_id
+            else:
+                payload["conversation_history"] = history
+            response = await self._timed("chat", client.post(f"{self.api_url}/chat", json=payload))
+            if response is None:
+                return
+            history = history + [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": response.json().get("message", "")},
+            ]
+            message = user_random.choice(FOLLOW_UP_MESSAGES)
+            await self._think(user_random)
+
+    async def _orchestrate(self, client: httpx.AsyncClient, user_random: random.Random):
+        payload = {"message": user_random.choice(OPENING_MESSAGES), "agent_id": ORCHESTRATOR_AGENT_ID}
+        await self._timed("orchestrator", client.post(f"{self.api_url}/chat", json=payload))
+        await self._think(user_random)
+
+    async def _list_agents(self, client: httpx.AsyncClient, user_random: random.Random):
+        await self._timed("agents", client.get(f"{self.api_url}/agents"))
+        await self._think(user_random)
+
+    async def _think(self, user_random: random.Random):
+        if self.args.think_time:
+            await asyncio.sleep(user_random.uniform(0, 2 * self.args.think_time))
+
+    async def _virtual_user(self, client: httpx.AsyncClient, index: int):
+        user_random = random.Random(self.args.seed * 100003 + index)
+        # Пользователи подключаются равномерно в течение ramp_up
+        await asyncio.sleep(self.args.ramp_up * index / max(1, self.args.users))
+        scenarios = list(self.mix)
+        weights = [self.mix[name] for name in scenarios]
+        while time.monotonic() < self.deadline:
+            scenario = user_random.choices(scenarios, weights)[0]
+            if scenario == "chat":
+                await self._conversation(client, user_random)
+            elif scenario == "orchestrator":
+                await self._orchestrate(client, user_random)
+            else:
+                await self._list_agents(client, user_random)
+
+    async def _server_metrics(self, client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+        try:
+            response = await client.get(f"{self.api_url}/metrics")
+            return response.json() if response.status_code == 200 else None
+        except httpx.HTTPError:
+            return None
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.args.users, max_keepalive_connections=self.args.users)
+        async with httpx.AsyncClient(timeout=self.args.timeout, limits=limits) as client:
+            before = await self._server_metrics(client)
+            probe = LoopLagProbe()
+            probe_task = asyncio.create_task(probe.run())
+
+            started = time.monotonic()
+            self.deadline = started + self.args.duration
+            await asyncio.gather(*(self._virtual_user(client, i) for i in range(self.args.users)))
+            duration = time.monotonic() - started
+
+            probe_task.cancel()
+            after = await self._server_metrics(client)
+
+        return self._report(duration, probe, before, after)
+
+    def _report(self, duration: float, probe: LoopLagProbe, before: Optional[Dict[str, Any]],
+                after: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        total = ScenarioStats()
+        for stats in self.stats.values():
+            total.latencies.extend(stats.latencies)
+            for error, count in stats.errors.items():
+                total.errors[error] += count
+
+        server = None
+        if after is not None:
+            before_counters = (before or {}).get("counters", {})
+            server = {
+                "event_loop": after.get("event_loop"),
+                "counters_delta": {
+                    name: value - before_counters.get(name, 0)
+                    for name, value in after.get("counters", {}).items()
+                    if value != before_counters.get(name, 0)
+                },
+            }
+
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git_commit(),
+            "config": {
+                "base_url": self.args.base_url,
+                "users": self.args.users,
+                "duration": self.args.duration,
+                "ramp_up": self.args.ramp_up,
+                "turns": self.args.turns,
+                "think_time": self.args.think_time,
+                "server_history": self.args.server_history,
+                "mix": self.mix,
+                "agents": self.args.agents,
+                "seed": self.args.seed,
+                "label": self.args.label,
+            },
+            "duration_seconds": round(duration, 3),
+            "total": total.summary(duration),
+            "scenarios": {name: stats.summary(duration) for name, stats in self.stats.items() if name in self.mix},
+            "client_event_loop": probe.summary(),
+            "server": server,
+        }
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """Печатает сводку; с baseline - еще и изменения относительно предыдущего прогона"""
+    git = results["git"]
+    print(f"\nКоммит: {git['commit'] or '-'}{' (dirty)' if git['dirty'] else ''}  "
+          f"Длительность: {results['duration_seconds']}s  Пользователи: {results['config']['users']}")
+    print(f"{'scenario':<14}{'req':>8}{'err%':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    rows = {"total": results["total"], **results["scenarios"]}
+    for name, row in rows.items():
+        latency = row["latency_ms"]
+        print(f"{name:<14}{row['requests']:>8}{row['error_rate'] * 100:>8.2f}{row['throughput_rps']:>9.2f}"
+              f"{latency['p50'] or 0:>10.1f}{latency['p95'] or 0:>10.1f}{latency['p99'] or 0:>10.1f}")
+        if baseline:
+            old = baseline["scenarios"].get(name) if name != "total" else baseline["total"]
+            if old:
+                deltas = []
+                for key in ("p50", "p95", "p99"):
+                    new_value, old_value = latency[key], old["latency_ms"][key]
+                    if new_value is not None and old_value:
+                        deltas.append(f"{key} {100 * (new_value - old_value) / old_value:+.1f}%")
+                if old["throughput_rps"]:
+                    change = 100 * (row["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"]
+                    deltas.append(f"rps {change:+.1f}%")
+                print(f"{'':<14}vs {(baseline['git']['commit'] or '-')[:8]}: {', '.join(deltas)}")
+
+    errors = results["total"]["errors"]
+    if errors:
+        print(f"Ошибки: {errors}")
+    print(f"Задержка цикла событий клиента: {results['client_event_loop']}")
+    if results["server"]:
+        print(f"Задержка цикла событий сервера: {results['server']['event_loop']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the chat API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Адрес бэкенда")
+    parser.add_argument("--users", type=int, default=20, help="Число виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=60, help="Длительность прогона, сек")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Время подключения всех пользователей, сек")
+    parser.add_argument("--turns", type=int, default=5, help="Ходов в одном диалоге")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Средняя пауза между запросами пользователя, сек")
+    parser.add_argument("--mix", default="chat=8,orchestrator=1,agents=1", help="Веса сценариев")
+    parser.add_argument("--agents", default="default,math_assistant,code_assistant",
+                        help="Агенты для диалогов через запятую")
+    parser.add_argument("--server-history", action="store_true",
+                        help="Передавать conversation_id вместо conversation_history")
+    parser.add_argument("--timeout", type=float, default=180, help="Таймаут одного запроса, сек")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", help="Метка прогона в результатах")
+    parser.add_argument("--output", help="Файл результатов (по умолчанию bench/results/<время>-<коммит>.json)")
+    parser.add_argument("--compare", help="Результаты предыдущего прогона для сравнения")
+    args = parser.parse_args()
+    args.agents = [agent.strip() for agent in args.agents.split(",") if agent.strip()]
+
+    results = asyncio.run(LoadTest(args).run())
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{(results['git']['commit'] or 'nogit')[:8]}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+    print_report(results, baseline)
+    print(f"\nРезультаты сохранены: {output}")
+
+
+if __name__ == "__main__":
+    main()
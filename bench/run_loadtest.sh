@@ -0,0 +1,38 @@
+#!/bin/bash
+
+# Нагрузочный тест без сети: поддельный OpenRouter + бэкенд + генератор нагрузки
+# Пример: ./bench/run_loadtest.sh --users 50 --duration 60 --compare bench/results/<previous>.json
+# Профили upstream: FAKE_OPENROUTER_CONFIG (по умолчанию bench/fake_openrouter.yaml)
+
+set -e
+cd "$(dirname "$0")/.."
+
+FAKE_PORT=${FAKE_PORT:-8100}
+BACKEND_PORT=${BACKEND_PORT:-8000}
+FAKE_OPENROUTER_CONFIG=${FAKE_OPENROUTER_CONFIG:-bench/fake_openrouter.yaml}
+
+# Активируем виртуальное окружение если оно есть
+if [ -d ".venv" ]; then
+    source .venv/bin/activate
+fi
+
+python -m bench.fake_openrouter --port "$FAKE_PORT" --config "$FAKE_OPENROUTER_CONFIG" --seed 1 &
+FAKE_PID=$!
+
+APPLICATION_ENV=${APPLICATION_ENV:-LOCAL} \
+OPEN_ROUTER_API_KEY=${OPEN_ROUTER_API_KEY:-offline} \
+OPENROUTER__BASE_URL="http://127.0.0.1:$FAKE_PORT/api/v1" \
+    uvicorn app.main:app --host 127.0.0.1 --port "$BACKEND_PORT" --log-level warning &
+BACKEND_PID=$!
+
+trap 'kill $BACKEND_PID $FAKE_PID 2>/dev/null' EXIT
+
+# Ждем готовности бэкенда
+for _ in $(seq 1 30); do
+    if curl -sf "http://127.0.0.1:$BACKEND_PORT/health" > /dev/null; then
+        break
+    fi
+    sleep 1
+done
+
+python -m bench.loadtest --base-url "http://127.0.0.1:$BACKEND_PORT" "$@"
@@ -0,0 +1,90 @@
+import os
+
+# Настройки читаются при импорте app.config, поэтому окружение задается до импорта модулей приложения
+os.environ.setdefault("APPLICATION_ENV", "TESTING")
+os.environ.setdefault("OPEN_ROUTER_API_KEY", "test")
+
+import asyncio
+from typing import Any, Dict, List, Tuple, Union
+import pytest
+from app.models.schemas import Agent, ChatMessage, ResponseFormat, ResponseFormatType
+
+
+def make_agent(agent_id: str, json_output: bool = False, **kwargs) -> Agent:
+    """Агент, которого FakeUpstream узнает по системному промпту (id агента)"""
+    response_format = ResponseFormat(type=ResponseFormatType.JSON) if json_output else None
+    return Agent(
+        id=agent_id,
+        name=agent_id,
+        description=agent_id,
+        system_prompt=agent_id,
+        model="test/model",
+        response_format=response_format,
+        created_at="",
+        **kwargs
+    )
+
+
+class FakeUpstream:
+    """
+    Подмена OpenRouter для тестов конвейеров
+
+    Ответ выбирается по системному промпту (id агента из make_agent): строка,
+    функция от последнего сообщения или исключение. delay - время всего ответа,
+    в потоковом режиме оно делится между фрагментами по chunk_size символов.
+    """
+
+    def __init__(self):
+        self.replies: Dict[str, Tuple[Union[str, Exception, Any], float]] = {}
+        self.calls: List[Dict[str, Any]] = []
+        self.cancelled: List[str] = []
+        self.chunk_size = 8
+
+    def reply(self, agent_id: str, reply: Any, delay: float = 0.0):
+        self.replies[agent_id] = (reply, delay)
+
+    def _resolve(self, messages: List[ChatMessage]) -> Tuple[str, Any, float]:
+        agent_id = messages[0].content.split("\n")[0]
+        reply, delay = self.replies[agent_id]
+        self.calls.append({"agent": agent_id, "input": messages[-1].content})
+        if callable(reply):
+            reply = reply(messages[-1].content)
+        return agent_id, reply, delay
+
+    async def chat_completion(self, messages: List[ChatMessage], model: str = None, **kwargs) -> Dict[str, Any]:
+        agent_id, reply, delay = self._resolve(messages)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(agent_id)
+            raise
+        if isinstance(reply, Exception):
+            raise reply
+        return {"message": reply, "model": model, "usage": None, "finish_reason": "stop"}
+
+    async def chat_completion_stream(self, messages: List[ChatMessage], model: str = None, **kwargs):
+        agent_id, reply, delay = self._resolve(messages)
+        if isinstance(reply, Exception):
+            raise reply
+        chunks = [reply[i:i + self.chunk_size] for i in range(0, len(reply), self.chunk_size)] or [""]
+        try:
+            for chunk in chunks:
+                await asyncio.sleep(delay / len(chunks))
+                yield {"type": "token", "content": chunk}
+        except asyncio.CancelledError:
+            self.cancelled.append(agent_id)
+            raise
+        yield {"type": "done", "message": reply, "model": model, "usage": None, "finish_reason": "stop"}
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch) -> FakeUpstream:
+    from app.services.node_cache import node_output_cache
+    from app.services.openrouter import openrouter_service
+
+    upstream = FakeUpstream()
+    monkeypatch.setattr(openrouter_service, "chat_completion", upstream.chat_completion)
+    monkeypatch.setattr(openrouter_service, "chat_completion_stream", upstream.chat_completion_stream)
+    # Кеш выводов узлов не должен переносить ответы между тестами
+    monkeypatch.setattr(node_output_cache, "enabled", False)
+    return upstream
@@ -0,0 +1,97 @@
+import pytest
+from app.models.schemas import ChatMessage, MessageRole
+from app.services.context_window import ContextWindowManager, message_tokens
+
+SYSTEM = ChatMessage(role=MessageRole.SYSTEM, content="You are a helpful assistant.")
+LATEST = ChatMessage(role=MessageRole.USER, content="latest question")
+
+
+def history(count: int, words: int = 20):
+    return [
+        ChatMessage(
+            role=MessageRole.USER if index % 2 == 0 else MessageRole.ASSISTANT,
+            content=f"message {index} " + "word " * words,
+        )
+        for index in range(count)
+    ]
+
+
+def manager(context_length: int = 1000, enabled: bool = True) -> ContextWindowManager:
+    # Модели test/model нет в каталоге: используется default_context_length
+    return ContextWindowManager(enabled=enabled, default_context_length=context_length, safety_margin=0.0)
+
+
+def fit(window: ContextWindowManager, messages, max_tokens: int = 100, **kwargs):
+    return window.fit(system=SYSTEM, history=messages, latest=LATEST, model="test/model", max_tokens=max_tokens, **kwargs)
+
+
+def test_budget_is_context_minus_margin_and_answer():
+    window = ContextWindowManager(enabled=True, default_context_length=1000, safety_margin=0.1)
+    assert window.prompt_budget("test/model", 200) == 700
+    assert window.prompt_budget("test/model", None) == 900
+
+
+def test_everything_fits_unchanged():
+    window = manager()
+    messages = history(4)
+    assert fit(window, messages) == [SYSTEM] + messages + [LATEST]
+    assert window.stats() == {"trimmed_requests": 0, "trimmed_messages": 0, "overflow_requests": 0}
+
+
+def test_oldest_history_is_dropped_first():
+    window = manager(context_length=600)
+    messages = history(20)
+    result = fit(window, messages)
+
+    assert result[0] == SYSTEM and result[-1] == LATEST
+    kept = result[1:-1]
+    assert 0 < len(kept) < len(messages)
+    assert kept == messages[-len(kept):]
+    assert sum(map(message_tokens, result)) <= window.prompt_budget("test/model", 100)
+    assert window.trimmed_requests == 1
+    assert window.trimmed_messages == len(messages) - len(kept)
+
+
+def test_kept_history_never_starts_with_assistant_turn():
+    messages = history(20)
+    # Бюджет ровно на три последних сообщения: первым оказался бы ответ ассистента (17)
+    fixed = message_tokens(SYSTEM) + message_tokens(LATEST)
+    window = manager(context_length=fixed + sum(map(message_tokens, messages[-3:])) + 100)
+    kept = fit(window, messages)[1:-1]
+
+    assert messages[-3].role == MessageRole.ASSISTANT
+    assert kept == messages[-2:]
+    assert kept[0].role == MessageRole.USER
+    assert window.trimmed_messages == 18
+
+
+def test_whole_history_may_start_with_assistant():
+    window = manager(context_length=100000)
+    messages = history(5)[1:]
+    assert fit(window, messages)[1:-1] == messages
+
+
+def test_overflow_keeps_system_and_latest_only():
+    window = manager(context_length=150)
+    huge_system = ChatMessage(role=MessageRole.SYSTEM, content="rule " * 200)
+    messages = history(4)
+    result = window.fit(system=huge_system, history=messages, latest=LATEST, model="test/model", max_tokens=100)
+
+    assert result == [huge_system, LATEST]
+    assert window.overflow_requests == 1
+    assert window.trimmed_messages == len(messages)
+
+
+def test_summary_is_part_of_fixed_head():
+    window = manager(context_length=600)
+    summary = ChatMessage(role=MessageRole.SYSTEM, content="Summary: " + "fact " * 30)
+    result = fit(window, history(20), summary=summary)
+    assert result[:2] == [SYSTEM, summary]
+    assert result[-1] == LATEST
+
+
+@pytest.mark.parametrize("enabled, messages", [(False, history(50)), (True, [])])
+def test_disabled_or_empty_history_is_not_trimmed(enabled, messages):
+    window = manager(context_length=100, enabled=enabled)
+    assert fit(window, messages) == [SYSTEM] + messages + [LATEST]
+    assert window.trimmed_requests == 0
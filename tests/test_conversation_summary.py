@@ -0,0 +1,83 @@
+import pytest
+from app.models.schemas import ChatMessage, Conversation, MessageRole
+from app.services.agent import agent_service
+from app.services.context_window import context_window
+from app.services.conversation_summary import ConversationSummarizer, messages_hash
+from tests.conftest import make_agent
+
+
+def turns(count: int, words: int = 5):
+    messages = []
+    for index in range(count):
+        role = MessageRole.USER if index % 2 == 0 else MessageRole.ASSISTANT
+        messages.append(ChatMessage(role=role, content=f"message {index} " + "word " * words))
+    return messages
+
+
+def summarized_conversation(messages, summary_upto: int) -> Conversation:
+    return Conversation(
+        id="conversation",
+        messages=messages,
+        summary="user wants a REST API in Go",
+        summary_upto=summary_upto,
+        summary_hash=messages_hash(messages[:summary_upto]),
+        created_at="",
+        updated_at="",
+    )
+
+
+def summarizer() -> ConversationSummarizer:
+    return ConversationSummarizer(enabled=False, trigger_tokens=1000, keep_recent_messages=4, model="test/model", max_tokens=100)
+
+
+def test_valid_summary_replaces_covered_messages():
+    messages = turns(10)
+    summary, history = summarizer().build_history(summarized_conversation(messages, summary_upto=6))
+    assert summary.role == MessageRole.SYSTEM
+    assert "user wants a REST API in Go" in summary.content
+    assert history == messages[6:]
+
+
+def test_summary_goes_stale_after_message_edit():
+    messages = turns(10)
+    conversation = summarized_conversation(messages, summary_upto=6)
+    edited = list(messages)
+    edited[2] = ChatMessage(role=edited[2].role, content="edited content")
+    conversation = conversation.model_copy(update={"messages": edited})
+
+    service = summarizer()
+    summary, history = service.build_history(conversation)
+    assert summary is None
+    assert history == edited
+    assert service.stale_summaries == 1
+
+
+def test_summary_survives_context_trimming(monkeypatch):
+    monkeypatch.setattr(context_window, "enabled", True)
+    monkeypatch.setattr(context_window, "default_context_length", 2000)
+    monkeypatch.setattr(context_window, "safety_margin", 0.0)
+    messages = turns(30, words=60)
+    summary, history = summarizer().build_history(summarized_conversation(messages, summary_upto=4))
+    agent = make_agent("assistant", max_tokens=500)
+
+    prepared = agent_service.prepare_messages_for_agent(
+        agent=agent,
+        user_message="latest question",
+        conversation_history=history,
+        summary=summary
+    )
+
+    # Системный промпт и сводка - неизменяемая часть, обрезаются только старые сообщения
+    assert prepared[0].content == "assistant"
+    assert prepared[1] == summary
+    assert prepared[-1].content == "latest question"
+    kept = prepared[2:-1]
+    assert 0 < len(kept) < len(history)
+    assert kept == history[-len(kept):]
+
+
+@pytest.mark.parametrize("summary_upto", [None, 0])
+def test_missing_summary_uses_full_history(summary_upto):
+    messages = turns(4)
+    conversation = Conversation(id="c", messages=messages, summary_upto=summary_upto, created_at="", updated_at="")
+    assert summarizer().build_history(conversation) == (None, messages)
@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import pytest
+from app.models.schemas import ChatRequest, JobStatus
+from app.services import jobs
+from app.services.jobs import JobManager, JobQueueFullError
+from app.services.resilience import UpstreamError
+
+
+class FakeChat:
+    """Подмена chat_service.complete: ответ, ошибка или долгий запрос"""
+
+    def __init__(self):
+        self.delay = 0.0
+        self.error = None
+        self.calls = []
+        self.cancelled = 0
+
+    async def complete(self, db, request: ChatRequest):
+        self.calls.append(request.message)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return {"message": f"echo {request.message}"}
+
+
+@pytest.fixture
+def fake_chat(monkeypatch) -> FakeChat:
+    chat = FakeChat()
+    monkeypatch.setattr(jobs.chat_service, "complete", chat.complete)
+    monkeypatch.setattr(jobs, "AsyncSessionLocal", contextlib.nullcontext)
+    return chat
+
+
+def manager(**kwargs) -> JobManager:
+    options = {"workers": 1, "max_queue": 10, "ttl_seconds": 60, "cleanup_interval": 60, **kwargs}
+    return JobManager(**options)
+
+
+async def wait_for_status(job, status: JobStatus):
+    for _ in range(100):
+        if job.status == status:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job is {job.status}, expected {status}")
+
+
+def test_job_runs_and_stores_result(fake_chat):
+    async def scenario():
+        jobs_ = manager()
+        await jobs_.start()
+        try:
+            job = jobs_.submit(ChatRequest(message="hi"))
+            assert job.status == JobStatus.QUEUED
+            await jobs_.wait(job, timeout=1)
+            return job, jobs_.stats()
+        finally:
+            await jobs_.stop()
+
+    job, stats = asyncio.run(scenario())
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.status_code == 200
+    assert job.result == {"message": "echo hi"}
+    assert stats["jobs"]["succeeded"] == 1
+
+
+def test_failed_job_keeps_error_and_status_code(fake_chat):
+    fake_chat.error = UpstreamError("rate limited", status_code=429)
+
+    async def scenario():
+        jobs_ = manager()
+        await jobs_.start()
+        try:
+            job = jobs_.submit(ChatRequest(message="hi"))
+            return await jobs_.wait(job, timeout=1)
+        finally:
+            await jobs_.stop()
+
+    job = asyncio.run(scenario())
+    assert job.status == JobStatus.FAILED
+    assert job.status_code == 429
+    assert job.error == "rate limited"
+
+
+def test_full_queue_rejects_submit(fake_chat):
+    async def scenario():
+        jobs_ = manager(max_queue=1)
+        jobs_.submit(ChatRequest(message="first"))
+        with pytest.raises(JobQueueFullError):
+            jobs_.submit(ChatRequest(message="second"))
+        return jobs_.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queue_size"] == 1
+    assert stats["jobs"]["queued"] == 1
+
+
+def test_cancel_queued_job_is_skipped_by_worker(fake_chat):
+    async def scenario():
+        jobs_ = manager()
+        job = jobs_.submit(ChatRequest(message="hi"))
+        assert jobs_.cancel(job)
+        await jobs_.start()
+        try:
+            await jobs_._queue.join()
+        finally:
+            await jobs_.stop()
+        return job, jobs_.cancel(job)
+
+    job, cancelled_again = asyncio.run(scenario())
+    assert job.status == JobStatus.CANCELLED
+    assert not cancelled_again
+    assert fake_chat.calls == []
+
+
+def test_cancel_running_job(fake_chat):
+    fake_chat.delay = 10
+
+    async def scenario():
+        jobs_ = manager()
+        await jobs_.start()
+        try:
+            job = jobs_.submit(ChatRequest(message="hi"))
+            await wait_for_status(job, JobStatus.RUNNING)
+            assert jobs_.cancel(job)
+            await jobs_.wait(job, timeout=1)
+            return job
+        finally:
+            await jobs_.stop()
+
+    job = asyncio.run(scenario())
+    assert job.status == JobStatus.CANCELLED
+    assert job.finished_at is not None
+    assert fake_chat.cancelled == 1
+
+
+def test_finished_jobs_expire_after_ttl(fake_chat):
+    async def scenario():
+        jobs_ = manager(ttl_seconds=0.05, cleanup_interval=0.02)
+        finished = jobs_.submit(ChatRequest(message="done"))
+        finished.finish(JobStatus.SUCCEEDED)
+        # Выполняющаяся задача не удаляется, сколько бы она ни шла
+        fake_chat.delay = 10
+        running = jobs_.submit(ChatRequest(message="running"))
+        await jobs_.start()
+        await asyncio.sleep(0.2)
+        try:
+            assert running.status == JobStatus.RUNNING
+            return jobs_.get(finished.id), jobs_.get(running.id), jobs_.expired
+        finally:
+            await jobs_.stop()
+
+    finished, running, expired = asyncio.run(scenario())
+    assert finished is None
+    assert running is not None
+    assert expired == 1
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+import pytest
+from app.models.schemas import Pipeline
+from app.services.partial_json import PartialJSONParser
+from app.services.pipeline import PipelineError, PipelineExecutor, required_fields
+from tests.conftest import make_agent
+
+DOCUMENT = {
+    "text": "quote \" backslash \\ brace } bracket ] comma , colon :",
+    "nested": {"list": [1, {"deep": [True, None]}, "a,b"], "empty": {}},
+    "empty_list": [],
+    "none": None,
+    "number": -1.5e3,
+    "unicode": "привет ☺",
+}
+
+
+def test_fields_are_reported_when_completed():
+    parser = PartialJSONParser()
+    assert parser.feed('{"a": 1, "b"') == {"a": 1}
+    assert parser.feed(': "x", "c": [1, ') == {"b": "x"}
+    assert not parser.complete
+    assert parser.feed("2]}") == {"c": [1, 2]}
+    assert parser.complete
+    assert parser.fields == {"a": 1, "b": "x", "c": [1, 2]}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_escaped_and_nested_values_in_any_chunking(chunk_size):
+    text = json.dumps(DOCUMENT, ensure_ascii=False, indent=2)
+    parser = PartialJSONParser()
+    completed = {}
+    for i in range(0, len(text), chunk_size):
+        completed.update(parser.feed(text[i:i + chunk_size]))
+    assert parser.complete
+    assert completed == DOCUMENT
+    assert parser.fields == DOCUMENT
+
+
+def test_escaped_quote_does_not_end_string_early():
+    parser = PartialJSONParser()
+    assert parser.feed('{"text": "say \\"hi\\", ') == {}
+    assert parser.feed('then go", "next": 1}') == {"text": 'say "hi", then go', "next": 1}
+
+
+def test_nested_commas_do_not_complete_field():
+    parser = PartialJSONParser()
+    assert parser.feed('{"obj": {"a": 1, "b": [2, 3], ') == {}
+    assert parser.feed('"c": 4}, ') == {"obj": {"a": 1, "b": [2, 3], "c": 4}}
+
+
+def test_text_around_root_object_is_ignored():
+    parser = PartialJSONParser()
+    completed = parser.feed('Here is "the" answer:\n```json\n{"a": 1}\n```\n{"b": 2}')
+    assert completed == {"a": 1}
+    assert parser.complete
+    assert parser.fields == {"a": 1}
+
+
+def test_invalid_value_is_skipped():
+    parser = PartialJSONParser()
+    assert parser.feed('{"bad": tru, "null": null, "good": 1}') == {"null": None, "good": 1}
+
+
+def test_required_fields_from_input_template():
+    graph = Pipeline(nodes=[
+        {"id": "a", "agent_id": "a"},
+        {"id": "b", "agent_id": "b"},
+        {"id": "c", "agent_id": "c", "depends_on": ["a", "b"], "input": "{{message}} {{a.x}} {{a.y}} {{b}}"},
+        {"id": "d", "agent_id": "d", "depends_on": ["c"], "input": "{{message}}"},
+    ], output="d")
+    nodes = {node.id: node for node in graph.nodes}
+    assert required_fields(nodes["c"]) == {"a": {"x", "y"}, "b": None}
+    # Зависимость без ссылок только задает порядок
+    assert required_fields(nodes["d"]) == {"c": None}
+
+
+def pipelined_executor(*agents) -> PipelineExecutor:
+    executor = PipelineExecutor(node_timeout=5)
+
+    async def load_agents(db, graph):
+        return {agent.id: agent for agent in agents}
+
+    executor._load_agents = load_agents
+    return executor
+
+
+def producer_consumer(input_template: str) -> Pipeline:
+    return Pipeline(pipelined=True, nodes=[
+        {"id": "producer", "agent_id": "producer"},
+        {"id": "consumer", "agent_id": "consumer", "depends_on": ["producer"], "input": input_template},
+    ])
+
+
+def test_dependent_node_starts_on_partial_output(fake_upstream):
+    reply = json.dumps({"key": "early value", "rest": "x" * 200})
+    fake_upstream.reply("producer", reply, delay=0.4)
+    fake_upstream.reply("consumer", lambda message: f"got {message}", delay=0.3)
+    executor = pipelined_executor(make_agent("producer", json_output=True), make_agent("consumer"))
+
+    started = time.monotonic()
+    result = asyncio.run(executor.run(db=None, pipeline=producer_consumer("{{producer.key}}"), user_message="task"))
+    elapsed = time.monotonic() - started
+
+    assert result["message"] == "got early value"
+    steps = {step["node"]: step for step in result["orchestration_steps"]}
+    assert steps["consumer"]["early_start"] is True
+    assert steps["producer"]["early_start"] is False
+    # Последовательно было бы 0.7 с
+    assert elapsed < 0.6
+
+
+def test_missing_field_falls_back_to_full_output(fake_upstream):
+    fake_upstream.reply("producer", json.dumps({"other": 1}))
+    fake_upstream.reply("consumer", "unused")
+    executor = pipelined_executor(make_agent("producer", json_output=True), make_agent("consumer"))
+
+    with pytest.raises(PipelineError, match="'producer' has no field 'key'"):
+        asyncio.run(executor.run(db=None, pipeline=producer_consumer("{{producer.key}}"), user_message="task"))
+    assert [call["agent"] for call in fake_upstream.calls] == ["producer"]
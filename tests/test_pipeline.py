@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+import pytest
+from pydantic import ValidationError
+from app.models.schemas import Pipeline
+from app.services.pipeline import PipelineError, PipelineExecutor
+from app.services.resilience import UpstreamError
+from tests.conftest import make_agent
+
+
+def pipeline(*nodes, **kwargs) -> Pipeline:
+    return Pipeline(nodes=list(nodes), **kwargs)
+
+
+def node(node_id: str, *depends_on: str, **kwargs) -> dict:
+    return {"id": node_id, "agent_id": kwargs.pop("agent_id", node_id), "depends_on": list(depends_on), **kwargs}
+
+
+@pytest.mark.parametrize("nodes, kwargs, message", [
+    ([], {}, "no nodes"),
+    ([node("a"), node("a")], {}, "must be unique"),
+    ([node("message")], {}, "reserved"),
+    ([node("a", "missing")], {}, "unknown nodes: missing"),
+    ([node("a"), node("b", input="{{a.answer}}")], {}, "not in depends_on"),
+    ([node("a", "c"), node("b", "a"), node("c", "b")], {}, "cycle"),
+    ([node("a"), node("b")], {}, "several final nodes"),
+    ([node("a")], {"output": "b"}, "output node 'b' not found"),
+])
+def test_invalid_graphs_are_rejected(nodes, kwargs, message):
+    with pytest.raises(ValidationError, match=message):
+        pipeline(*nodes, **kwargs)
+
+
+def test_levels_and_output_node():
+    graph = pipeline(node("a"), node("b"), node("merge", "a", "b"), node("extra", "a"), output="merge")
+    assert [[n.id for n in level] for level in graph.levels()] == [["a", "b"], ["merge", "extra"]]
+    assert graph.output_node().id == "merge"
+    assert pipeline(node("a"), node("b", "a")).output_node().id == "b"
+
+
+def executor_for(*agents) -> PipelineExecutor:
+    executor = PipelineExecutor(node_timeout=5)
+
+    async def load_agents(db, graph):
+        return {agent.id: agent for agent in agents}
+
+    executor._load_agents = load_agents
+    return executor
+
+
+def test_independent_nodes_run_in_parallel(fake_upstream):
+    fake_upstream.reply("a", "A", delay=0.2)
+    fake_upstream.reply("b", "B", delay=0.2)
+    fake_upstream.reply("merge", lambda message: f"merged: {message}")
+    executor = executor_for(make_agent("a"), make_agent("b"), make_agent("merge"))
+    graph = pipeline(node("a"), node("b"), node("merge", "a", "b", input="{{message}} | {{a}} + {{b}}"))
+
+    started = time.monotonic()
+    result = asyncio.run(executor.run(db=None, pipeline=graph, user_message="task"))
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.35
+    assert result["message"] == "merged: task | A + B"
+    assert [step["node"] for step in result["orchestration_steps"]] == ["a", "b", "merge"]
+    assert result["model"] == "test/model + test/model + test/model"
+    assert set(result["usage"]) == {"a", "b", "merge"}
+
+
+def test_field_references_render_json_outputs(fake_upstream):
+    fake_upstream.reply("solver", json.dumps({"answer": 42, "notes": {"unit": "m"}}))
+    fake_upstream.reply("writer", lambda message: message)
+    executor = executor_for(make_agent("solver", json_output=True), make_agent("writer"))
+    graph = pipeline(node("solver"), node("writer", "solver", input="{{solver.answer}} / {{solver.notes}}"))
+
+    result = asyncio.run(executor.run(db=None, pipeline=graph, user_message="task"))
+    assert result["message"] == '42 / {\n  "unit": "m"\n}'
+
+
+def test_first_failure_cancels_running_nodes(fake_upstream):
+    fake_upstream.reply("fails", RuntimeError("boom"), delay=0.01)
+    fake_upstream.reply("slow", "never", delay=10)
+    fake_upstream.reply("after", "never")
+    executor = executor_for(make_agent("fails"), make_agent("slow"), make_agent("after"))
+    graph = pipeline(node("fails"), node("slow"), node("after", "fails", "slow"))
+
+    started = time.monotonic()
+    with pytest.raises(PipelineError, match="Orchestration failed: boom"):
+        asyncio.run(executor.run(db=None, pipeline=graph, user_message="task"))
+
+    assert time.monotonic() - started < 1
+    assert fake_upstream.cancelled == ["slow"]
+    assert "after" not in [call["agent"] for call in fake_upstream.calls]
+
+
+def test_upstream_errors_are_not_wrapped(fake_upstream):
+    fake_upstream.reply("a", UpstreamError("rate limited", status_code=429))
+    executor = executor_for(make_agent("a"))
+
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(executor.run(db=None, pipeline=pipeline(node("a")), user_message="task"))
+    assert not isinstance(error.value, PipelineError)
+    assert error.value.status_code == 429
+
+
+def test_node_timeout(fake_upstream):
+    fake_upstream.reply("slow", "late", delay=10)
+    executor = executor_for(make_agent("slow"))
+    graph = pipeline(node("slow", timeout=0.05))
+
+    with pytest.raises(PipelineError, match="Node 'slow' timed out after 0.05s"):
+        asyncio.run(executor.run(db=None, pipeline=graph, user_message="task"))
+
+
+def test_invalid_json_from_json_agent_fails_node(fake_upstream):
+    fake_upstream.reply("solver", "not json at all")
+    executor = executor_for(make_agent("solver", json_output=True))
+
+    with pytest.raises(PipelineError, match="solver returned invalid JSON"):
+        asyncio.run(executor.run(db=None, pipeline=pipeline(node("solver")), user_message="task"))
+
+
+def test_run_stream_emits_step_events(fake_upstream):
+    fake_upstream.reply("a", "first answer")
+    fake_upstream.reply("b", "second answer")
+    executor = executor_for(make_agent("a"), make_agent("b"))
+    graph = pipeline(node("a"), node("b", "a"))
+
+    async def collect():
+        return [event async for event in executor.run_stream(db=None, pipeline=graph, user_message="task")]
+
+    events = asyncio.run(collect())
+    types = [event["type"] for event in events]
+    assert types[0] == "step_started" and types[-1] == "done"
+    assert types.count("orchestration_step") == 2
+    tokens = "".join(event["content"] for event in events if event["type"] == "step_token" and event["node"] == "a")
+    assert tokens == "first answer"
+    assert events[-1]["message"] == "second answer"
@@ -0,0 +1,108 @@
+import asyncio
+import time
+import pytest
+from app.services import rate_limiter
+from app.services.rate_limiter import ModelRateLimiter, RateLimitQueueFullError, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Только для синхронных тестов: event loop тоже использует time.monotonic
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def drained_limiter(requests_per_minute: float, max_queue: int = 10, max_wait: float = 10) -> ModelRateLimiter:
+    limiter = ModelRateLimiter(requests_per_minute, 0, max_queue=max_queue, max_wait=max_wait)
+    limiter.requests.consume(requests_per_minute)
+    return limiter
+
+
+def test_bucket_refills_evenly_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.time_until_available(1) == 0
+
+    bucket.consume(60)
+    assert bucket.time_until_available(1) == pytest.approx(1.0)
+
+    clock[0] += 0.5
+    assert bucket.time_until_available(1) == pytest.approx(0.5)
+
+    clock[0] += 600
+    bucket.consume(0)
+    assert bucket.tokens == 60
+    # Запрос больше емкости ждет только полного ведра, а не вечно
+    assert bucket.time_until_available(1000) == 0
+
+
+def test_bucket_block_and_provider_sync(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.block_for(5)
+    assert bucket.time_until_available(1) == pytest.approx(5)
+
+    bucket = TokenBucket(per_minute=60)
+    bucket.sync(remaining=0, reset_after=3)
+    assert bucket.tokens == 0
+    assert bucket.time_until_available(1) == pytest.approx(3)
+
+
+def test_acquire_waits_for_refill():
+    async def scenario():
+        limiter = drained_limiter(requests_per_minute=600)
+        started = time.monotonic()
+        await limiter.acquire(0)
+        return limiter, time.monotonic() - started
+
+    limiter, elapsed = asyncio.run(scenario())
+    assert 0.05 <= elapsed < 1
+    assert limiter.waited >= 1
+
+
+def test_waiters_are_served_in_fifo_order():
+    async def scenario():
+        limiter = drained_limiter(requests_per_minute=600)
+        order = []
+
+        async def request(index: int):
+            await limiter.acquire(0)
+            order.append(index)
+
+        tasks = []
+        for index in range(3):
+            tasks.append(asyncio.create_task(request(index)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        limiter = drained_limiter(requests_per_minute=600, max_queue=1)
+        first = asyncio.create_task(limiter.acquire(0))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitQueueFullError) as error:
+            await limiter.acquire(0)
+        await first
+        return limiter, error.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.retry_after is not None
+    assert limiter.rejected == 1
+    assert limiter.waiting == 0
+
+
+def test_wait_longer_than_max_wait_is_rejected():
+    async def scenario():
+        limiter = drained_limiter(requests_per_minute=60, max_wait=0.5)
+        with pytest.raises(RateLimitQueueFullError) as error:
+            await limiter.acquire(0)
+        return limiter, error.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.retry_after == pytest.approx(1.0, abs=0.1)
+    assert limiter.rejected == 1
+    assert limiter.waiting == 0
@@ -0,0 +1,142 @@
+import asyncio
+import pytest
+from app.services import resilience
+from app.services.openrouter import OpenRouterService
+from app.services.resilience import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError, RetryBudget, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    # Успех сбрасывает счетчик ошибок подряд
+    breaker.before_call()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(30)
+    assert error.value.http_status == 503
+    assert breaker.rejected == 1
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 31
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 31
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_probe_frees_half_open_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 31
+
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+
+
+def test_registry_availability_does_not_change_state(clock):
+    registry = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=30)
+    assert registry.is_available("model")
+
+    breaker = registry.get("model")
+    breaker.record_failure()
+    assert not registry.is_available("model")
+
+    clock.now += 31
+    assert registry.is_available("model")
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.exhausted == 1
+
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_spend()
+
+    for _ in range(10):
+        budget.record_request()
+    assert budget.tokens == 2
+
+
+def test_retry_policy_respects_retry_after():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=8, max_retry_after=30)
+    assert policy.get_delay(1, retry_after=5) == 5
+    assert policy.get_delay(1, retry_after=60) is None
+    for attempt in range(1, 10):
+        assert 0 <= policy.get_delay(attempt) <= min(8, 0.5 * 2 ** (attempt - 1))
+
+
+def test_open_breaker_rejects_before_rate_limit_queue():
+    service = OpenRouterService()
+    model = "nvidia/nemotron-nano-12b-v2-vl:free"
+    limiter = service.rate_limiter.get(model, service.client.api_key)
+    assert limiter is not None and limiter.requests is not None
+    breaker = service.breakers.get(model)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+
+    tokens_before = limiter.requests.tokens
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(service._call_with_retries(fn, model=model))
+    assert calls == 0
+    # Отклоненный breaker'ом запрос не занимает очередь и не тратит лимит
+    assert limiter.requests.tokens == pytest.approx(tokens_before, abs=0.1)
+    assert limiter.waiting == 0
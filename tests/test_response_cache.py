@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from app.models.schemas import ChatMessage, MessageRole
+from app.services import response_cache
+from app.services.openrouter import OpenRouterService
+from app.services.response_cache import ResponseCache
+
+
+def messages(*contents: str, role: MessageRole = MessageRole.USER):
+    return [ChatMessage(role=role, content=content) for content in contents]
+
+
+@pytest.fixture
+def service(monkeypatch) -> OpenRouterService:
+    """OpenRouterService, у которого вызов провайдера подменен счетчиком"""
+    service = OpenRouterService()
+    service.upstream_calls = 0
+
+    async def create_completion(params):
+        service.upstream_calls += 1
+        return {
+            "message": f"answer {service.upstream_calls}",
+            "model": params["model"],
+            "usage": None,
+            "finish_reason": "stop",
+        }
+
+    monkeypatch.setattr(service, "_create_completion", create_completion)
+    return service
+
+
+def key(service: OpenRouterService, chat, **params) -> str:
+    return service._request_key(service._build_params(chat, **{"model": "test/model", **params}))
+
+
+def test_make_key_ignores_field_order():
+    assert ResponseCache.make_key({"a": 1, "b": [1, 2]}) == ResponseCache.make_key({"b": [1, 2], "a": 1})
+    assert ResponseCache.make_key({"a": 1}) != ResponseCache.make_key({"a": 2})
+
+
+def test_request_key_distinguishes_prompts_and_params(service):
+    base = key(service, messages("what is 2+2?"), temperature=0, max_tokens=100)
+    variants = [
+        key(service, messages("what is 2+3?"), temperature=0, max_tokens=100),
+        key(service, messages("what is 2+2?", role=MessageRole.SYSTEM), temperature=0, max_tokens=100),
+        key(service, messages("earlier turn", "what is 2+2?"), temperature=0, max_tokens=100),
+        key(service, messages("what is 2+2?"), temperature=0.5, max_tokens=100),
+        key(service, messages("what is 2+2?"), temperature=0, max_tokens=200),
+        key(service, messages("what is 2+2?"), model="other/model", temperature=0, max_tokens=100),
+    ]
+    assert len({base, *variants}) == len(variants) + 1
+
+
+def test_request_key_normalizes_whitespace_and_ignores_headers(service):
+    chat = messages("what is 2+2?")
+    params = service._build_params(chat, model="test/model", temperature=0)
+    same = service._build_params(messages("  what is 2+2?\n"), model="test/model", temperature=0)
+    same["extra_headers"] = {"X-Title": "another site"}
+    assert service._request_key(params) == service._request_key(same)
+
+
+@pytest.mark.parametrize("temperature, cache, cached", [
+    (0, None, True),
+    (0.7, None, False),
+    (None, None, False),
+    (0.7, True, True),
+    (0, False, False),
+])
+def test_only_deterministic_requests_are_cached_by_default(service, temperature, cache, cached):
+    async def scenario():
+        for _ in range(2):
+            result = await service.chat_completion(
+                messages("hello"), model="test/model", temperature=temperature, cache=cache
+            )
+        return result
+
+    result = asyncio.run(scenario())
+    assert service.upstream_calls == (1 if cached else 2)
+    assert result["message"] == ("answer 1" if cached else "answer 2")
+
+
+def test_different_prompts_never_share_cached_answer(service):
+    async def scenario():
+        first = await service.chat_completion(messages("user A secret"), model="test/model", temperature=0)
+        second = await service.chat_completion(messages("user B question"), model="test/model", temperature=0)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert service.upstream_calls == 2
+    assert first["message"] != second["message"]
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(max_bytes=60, ttl_seconds=10)
+    cache.set("a", "x" * 20)
+    cache.set("b", "y" * 20)
+    assert cache.get("a") == "x" * 20
+
+    # "b" давно не использовалась - вытесняется первой
+    cache.set("c", "z" * 20)
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.evictions == 1
+
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+    cache.set("huge", "h" * 100)
+    assert "huge" not in cache
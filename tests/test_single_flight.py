@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4, "abandoned": 0}
+
+
+def test_errors_are_shared_by_all_waiters():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(flight.do("key", work), flight.do("key", work), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_waiter_detaches_without_cancelling_others():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(flight.do("key", work))
+        follower = asyncio.create_task(flight.do("key", work))
+        await started.wait()
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return flight, await follower
+
+    flight, result = asyncio.run(scenario())
+    assert result == "result"
+    assert flight.abandoned == 0
+
+
+def test_work_is_cancelled_when_all_waiters_leave():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+        await started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        in_flight = flight.stats()["in_flight"]
+
+        # Новый вызов с тем же ключом не ждет отмененную работу, а запускает новую
+        async def fresh():
+            return "fresh"
+
+        return flight, in_flight, await flight.do("key", fresh)
+
+    flight, in_flight, result = asyncio.run(scenario())
+    assert in_flight == 0
+    assert flight.abandoned == 1
+    assert result == "fresh"
+    assert flight.leaders == 2
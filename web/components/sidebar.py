@@ -1,4 +1,5 @@
 import streamlit as st
+from web.utils.init_session import reset_conversation
 
 def render_sidebar():
     """Render sidebar with navigation and settings"""
@@ -147,7 +148,7 @@ def render_sidebar():
     
     with col1:
         if st.button("🧹 Clear Chat", width="content", help="Delete all messages from current chat"):
-            st.session_state.messages = []
+            reset_conversation()
             st.rerun()
     
     with col2:
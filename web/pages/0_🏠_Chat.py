@@ -57,33 +57,6 @@ def format_token_info(usage, fallback_tokens=None):
     
     return None
 
-def prepare_conversation_history(messages, max_messages=50):
-    """Подготавливает историю разговора для отправки в API
-    
-    Args:
-        messages: список сообщений из st.session_state.messages
-        max_messages: максимальное количество сообщений для отправки
-        
-    Returns:
-        список ChatMessage для API
-    """
-    if not messages:
-        return []
-    
-    # Берем последние max_messages пар сообщений (user + assistant)
-    recent_messages = messages[-max_messages*2:] if len(messages) > max_messages*2 else messages
-    
-    history = []
-    for msg in recent_messages:
-        if msg["role"] in ["user", "assistant"]:
-            # Преобразуем в формат API
-            history.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-    
-    return history
-
 def render_chat_interface():
     """Render chat interface"""
     
@@ -248,6 +221,11 @@ def render_chat_interface():
                             status_icon = "✅" if metadata["format_valid"] else "❌"
                             st.write(f"**Format valid:** {status_icon}")
                         
+                        # Показываем голосование self-consistency если есть
+                        ensemble = metadata.get("ensemble")
+                        if ensemble:
+                            st.write(f"**Agreement:** {ensemble['votes']}/{ensemble['completed']} ({ensemble['agreement']:.0%}) of {ensemble['samples']} samples")
+                        
                         # Показываем информацию об ошибке если есть
                         if metadata.get("error"):
                             st.error("⚠️ Response contains error")
@@ -311,21 +289,55 @@ except Exception as e:
 with st.sidebar:
     render_sidebar()
 
+def stream_orchestration(request_data):
+    """Выполняет оркестрацию в потоковом режиме, показывая каждый узел по ходу выполнения"""
+    statuses = {}
+    outputs = {}
+    texts = {}
+    for event in st.session_state.api_client.stream_chat_message(request_data):
+        data = event["data"]
+        if event["event"] == "step_started":
+            statuses[data["node"]] = st.status(f"Step {data['step']}: {data['node']} ({data['agent']})", expanded=False)
+            with statuses[data["node"]]:
+                outputs[data["node"]] = st.empty()
+            texts[data["node"]] = ""
+        elif event["event"] == "step_token":
+            if data["node"] in outputs:
+                texts[data["node"]] += data["content"]
+                outputs[data["node"]].code(texts[data["node"]], language=None)
+        elif event["event"] == "orchestration_step":
+            step = data["step"]
+            status = statuses.get(step["node"])
+            if status is not None:
+                outputs[step["node"]].empty()
+                with status:
+                    if isinstance(step["output"], (dict, list)):
+                        st.json(step["output"])
+                    else:
+                        st.markdown(step["output"])
+                timing = "cached" if step.get("cached") else f"{step['duration']:.1f}s"
+                status.update(label=f"Step {step['step']}: {step['node']} ({step['agent']}) - {timing}", state="complete")
+        elif event["event"] == "error":
+            for status in statuses.values():
+                status.update(state="error")
+            raise Exception(data.get("detail"))
+        elif event["event"] == "done":
+            return data
+    raise Exception("Stream ended without a response")
+
 def render_single_response(prompt):
     """Render single response for normal mode"""
     message_placeholder = st.empty()
     
     try:
         with st.spinner("🤔 Agent is thinking..."):
-            # Prepare request
-            conversation_history = prepare_conversation_history(st.session_state.messages[:-1])  # Исключаем текущее сообщение
-            
+            # История диалога хранится на сервере: отправляем только новое сообщение
             request_data = {
                 "message": prompt,
                 "agent_id": st.session_state.current_agent,
                 "temperature": st.session_state.temperature,
                 "max_tokens": st.session_state.max_tokens,
-                "conversation_history": conversation_history
+                "conversation_id": st.session_state.conversation_id
             }
             
             # Add custom model if selected
@@ -334,7 +346,15 @@ def render_single_response(prompt):
             
             # Send request to API
             print("Sending chat request:", request_data)
-            response = st.session_state.api_client.send_chat_message(request_data=request_data)
+            agent_info = next(
+                (agent for agent in st.session_state.agents_list if agent["id"] == st.session_state.current_agent),
+                {}
+            )
+            if agent_info.get("pipeline"):
+                # Шаги оркестрации показываем по мере выполнения узлов
+                response = stream_orchestration(request_data)
+            else:
+                response = st.session_state.api_client.send_chat_message(request_data=request_data)
             
             # Display response
             response_content = response.get("message", response.get("response", "No response received"))
@@ -366,6 +386,7 @@ def render_single_response(prompt):
                     "input_tokens": response.get("usage", {}).get("prompt_tokens"),
                     "output_tokens": response.get("usage", {}).get("completion_tokens"),
                     "format_valid": response.get("format_valid"),
+                    "ensemble": response.get("ensemble"),
                     "timestamp": response.get("timestamp")
                 }
             }
@@ -429,46 +450,46 @@ def render_temperature_comparison(prompt):
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    responses = []
+    # Все температуры выполняются на сервере параллельно, результаты приходят по мере готовности
+    responses = [None] * len(temperatures)
+    status_text.text(f"🤔 Getting responses for temperatures {', '.join(map(str, temperatures))}...")
     
-    # Send requests for each temperature
-    for i, temp in enumerate(temperatures):
-        status_text.text(f"🤔 Getting response for temperature {temp}...")
+    try:
+        # Сервер подставляет историю диалога; варианты сравнения в диалог не сохраняются
+        request_data = {
+            "message": prompt,
+            "agent_id": st.session_state.current_agent,
+            "max_tokens": st.session_state.max_tokens,
+            "conversation_id": st.session_state.conversation_id
+        }
         
-        try:
-            # Prepare request
-            conversation_history = prepare_conversation_history(st.session_state.messages[:-1])  # Исключаем текущее сообщение
-            
-            request_data = {
-                "message": prompt,
-                "agent_id": st.session_state.current_agent,
-                "temperature": temp,
-                "max_tokens": st.session_state.max_tokens,
-                "conversation_history": conversation_history
-            }
-            
-            # Add custom model if selected
-            if st.session_state.selected_model:
-                request_data["model"] = st.session_state.selected_model
-            
-            # Send request to API
-            response = st.session_state.api_client.send_chat_message(request_data=request_data)
-            
-            responses.append({
-                "temperature": temp,
-                "response": response,
-                "success": True
-            })
-            
-        except Exception as e:
-            responses.append({
-                "temperature": temp,
-                "response": {"message": f"❌ Error: {e}"},
-                "success": False
-            })
+        # Add custom model if selected
+        if st.session_state.selected_model:
+            request_data["model"] = st.session_state.selected_model
         
-        # Update progress
-        progress_bar.progress((i + 1) / len(temperatures))
+        variants = [{"temperature": temp} for temp in temperatures]
+        completed = 0
+        for item in st.session_state.api_client.stream_chat_sweep(request_data, variants):
+            temp = temperatures[item["index"]]
+            if item.get("response"):
+                responses[item["index"]] = {"temperature": temp, "response": item["response"], "success": True}
+            else:
+                responses[item["index"]] = {
+                    "temperature": temp,
+                    "response": {"message": f"❌ Error: {item.get('error')}"},
+                    "success": False
+                }
+            completed += 1
+            progress_bar.progress(completed / len(temperatures))
+            status_text.text(f"✅ Temperature {temp} done ({completed}/{len(temperatures)})")
+    except Exception as e:
+        error = e
+    else:
+        error = "No response received"
+    
+    for i, temp in enumerate(temperatures):
+        if responses[i] is None:
+            responses[i] = {"temperature": temp, "response": {"message": f"❌ Error: {error}"}, "success": False}
     
     progress_bar.empty()
     status_text.empty()
@@ -196,7 +196,8 @@ def render_stats_page():
     with col2:
         if st.button("🧹 Сбросить статистику", width="content"):
             if st.button("⚠️ Подтвердить сброс", width="content"):
-                st.session_state.messages = []
+                from web.utils.init_session import reset_conversation
+                reset_conversation()
                 if 'session_start_time' in st.session_state:
                     del st.session_state.session_start_time
                 st.success("✅ Статистика сброшена")
@@ -215,8 +215,8 @@ Cache timeout: {config.cache_ttl_models}s (models)
         
         with col1:
             if st.button("🗑️ Clear chat history", type="secondary", width="content"):
-                if 'messages' in st.session_state:
-                    st.session_state.messages = []
+                from web.utils.init_session import reset_conversation
+                reset_conversation()
                 st.success("✅ Chat history cleared")
                 st.rerun()
         
@@ -1,5 +1,6 @@
 import httpx
-from typing import Dict, List, Any, Optional
+import json
+from typing import Dict, Iterator, List, Any, Optional
 import streamlit as st
 
 class APIClient:
@@ -70,22 +71,85 @@ class APIClient:
         temperature: float = None,
         max_tokens: int = None,
         model: str = None,
-        request_data: Dict[str, Any] = None
+        request_data: Dict[str, Any] = None,
+        conversation_id: str = None
     ) -> Dict[str, Any]:
-        """Отправка сообщения в чат"""
+        """Отправка сообщения в чат (с conversation_id история хранится на сервере)"""
         if request_data is None:
             request_data = {
                 "message": message,
                 "agent_id": agent_id,
                 "temperature": temperature,
                 "max_tokens": max_tokens,
-                "model": model
+                "model": model,
+                "conversation_id": conversation_id
             }
             # Удаляем None значения
             request_data = {k: v for k, v in request_data.items() if v is not None}
         
         return self._make_request("POST", "/chat", json=request_data)
     
+    def stream_chat_message(self, request_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Потоковый ответ агента (Server-Sent Events)
+
+        Отдает события {"event": ..., "data": {...}}: token, step_started, step_token,
+        orchestration_step, done (data - полный ответ) и error.
+        """
+        url = f"{self.api_base_url}/chat/stream"
+        try:
+            with httpx.Client(timeout=self.timeout) as client:
+                with client.stream("POST", url, json=request_data) as response:
+                    if response.is_error:
+                        response.read()
+                    response.raise_for_status()
+                    event_type, data_lines = "message", []
+                    for line in response.iter_lines():
+                        if line.startswith("event:"):
+                            event_type = line[len("event:"):].strip()
+                        elif line.startswith("data:"):
+                            data_lines.append(line[len("data:"):].strip())
+                        elif not line and data_lines:
+                            yield {"event": event_type, "data": json.loads("\n".join(data_lines))}
+                            event_type, data_lines = "message", []
+        except httpx.HTTPError as e:
+            raise Exception(f"HTTP ошибка: {e}")
+    
+    def send_chat_batch(self, requests: List[Dict[str, Any]], concurrency: int = None) -> List[Dict[str, Any]]:
+        """Отправка пакета сообщений; результаты (response или error) в порядке запросов"""
+        request_data = {"requests": requests}
+        if concurrency is not None:
+            request_data["concurrency"] = concurrency
+        return self._make_request("POST", "/chat/batch", json=request_data)["results"]
+    
+    def stream_chat_sweep(
+        self,
+        request_data: Dict[str, Any],
+        variants: List[Dict[str, Any]],
+        concurrency: int = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Одно сообщение с несколькими наборами параметров (temperature, model, max_tokens)
+
+        Варианты выполняются на сервере параллельно; результаты (index, variant,
+        response или error) отдаются по мере готовности.
+        """
+        payload = {**request_data, "variants": variants, "stream": True}
+        if concurrency is not None:
+            payload["concurrency"] = concurrency
+        url = f"{self.api_base_url}/chat/sweep"
+        try:
+            with httpx.Client(timeout=self.timeout) as client:
+                with client.stream("POST", url, json=payload) as response:
+                    if response.is_error:
+                        response.read()
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if line:
+                            yield json.loads(line)
+        except httpx.HTTPError as e:
+            raise Exception(f"HTTP ошибка: {e}")
+    
     def send_message(
         self,
         request_data: Dict[str, Any]
@@ -93,6 +157,10 @@ class APIClient:
         """Альтернативный метод для отправки сообщения (для обратной совместимости)"""
         return self.send_chat_message(request_data=request_data)
     
+    def delete_conversation(self, conversation_id: str) -> Dict[str, Any]:
+        """Удаление диалога, хранящегося на сервере"""
+        return self._make_request("DELETE", f"/conversations/{conversation_id}")
+    
     def get_models(self) -> List[Dict[str, Any]]:
         """Получение списка доступных моделей"""
         return self._make_request("GET", "/models")
@@ -1,3 +1,4 @@
+import uuid
 import streamlit as st
 from web.utils.api_client import APIClient
 from web.utils.config import WebConfig
@@ -11,6 +12,10 @@ def init_session_state():
     if 'current_agent' not in st.session_state:
         st.session_state.current_agent = "default"
     
+    # История диалога хранится на сервере, чат отправляет только новое сообщение и id диалога
+    if 'conversation_id' not in st.session_state:
+        st.session_state.conversation_id = str(uuid.uuid4())
+    
     if 'agents_list' not in st.session_state:
         st.session_state.agents_list = []
     
@@ -31,4 +36,17 @@ def init_session_state():
         st.session_state.current_page = "chat"
     
     if 'temperature_comparison_mode' not in st.session_state:
-        st.session_state.temperature_comparison_mode = False
\ No newline at end of file
+        st.session_state.temperature_comparison_mode = False
+
+
+def reset_conversation():
+    """Очищает чат и начинает новый диалог (старый удаляется на сервере)"""
+    conversation_id = st.session_state.get('conversation_id')
+    if conversation_id and 'api_client' in st.session_state:
+        try:
+            st.session_state.api_client.delete_conversation(conversation_id)
+        except Exception:
+            # Диалог еще не создан на сервере (404) или сервер недоступен
+            pass
+    st.session_state.messages = []
+    st.session_state.conversation_id = str(uuid.uuid4())